@@ -7,22 +7,19 @@ Modified By: Mason Audet
 Date: 7/27/24
 
 NOTES:  This is an altered version of the original ensemble_boxes_wbf_3d.py
-	It has an additional dependency that must be downloaded in order for it to run properly
-		* The library being referenced is the BBox library and more specifically the BBox_3D class and jaccard_index_3d function
-		* Because of this, the original bb_intersection_over_union_3d function has been removed and replaced with a call to the jaccard_index_3d function
+	The original bb_intersection_over_union_3d function has been replaced with a rotated 3D IoU
+	(bird's eye view polygon clipping plus z-overlap) that reproduces the jaccard_index_3d function
+	from the BBox library.
+		* The IoU is computed in NumPy for one candidate against every cluster at once, so the
+		  BBox library (and its per-pair BBox3D construction) is no longer a dependency
 
 """
 
 
 import warnings
 import numpy as np
-from numba import jit
-from bbox import BBox3D
-from bbox.metrics import iou_3d, jaccard_index_3d
 
 
-#@jit(nopython=True) # Removed jit for testing
-
 def prefilter_boxes(boxes, scores, labels, weights, thr):
 
     """
@@ -101,39 +98,191 @@ def get_weighted_box(boxes, conf_type='avg'):
     return box
 
 
-def find_matching_box(boxes_list, new_box, match_iou):
+def boxes_to_bev_corners(boxes):
+    """
+    NOTES: Takes in an (N, 7) array of boxes in the form (x, y, z, l, w, h, r) and returns the
+           (N, 4, 2) bird's eye view corners in counterclockwise order. The corner order is the
+           same one the BBox3D class uses (back-left, front-left, front-right, back-right).
+    """
+
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 7)
+    template = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]])
+    local = template[None, :, :] * boxes[:, None, 3:5]
+    cosa = np.cos(boxes[:, 6])[:, None]
+    sina = np.sin(boxes[:, 6])[:, None]
+    x = local[:, :, 0] * cosa - local[:, :, 1] * sina + boxes[:, 0:1]
+    y = local[:, :, 0] * sina + local[:, :, 1] * cosa + boxes[:, 1:2]
+    return np.stack([x, y], axis=-1)
+
+
+def rotated_iou_3d(new_box, boxes, eps=1e-8):
+    """
+    NOTES: Vectorized replacement for building two BBox3D objects and calling jaccard_index_3d on
+           every pair. Takes in a single box (x, y, z, l, w, h, r) and an (N, 7) array of boxes and
+           returns the (N,) array of 3D IoU values in a single call.
+           * The BEV intersection is the convex polygon formed by the corners of each box lying
+             inside the other one plus the pairwise edge crossings. The candidate vertices are
+             ordered by angle around their centroid and the shoelace formula gives the area.
+           * The z-overlap follows jaccard_index_3d, which treats z as the top of the box
+             (overlap = min(z_a, z_b) - max(z_a - h_a, z_b - h_b)).
+    """
+
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 7)
+    new_box = np.asarray(new_box, dtype=np.float64).reshape(7)
+    num_boxes = boxes.shape[0]
+    if num_boxes == 0:
+        return np.zeros((0,), dtype=np.float64)
+
+    corners_a = np.broadcast_to(boxes_to_bev_corners(new_box), (num_boxes, 4, 2))
+    corners_b = boxes_to_bev_corners(boxes)
+
+    def corners_inside(corners, box):
+        # Express the corners in the local frame of the box and check them against its half extents
+        offset = corners - box[:, None, 0:2]
+        cosa = np.cos(box[:, 6])[:, None]
+        sina = np.sin(box[:, 6])[:, None]
+        local_x = offset[:, :, 0] * cosa + offset[:, :, 1] * sina
+        local_y = -offset[:, :, 0] * sina + offset[:, :, 1] * cosa
+        return (np.abs(local_x) <= box[:, None, 3] / 2 + eps) & (np.abs(local_y) <= box[:, None, 4] / 2 + eps)
+
+    a_in_b = corners_inside(corners_a, boxes)
+    b_in_a = corners_inside(corners_b, np.broadcast_to(new_box, (num_boxes, 7)))
+
+    # Edge crossings between every edge of a (axis 1) and every edge of b (axis 2)
+    start_a = corners_a[:, :, None, :]
+    dir_a = (np.roll(corners_a, -1, axis=1) - corners_a)[:, :, None, :]
+    start_b = corners_b[:, None, :, :]
+    dir_b = (np.roll(corners_b, -1, axis=1) - corners_b)[:, None, :, :]
+    denom = dir_a[..., 0] * dir_b[..., 1] - dir_a[..., 1] * dir_b[..., 0]
+    diff = start_b - start_a
+    safe_denom = np.where(np.abs(denom) > eps, denom, 1.0)
+    t = (diff[..., 0] * dir_b[..., 1] - diff[..., 1] * dir_b[..., 0]) / safe_denom
+    u = (diff[..., 0] * dir_a[..., 1] - diff[..., 1] * dir_a[..., 0]) / safe_denom
+    crosses = (np.abs(denom) > eps) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    crossing_points = (start_a + t[..., None] * dir_a).reshape(num_boxes, 16, 2)
+
+    points = np.concatenate([corners_a, corners_b, crossing_points], axis=1)
+    valid = np.concatenate([a_in_b, b_in_a, crosses.reshape(num_boxes, 16)], axis=1)
+    num_valid = valid.sum(axis=1)
+
+    centroid = (points * valid[:, :, None]).sum(axis=1) / np.maximum(num_valid, 1)[:, None]
+    angles = np.arctan2(points[:, :, 1] - centroid[:, 1:2], points[:, :, 0] - centroid[:, 0:1])
+    angles = np.where(valid, angles, np.inf)
+    order = np.argsort(angles, axis=1)
+    points = np.take_along_axis(points, order[:, :, None], axis=1)
+
+    # Invalid slots are sorted to the end and replaced by the first vertex so they add no area
+    slot_valid = np.arange(points.shape[1])[None, :] < num_valid[:, None]
+    points = np.where(slot_valid[:, :, None], points, points[:, 0:1, :])
+    next_points = np.roll(points, -1, axis=1)
+    cross = points[:, :, 0] * next_points[:, :, 1] - points[:, :, 1] * next_points[:, :, 0]
+    inter_area = np.abs(cross.sum(axis=1)) / 2
+    inter_area = np.where(num_valid >= 3, inter_area, 0.0)
+
+    zmax = np.minimum(new_box[2], boxes[:, 2])
+    zmin = np.maximum(new_box[2] - new_box[5], boxes[:, 2] - boxes[:, 5])
+    inter_vol = inter_area * np.maximum(0, zmax - zmin)
+
+    vol_a = new_box[3] * new_box[4] * new_box[5]
+    vol_b = boxes[:, 3] * boxes[:, 4] * boxes[:, 5]
+    union_vol = vol_a + vol_b - inter_vol
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = inter_vol / union_vol
+    iou[~np.isfinite(iou)] = 0.0
+    return iou
+
+
+class ClusterGridIndex:
+    """
+    NOTES: Uniform bird's eye view grid over the centers of the current clusters. Two boxes can only
+           overlap when their centers are closer than the sum of their BEV half diagonals, so a query
+           only has to look at the grid cells within that radius instead of every cluster.
+           * Clusters are added with insert() when they are created and moved with update() when
+             get_weighted_box picks a new representative box for them
+           * cell_size is in the same units as the boxes (meters for our data)
+    """
+
+    def __init__(self, cell_size=4.0):
+        self.cell_size = float(cell_size)
+        self.cells = dict()
+        self.centers = dict()
+        self.max_radius = 0.0
+
+    def _cell(self, x, y):
+        return int(np.floor(x / self.cell_size)), int(np.floor(y / self.cell_size))
+
+    @staticmethod
+    def _radius(box):
+        return float(np.hypot(box[3], box[4])) / 2
+
+    def insert(self, index, box):
+        """
+        NOTES: Adds cluster 'index' whose representative box is (x, y, z, l, w, h, r).
+        """
+
+        cell = self._cell(box[0], box[1])
+        self.cells.setdefault(cell, []).append(index)
+        self.centers[index] = cell
+        self.max_radius = max(self.max_radius, self._radius(box))
+
+    def update(self, index, box):
+        """
+        NOTES: Moves cluster 'index' to the cell of its new representative box.
+        """
+
+        cell = self._cell(box[0], box[1])
+        old_cell = self.centers[index]
+        if cell != old_cell:
+            self.cells[old_cell].remove(index)
+            self.cells.setdefault(cell, []).append(index)
+            self.centers[index] = cell
+        self.max_radius = max(self.max_radius, self._radius(box))
+
+    def query(self, box):
+        """
+        NOTES: Returns the sorted indices of the clusters whose center lies in a cell that can hold an
+               overlapping box. Callers still have to run the exact IoU on the result.
+        """
+
+        reach = self._radius(box) + self.max_radius
+        x_lo, y_lo = self._cell(box[0] - reach, box[1] - reach)
+        x_hi, y_hi = self._cell(box[0] + reach, box[1] + reach)
+        found = []
+        for cx in range(x_lo, x_hi + 1):
+            for cy in range(y_lo, y_hi + 1):
+                found.extend(self.cells.get((cx, cy), ()))
+        return np.sort(np.asarray(found, dtype=np.int64))
+
+
+def find_matching_box(boxes_list, new_box, match_iou, grid_index=None):
 
     """
     NOTES: This function takes in the boxes_list along with the current box being compared (new_box)
-           and a threshold for the minimum IoU score. It uses classes and functions from the BBox
-           library to find the IoU for the two boxes being compared. jaccard_index_3d accepts our
-           heading angle 'r' as input, allowing us to account for the 3D boxes angle when finding 
-           the Intersection over Union.
+           and a threshold for the minimum IoU score. The IoU of new_box against every box of the same
+           label is computed in one call to rotated_iou_3d, which accounts for the heading angle 'r'
+           the same way the jaccard_index_3d function from the BBox library did.
+           * If a ClusterGridIndex over boxes_list is given, only the clusters near new_box are scored
     """
 
-    best_iou = match_iou
-    best_index = -1
-    for i in range(len(boxes_list)):
-        box = boxes_list[i]
-        if box[0] != new_box[0]:
-            continue
-            
-        # This portion has been modified to use the jaccard_index_3d function.
-        # It takes the arguments: (a, b) where a and b are BBox3D objects
-        # BBox3D objects must be created and then passed into the function here
-            
-        a = BBox3D(box[2], box[3], box[4], length=box[5], width=box[6], height=box[7], euler_angles=(0.0, 0.0, box[8] + 1e-10)) 
-        b = BBox3D(new_box[2], new_box[3], new_box[4], length=new_box[5], width=new_box[6], height=new_box[7], euler_angles=(0.0, 0.0, new_box[8] + 1e-10))
-            
-        iou = jaccard_index_3d(a, b)
-        if iou > best_iou:
-            best_index = i
-            best_iou = iou
-
-    return best_index, best_iou
-
-
-def weighted_boxes_fusion_3d(boxes_list, scores_list, labels_list, weights=None, iou_thr=0.55, skip_box_thr=0.0, conf_type='avg', allows_overflow=False):
+    boxes = np.asarray(boxes_list, dtype=np.float64).reshape(-1, 9)
+    if grid_index is None:
+        candidates = np.arange(len(boxes))
+    else:
+        candidates = grid_index.query(new_box[2:9])
+    candidates = candidates[boxes[candidates, 0] == new_box[0]]
+    if len(candidates) == 0:
+        return -1, match_iou
+
+    ious = rotated_iou_3d(new_box[2:9], boxes[candidates, 2:9])
+    best = int(np.argmax(ious))
+    if ious[best] > match_iou:
+        return int(candidates[best]), float(ious[best])
+
+    return -1, match_iou
+
+
+def weighted_boxes_fusion_3d(boxes_list, scores_list, labels_list, weights=None, iou_thr=0.55, skip_box_thr=0.0, conf_type='avg', allows_overflow=False, grid_cell_size=4.0):
     '''
     :NEW param boxes_list list of boxes predictions from the models
     Incoming format will be (x, y, z, l, w, h, r)
@@ -149,6 +298,8 @@ def weighted_boxes_fusion_3d(boxes_list, scores_list, labels_list, weights=None,
     :param conf_type: how to calculate confidence in weighted boxes. 'avg': average value, 'max': maximum value
     	** We don't use this and it can be removed in the future
     :param allows_overflow: false if we want confidence score not exceed 1.0
+    :param grid_cell_size: cell size of the BEV grid used to find the clusters near each box.
+        None disables the grid and scores every cluster of the same label.
 
     :NEW return: boxes: boxes coordinates (Order of boxes: x, y, z, l, w, h, r).
     :return: scores: confidence scores
@@ -174,19 +325,27 @@ def weighted_boxes_fusion_3d(boxes_list, scores_list, labels_list, weights=None,
     for label in filtered_boxes:
         boxes = filtered_boxes[label]
         new_boxes = []
-        weighted_boxes = []
+        # Clusters are kept in one preallocated array so every match is a single vectorized IoU call
+        weighted_boxes = np.zeros((len(boxes), 9), dtype=np.float64)
+        num_clusters = 0
+        grid_index = ClusterGridIndex(grid_cell_size) if grid_cell_size else None
 
         # Clusterize boxes
         for j in range(0, len(boxes)):
-            index, best_iou = find_matching_box(weighted_boxes, boxes[j], iou_thr)
+            index, best_iou = find_matching_box(weighted_boxes[:num_clusters], boxes[j], iou_thr, grid_index)
             if index != -1:
                 new_boxes[index].append(boxes[j])
                 weighted_boxes[index] = get_weighted_box(new_boxes[index], conf_type)
+                if grid_index is not None:
+                    grid_index.update(index, weighted_boxes[index, 2:9])
             else:
                 new_boxes.append([boxes[j].copy()])
-                weighted_boxes.append(boxes[j].copy())
+                weighted_boxes[num_clusters] = boxes[j]
+                if grid_index is not None:
+                    grid_index.insert(num_clusters, boxes[j, 2:9])
+                num_clusters += 1
 
-        overall_boxes.append(np.array(weighted_boxes))
+        overall_boxes.append(weighted_boxes[:num_clusters])
 
     overall_boxes = np.concatenate(overall_boxes, axis=0)
     overall_boxes = overall_boxes[overall_boxes[:, 1].argsort()[::-1]]
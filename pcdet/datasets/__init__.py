@@ -5,27 +5,18 @@ from torch.utils.data import DistributedSampler as _DistributedSampler
 
 from pcdet.utils import common_utils
 
-from .dataset import DatasetTemplate
-from .kitti.kitti_dataset import KittiDataset
-from .nuscenes.nuscenes_dataset import NuScenesDataset
-from .waymo.waymo_dataset import WaymoDataset
-from .pandaset.pandaset_dataset import PandasetDataset
-from .lyft.lyft_dataset import LyftDataset
-from .once.once_dataset import ONCEDataset
-from .argo2.argo2_dataset import Argo2Dataset
-from .custom.custom_dataset import CustomDataset
-
-__all__ = {
-    'DatasetTemplate': DatasetTemplate,
-    'KittiDataset': KittiDataset,
-    'NuScenesDataset': NuScenesDataset,
-    'WaymoDataset': WaymoDataset,
-    'PandasetDataset': PandasetDataset,
-    'LyftDataset': LyftDataset,
-    'ONCEDataset': ONCEDataset,
-    'CustomDataset': CustomDataset,
-    'Argo2Dataset': Argo2Dataset
-}
+__all__ = common_utils.LazyRegistry(__name__, {
+    'DatasetTemplate': ('.dataset', 'DatasetTemplate'),
+    'KittiDataset': ('.kitti.kitti_dataset', 'KittiDataset'),
+    'NuScenesDataset': ('.nuscenes.nuscenes_dataset', 'NuScenesDataset'),
+    'WaymoDataset': ('.waymo.waymo_dataset', 'WaymoDataset'),
+    'PandasetDataset': ('.pandaset.pandaset_dataset', 'PandasetDataset'),
+    'LyftDataset': ('.lyft.lyft_dataset', 'LyftDataset'),
+    'ONCEDataset': ('.once.once_dataset', 'ONCEDataset'),
+    'CustomDataset': ('.custom.custom_dataset', 'CustomDataset'),
+    'Argo2Dataset': ('.argo2.argo2_dataset', 'Argo2Dataset'),
+})
+__getattr__ = __all__.module_getattr
 
 
 class DistributedSampler(_DistributedSampler):
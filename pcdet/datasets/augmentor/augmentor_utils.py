@@ -3,6 +3,7 @@ import math
 import copy
 from ...utils import common_utils
 from ...utils import box_utils
+from ...ops.roiaware_pool3d import roiaware_pool3d_utils
 
 
 def random_flip_along_x(gt_boxes, points, return_flip=False, enable=None):
@@ -57,13 +58,13 @@ def global_rotation(gt_boxes, points, rot_range, return_rot=False, noise_rotatio
     """
     if noise_rotation is None: 
         noise_rotation = np.random.uniform(rot_range[0], rot_range[1])
-    points = common_utils.rotate_points_along_z(points[np.newaxis, :, :], np.array([noise_rotation]))[0]
-    gt_boxes[:, 0:3] = common_utils.rotate_points_along_z(gt_boxes[np.newaxis, :, 0:3], np.array([noise_rotation]))[0]
+    points = common_utils.rotate_points_along_z_numpy(points[np.newaxis, :, :], np.array([noise_rotation]), inplace=True)[0]
+    common_utils.rotate_points_along_z_numpy(gt_boxes[np.newaxis, :, 0:3], np.array([noise_rotation]), inplace=True)
     gt_boxes[:, 6] += noise_rotation
     if gt_boxes.shape[1] > 7:
-        gt_boxes[:, 7:9] = common_utils.rotate_points_along_z(
+        gt_boxes[:, 7:9] = common_utils.rotate_points_along_z_numpy(
             np.hstack((gt_boxes[:, 7:9], np.zeros((gt_boxes.shape[0], 1))))[np.newaxis, :, :],
-            np.array([noise_rotation])
+            np.array([noise_rotation]), inplace=True
         )[0][:, 0:2]
 
     if return_rot:
@@ -150,29 +151,36 @@ def random_image_flip_horizontal(image, depth_map, gt_boxes, calib):
     return aug_image, aug_depth_map, aug_gt_boxes
 
 
-def random_local_translation_along_x(gt_boxes, points, offset_range):
+def random_local_translation(gt_boxes, points, offset_range, axis):
     """
     Args:
         gt_boxes: (N, 7), [x, y, z, dx, dy, dz, heading, [vx], [vy]]
         points: (M, 3 + C),
         offset_range: [min max]]
+        axis: 0, 1 or 2 for x, y or z
     Returns:
     """
-    # augs = {}
-    for idx, box in enumerate(gt_boxes):
-        offset = np.random.uniform(offset_range[0], offset_range[1])
-        # augs[f'object_{idx}'] = offset
-        points_in_box, mask = get_points_in_box(points, box)
-        points[mask, 0] += offset
-        
-        gt_boxes[idx, 0] += offset
-    
-        # if gt_boxes.shape[1] > 7:
-        #     gt_boxes[idx, 7] += offset
-    
+    offsets = np.random.uniform(offset_range[0], offset_range[1], gt_boxes.shape[0])
+    box_idxs_of_pts = get_box_idxs_of_points(points, gt_boxes)
+    fg_mask = box_idxs_of_pts >= 0
+
+    points[fg_mask, axis] += offsets[box_idxs_of_pts[fg_mask]]
+    gt_boxes[:, axis] += offsets
+
     return gt_boxes, points
 
 
+def random_local_translation_along_x(gt_boxes, points, offset_range):
+    """
+    Args:
+        gt_boxes: (N, 7), [x, y, z, dx, dy, dz, heading, [vx], [vy]]
+        points: (M, 3 + C),
+        offset_range: [min max]]
+    Returns:
+    """
+    return random_local_translation(gt_boxes, points, offset_range, axis=0)
+
+
 def random_local_translation_along_y(gt_boxes, points, offset_range):
     """
     Args:
@@ -181,19 +189,7 @@ def random_local_translation_along_y(gt_boxes, points, offset_range):
         offset_range: [min max]]
     Returns:
     """
-    # augs = {}
-    for idx, box in enumerate(gt_boxes):
-        offset = np.random.uniform(offset_range[0], offset_range[1])
-        # augs[f'object_{idx}'] = offset
-        points_in_box, mask = get_points_in_box(points, box)
-        points[mask, 1] += offset
-        
-        gt_boxes[idx, 1] += offset
-    
-        # if gt_boxes.shape[1] > 8:
-        #     gt_boxes[idx, 8] += offset
-    
-    return gt_boxes, points
+    return random_local_translation(gt_boxes, points, offset_range, axis=1)
 
 
 def random_local_translation_along_z(gt_boxes, points, offset_range):
@@ -204,16 +200,7 @@ def random_local_translation_along_z(gt_boxes, points, offset_range):
         offset_range: [min max]]
     Returns:
     """
-    # augs = {}
-    for idx, box in enumerate(gt_boxes):
-        offset = np.random.uniform(offset_range[0], offset_range[1])
-        # augs[f'object_{idx}'] = offset
-        points_in_box, mask = get_points_in_box(points, box)
-        points[mask, 2] += offset
-        
-        gt_boxes[idx, 2] += offset
-    
-    return gt_boxes, points
+    return random_local_translation(gt_boxes, points, offset_range, axis=2)
 
 
 def global_frustum_dropout_top(gt_boxes, points, intensity_range):
@@ -294,27 +281,17 @@ def local_scaling(gt_boxes, points, scale_range):
     """
     if scale_range[1] - scale_range[0] < 1e-3:
         return gt_boxes, points
-    
-    # augs = {}
-    for idx, box in enumerate(gt_boxes):
-        noise_scale = np.random.uniform(scale_range[0], scale_range[1])
-        # augs[f'object_{idx}'] = noise_scale
-        points_in_box, mask = get_points_in_box(points, box)
-        
-        # tranlation to axis center
-        points[mask, 0] -= box[0]
-        points[mask, 1] -= box[1]
-        points[mask, 2] -= box[2]
-        
-        # apply scaling
-        points[mask, :3] *= noise_scale
-        
-        # tranlation back to original position
-        points[mask, 0] += box[0]
-        points[mask, 1] += box[1]
-        points[mask, 2] += box[2]
-        
-        gt_boxes[idx, 3:6] *= noise_scale
+
+    noise_scale = np.random.uniform(scale_range[0], scale_range[1], gt_boxes.shape[0])
+    box_idxs_of_pts = get_box_idxs_of_points(points, gt_boxes)
+    fg_mask = box_idxs_of_pts >= 0
+    fg_box_idxs = box_idxs_of_pts[fg_mask]
+
+    # scale around the box center
+    centers = gt_boxes[fg_box_idxs, 0:3]
+    points[fg_mask, 0:3] = (points[fg_mask, 0:3] - centers) * noise_scale[fg_box_idxs, np.newaxis] + centers
+
+    gt_boxes[:, 3:6] *= noise_scale[:, np.newaxis]
     return gt_boxes, points
 
 
@@ -326,46 +303,57 @@ def local_rotation(gt_boxes, points, rot_range):
         rot_range: [min, max]
     Returns:
     """
-    # augs = {}
-    for idx, box in enumerate(gt_boxes):
-        noise_rotation = np.random.uniform(rot_range[0], rot_range[1])
-        # augs[f'object_{idx}'] = noise_rotation
-        points_in_box, mask = get_points_in_box(points, box)
-        
-        centroid_x = box[0]
-        centroid_y = box[1]
-        centroid_z = box[2]
-        
-        # tranlation to axis center
-        points[mask, 0] -= centroid_x
-        points[mask, 1] -= centroid_y
-        points[mask, 2] -= centroid_z
-        box[0] -= centroid_x
-        box[1] -= centroid_y
-        box[2] -= centroid_z
-        
-        # apply rotation
-        points[mask, :] = common_utils.rotate_points_along_z(points[np.newaxis, mask, :], np.array([noise_rotation]))[0]
-        box[0:3] = common_utils.rotate_points_along_z(box[np.newaxis, np.newaxis, 0:3], np.array([noise_rotation]))[0][0]
-        
-        # tranlation back to original position
-        points[mask, 0] += centroid_x
-        points[mask, 1] += centroid_y
-        points[mask, 2] += centroid_z
-        box[0] += centroid_x
-        box[1] += centroid_y
-        box[2] += centroid_z
-        
-        gt_boxes[idx, 6] += noise_rotation
-        if gt_boxes.shape[1] > 8:
-            gt_boxes[idx, 7:9] = common_utils.rotate_points_along_z(
-                np.hstack((gt_boxes[idx, 7:9], np.zeros((gt_boxes.shape[0], 1))))[np.newaxis, :, :],
-                np.array([noise_rotation])
-            )[0][:, 0:2]
-    
+    noise_rotation = np.random.uniform(rot_range[0], rot_range[1], gt_boxes.shape[0])
+    box_idxs_of_pts = get_box_idxs_of_points(points, gt_boxes)
+    fg_mask = box_idxs_of_pts >= 0
+    fg_box_idxs = box_idxs_of_pts[fg_mask]
+
+    # (N, 2, 2) bev rotation of each box, same convention as common_utils.rotate_points_along_z
+    cosa, sina = np.cos(noise_rotation), np.sin(noise_rotation)
+    rot_matrix = np.stack((cosa, sina, -sina, cosa), axis=1).reshape(-1, 2, 2)
+
+    # rotate around the box center
+    centers = gt_boxes[fg_box_idxs, 0:2]
+    points[fg_mask, 0:2] = np.einsum(
+        'ni,nij->nj', points[fg_mask, 0:2] - centers, rot_matrix[fg_box_idxs]
+    ) + centers
+
+    gt_boxes[:, 6] += noise_rotation
+    if gt_boxes.shape[1] > 8:
+        gt_boxes[:, 7:9] = np.einsum('ni,nij->nj', gt_boxes[:, 7:9], rot_matrix)
+
     return gt_boxes, points
 
 
+def local_frustum_dropout(gt_boxes, points, intensity_range, axis, from_top):
+    """
+    Drops the points of each box beyond a random fraction of its extent along the axis
+    Args:
+        gt_boxes: (N, 7), [x, y, z, dx, dy, dz, heading, [vx], [vy]],
+        points: (M, 3 + C),
+        intensity: [min, max]
+        axis: 1 (y) or 2 (z)
+        from_top: drop from the max side of the box along the axis, otherwise from the min side
+    Returns:
+    """
+    intensity = np.random.uniform(intensity_range[0], intensity_range[1], gt_boxes.shape[0])
+    box_idxs_of_pts = get_box_idxs_of_points(points, gt_boxes)
+    fg_mask = box_idxs_of_pts >= 0
+    fg_box_idxs = box_idxs_of_pts[fg_mask]
+
+    center, size = gt_boxes[:, axis], gt_boxes[:, axis + 3]
+    if from_top:
+        threshold = (center + size / 2) - intensity * size
+        drop = points[fg_mask, axis] >= threshold[fg_box_idxs]
+    else:
+        threshold = (center - size / 2) + intensity * size
+        drop = points[fg_mask, axis] <= threshold[fg_box_idxs]
+
+    keep_mask = np.ones(points.shape[0], dtype=bool)
+    keep_mask[np.flatnonzero(fg_mask)[drop]] = False
+    return gt_boxes, points[keep_mask]
+
+
 def local_frustum_dropout_top(gt_boxes, points, intensity_range):
     """
     Args:
@@ -374,16 +362,7 @@ def local_frustum_dropout_top(gt_boxes, points, intensity_range):
         intensity: [min, max]
     Returns:
     """
-    for idx, box in enumerate(gt_boxes):
-        x, y, z, dx, dy, dz = box[0], box[1], box[2], box[3], box[4], box[5]
-        
-        intensity = np.random.uniform(intensity_range[0], intensity_range[1])
-        points_in_box, mask = get_points_in_box(points, box)
-        threshold = (z + dz / 2) - intensity * dz
-        
-        points = points[np.logical_not(np.logical_and(mask, points[:, 2] >= threshold))]
-    
-    return gt_boxes, points
+    return local_frustum_dropout(gt_boxes, points, intensity_range, axis=2, from_top=True)
 
 
 def local_frustum_dropout_bottom(gt_boxes, points, intensity_range):
@@ -394,16 +373,7 @@ def local_frustum_dropout_bottom(gt_boxes, points, intensity_range):
         intensity: [min, max]
     Returns:
     """
-    for idx, box in enumerate(gt_boxes):
-        x, y, z, dx, dy, dz = box[0], box[1], box[2], box[3], box[4], box[5]
-        
-        intensity = np.random.uniform(intensity_range[0], intensity_range[1])
-        points_in_box, mask = get_points_in_box(points, box)
-        threshold = (z - dz / 2) + intensity * dz
-        
-        points = points[np.logical_not(np.logical_and(mask, points[:, 2] <= threshold))]
-    
-    return gt_boxes, points
+    return local_frustum_dropout(gt_boxes, points, intensity_range, axis=2, from_top=False)
 
 
 def local_frustum_dropout_left(gt_boxes, points, intensity_range):
@@ -414,16 +384,7 @@ def local_frustum_dropout_left(gt_boxes, points, intensity_range):
         intensity: [min, max]
     Returns:
     """
-    for idx, box in enumerate(gt_boxes):
-        x, y, z, dx, dy, dz = box[0], box[1], box[2], box[3], box[4], box[5]
-        
-        intensity = np.random.uniform(intensity_range[0], intensity_range[1])
-        points_in_box, mask = get_points_in_box(points, box)
-        threshold = (y + dy / 2) - intensity * dy
-        
-        points = points[np.logical_not(np.logical_and(mask, points[:, 1] >= threshold))]
-    
-    return gt_boxes, points
+    return local_frustum_dropout(gt_boxes, points, intensity_range, axis=1, from_top=True)
 
 
 def local_frustum_dropout_right(gt_boxes, points, intensity_range):
@@ -434,16 +395,16 @@ def local_frustum_dropout_right(gt_boxes, points, intensity_range):
         intensity: [min, max]
     Returns:
     """
-    for idx, box in enumerate(gt_boxes):
-        x, y, z, dx, dy, dz = box[0], box[1], box[2], box[3], box[4], box[5]
-        
-        intensity = np.random.uniform(intensity_range[0], intensity_range[1])
-        points_in_box, mask = get_points_in_box(points, box)
-        threshold = (y - dy / 2) + intensity * dy
-        
-        points = points[np.logical_not(np.logical_and(mask, points[:, 1] <= threshold))]
-    
-    return gt_boxes, points
+    return local_frustum_dropout(gt_boxes, points, intensity_range, axis=1, from_top=False)
+
+
+def get_box_idxs_of_points(points, gt_boxes):
+    """
+    Box of each point with the tolerance of get_points_in_box, assigned once for all the boxes
+    Returns:
+        box_idxs_of_pts: (M), -1 for the points outside of all boxes
+    """
+    return roiaware_pool3d_utils.points_in_boxes_idx_cpu(points[:, 0:3], gt_boxes[:, 0:7], margin=1e-1)
 
 
 def get_points_in_box(points, gt_box):
@@ -499,11 +460,71 @@ def one_hot(x, num_class=1):
     return ohx
 
 
-def points_in_pyramids_mask(points, pyramids):
-    pyramids = pyramids.reshape(-1, 5, 3)
-    flags = np.zeros((points.shape[0], pyramids.shape[0]), dtype=np.bool)
-    for i, pyramid in enumerate(pyramids):
-        flags[:, i] = np.logical_or(flags[:, i], box_utils.in_hull(points[:, 0:3], pyramid))
+def get_pyramid_planes(pyramids):
+    """
+    Args:
+        pyramids: (P, 15), apex and the 4 corners of the base of each pyramid
+    Returns:
+        normals: (P, 5, 3) unit normals of the 4 side faces and the base, pointing outwards
+        offsets: (P, 5), a point p is inside face f if normals[f] . p + offsets[f] <= 0
+        valid: (P), False for the degenerate pyramids
+    """
+    vertices = pyramids.reshape(-1, 5, 3).astype(np.float64)
+    apex, base = vertices[:, 0], vertices[:, 1:]
+    # side faces (apex, corner k, corner k + 1) and the base (corner 0, 1, 2)
+    face_a = np.concatenate((np.repeat(apex[:, None, :], 4, axis=1), base[:, 0:1]), axis=1)
+    face_b = np.concatenate((base, base[:, 1:2]), axis=1)
+    face_c = np.concatenate((np.roll(base, -1, axis=1), base[:, 2:3]), axis=1)
+    normals = np.cross(face_b - face_a, face_c - face_a)
+    norms = np.linalg.norm(normals, axis=-1)
+    valid = (norms > 1e-8).all(axis=-1)
+    normals = normals / np.maximum(norms, 1e-8)[..., None]
+
+    # orient the normals away from the centroid
+    centroid = vertices.mean(axis=1)
+    flip = (normals * (centroid[:, None, :] - face_a)).sum(-1) > 0
+    normals[flip] *= -1
+    offsets = -(normals * face_a).sum(-1)
+    return normals, offsets, valid
+
+
+def points_in_pyramids_mask(points, pyramids, eps=1e-6):
+    """
+    Args:
+        points: (M, 3 + C)
+        pyramids: (P, 15) or (..., 5, 3), apex and the 4 corners of the base of each pyramid
+        eps: tolerance on the faces
+    Returns:
+        flags: (M, P) bool
+    """
+    pyramids = pyramids.reshape(-1, 15)
+    flags = np.zeros((points.shape[0], pyramids.shape[0]), dtype=bool)
+    if points.shape[0] == 0 or pyramids.shape[0] == 0:
+        return flags
+
+    normals, offsets, valid = get_pyramid_planes(pyramids)
+    vertices = pyramids.reshape(-1, 5, 3)
+    aabb_min, aabb_max = vertices.min(axis=1) - eps, vertices.max(axis=1) + eps
+
+    # candidate (point, pyramid) pairs: the points in the x range of each pyramid, from the points sorted along x
+    order = np.argsort(points[:, 0], kind='stable')
+    sorted_x = points[order, 0]
+    start = np.searchsorted(sorted_x, aabb_min[:, 0], side='left')
+    counts = np.searchsorted(sorted_x, aabb_max[:, 0], side='right') - start
+    counts[~valid] = 0
+    pyramid_idxs = np.repeat(np.arange(pyramids.shape[0]), counts)
+    point_idxs = order[np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - start, counts)]
+
+    # rest of the aabb, one axis at a time to shrink the candidates early
+    for axis in (1, 2):
+        coords = points[point_idxs, axis]
+        in_aabb = (coords >= aabb_min[pyramid_idxs, axis]) & (coords <= aabb_max[pyramid_idxs, axis])
+        point_idxs, pyramid_idxs = point_idxs[in_aabb], pyramid_idxs[in_aabb]
+
+    # half-space tests against the 5 faces
+    distances = np.einsum('kfj,kj->kf', normals[pyramid_idxs], points[point_idxs, 0:3].astype(np.float64))
+    inside = (distances + offsets[pyramid_idxs] <= eps).all(axis=-1)
+    flags[point_idxs[inside], pyramid_idxs[inside]] = True
     return flags
 
 
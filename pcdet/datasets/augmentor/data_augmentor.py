@@ -8,34 +8,45 @@ from . import augmentor_utils, database_sampler
 
 
 class DataAugmentor(object):
+    # global augmentations that FUSE_GLOBAL_AUG composes into one affine transform
+    GLOBAL_AFFINE_AUG_LIST = ['random_world_flip', 'random_world_rotation', 'random_world_scaling',
+                              'random_world_translation']
+
     def __init__(self, root_path, augmentor_configs, class_names, logger=None):
         self.root_path = root_path
         self.class_names = class_names
         self.logger = logger
 
-        self.data_augmentor_queue = []
-        aug_config_list = augmentor_configs if isinstance(augmentor_configs, list) \
-            else augmentor_configs.AUG_CONFIG_LIST
-
-        for cur_cfg in aug_config_list:
-            if not isinstance(augmentor_configs, list):
-                if cur_cfg.NAME in augmentor_configs.DISABLE_AUG_LIST:
-                    continue
-            cur_augmentor = getattr(self, cur_cfg.NAME)(config=cur_cfg)
-            self.data_augmentor_queue.append(cur_augmentor)
+        self.data_augmentor_queue = self.build_augmentor_queue(augmentor_configs)
 
     def disable_augmentation(self, augmentor_configs):
-        self.data_augmentor_queue = []
+        self.data_augmentor_queue = self.build_augmentor_queue(augmentor_configs)
+
+    def build_augmentor_queue(self, augmentor_configs):
+        data_augmentor_queue = []
         aug_config_list = augmentor_configs if isinstance(augmentor_configs, list) \
             else augmentor_configs.AUG_CONFIG_LIST
+        fuse_global_aug = not isinstance(augmentor_configs, list) and augmentor_configs.get('FUSE_GLOBAL_AUG', False)
 
+        global_aug_configs = []
         for cur_cfg in aug_config_list:
             if not isinstance(augmentor_configs, list):
                 if cur_cfg.NAME in augmentor_configs.DISABLE_AUG_LIST:
                     continue
+            if fuse_global_aug and cur_cfg.NAME in self.GLOBAL_AFFINE_AUG_LIST:
+                global_aug_configs.append(cur_cfg)
+                continue
+            if len(global_aug_configs) > 0:
+                data_augmentor_queue.append(self.global_affine_aug(config=global_aug_configs))
+                global_aug_configs = []
             cur_augmentor = getattr(self, cur_cfg.NAME)(config=cur_cfg)
-            self.data_augmentor_queue.append(cur_augmentor)
-             
+            data_augmentor_queue.append(cur_augmentor)
+
+        if len(global_aug_configs) > 0:
+            data_augmentor_queue.append(self.global_affine_aug(config=global_aug_configs))
+        return data_augmentor_queue
+
+
     def gt_sampling(self, config=None):
         db_sampler = database_sampler.DataBaseSampler(
             root_path=self.root_path,
@@ -113,6 +124,87 @@ class DataAugmentor(object):
         data_dict['noise_scale'] = noise_scale
         return data_dict
 
+    def global_affine_aug(self, data_dict=None, config=None):
+        """
+        Consecutive random_world_flip / rotation / scaling / translation composed into one affine transform,
+        which is applied to the points and boxes at once. The random draws and the flip_* / noise_* entries
+        are the same as the separate augmentations, and lidar_aug_matrix is the composed transform.
+        Args:
+            config: list of the configs of the fused augmentations, in order
+        """
+        if data_dict is None:
+            return partial(self.global_affine_aug, config=config)
+
+        if 'roi_boxes' in data_dict.keys():
+            for cur_cfg in config:
+                data_dict = getattr(self, cur_cfg.NAME)(data_dict=data_dict, config=cur_cfg)
+            return data_dict
+
+        aug_matrix = np.eye(4)
+        scale = 1.0
+        heading_sign, heading_offset = 1.0, 0.0  # heading ==> heading_sign * heading + heading_offset
+        for cur_cfg in config:
+            step_matrix = np.eye(4)
+            if cur_cfg.NAME == 'random_world_flip':
+                for cur_axis in cur_cfg['ALONG_AXIS_LIST']:
+                    assert cur_axis in ['x', 'y']
+                    enable = np.random.choice([False, True], replace=False, p=[0.5, 0.5])
+                    data_dict['flip_%s' % cur_axis] = enable
+                    if enable:
+                        flip_matrix = np.eye(4)
+                        if cur_axis == 'x':
+                            flip_matrix[1, 1] = -1
+                            heading_sign, heading_offset = -heading_sign, -heading_offset
+                        else:
+                            flip_matrix[0, 0] = -1
+                            heading_sign, heading_offset = -heading_sign, -heading_offset - np.pi
+                        step_matrix = flip_matrix @ step_matrix
+            elif cur_cfg.NAME == 'random_world_rotation':
+                rot_range = cur_cfg['WORLD_ROT_ANGLE']
+                if not isinstance(rot_range, list):
+                    rot_range = [-rot_range, rot_range]
+                noise_rot = np.random.uniform(rot_range[0], rot_range[1])
+                cosa, sina = np.cos(noise_rot), np.sin(noise_rot)
+                step_matrix[0:2, 0:2] = [[cosa, -sina], [sina, cosa]]
+                heading_offset += noise_rot
+                data_dict['noise_rot'] = noise_rot
+            elif cur_cfg.NAME == 'random_world_scaling':
+                scale_range = cur_cfg['WORLD_SCALE_RANGE']
+                if scale_range[1] - scale_range[0] < 1e-3:
+                    continue
+                noise_scale = np.random.uniform(scale_range[0], scale_range[1])
+                step_matrix[0:3, 0:3] *= noise_scale
+                scale *= noise_scale
+                data_dict['noise_scale'] = noise_scale
+            else:
+                noise_translate_std = cur_cfg['NOISE_TRANSLATE_STD']
+                assert len(noise_translate_std) == 3
+                noise_translate = np.array([
+                    np.random.normal(0, noise_translate_std[0], 1),
+                    np.random.normal(0, noise_translate_std[1], 1),
+                    np.random.normal(0, noise_translate_std[2], 1),
+                ], dtype=np.float32).T
+                step_matrix[0:3, 3] = noise_translate[0]
+                data_dict['noise_translate'] = noise_translate
+            aug_matrix = step_matrix @ aug_matrix
+
+        rot_scale, translation = aug_matrix[0:3, 0:3], aug_matrix[0:3, 3]
+        points = data_dict['points']
+        points[:, 0:3] = points[:, 0:3] @ rot_scale.T.astype(points.dtype) + translation.astype(points.dtype)
+
+        gt_boxes = data_dict['gt_boxes']
+        gt_boxes[:, 0:3] = gt_boxes[:, 0:3] @ rot_scale.T + translation
+        gt_boxes[:, 3:6] *= scale
+        gt_boxes[:, 6] = heading_sign * gt_boxes[:, 6] + heading_offset
+        if gt_boxes.shape[1] > 7:
+            gt_boxes[:, 7:9] = gt_boxes[:, 7:9] @ rot_scale[0:2, 0:2].T
+            gt_boxes[:, 9:] *= scale  # as global_scaling
+
+        data_dict['points'] = points
+        data_dict['gt_boxes'] = gt_boxes
+        data_dict['lidar_aug_matrix'] = aug_matrix @ data_dict.get('lidar_aug_matrix', np.eye(4))
+        return data_dict
+
     def random_image_flip(self, data_dict=None, config=None):
         if data_dict is None:
             return partial(self.random_image_flip, config=config)
@@ -298,6 +390,10 @@ class DataAugmentor(object):
 
         Returns:
         """
+        if data_dict.get('points', None) is not None and not data_dict['points'].flags.writeable:
+            # read-only view of a SharedPointPool, the augmentations modify the points in place
+            data_dict['points'] = data_dict['points'].copy()
+
         for cur_augmentor in self.data_augmentor_queue:
             data_dict = cur_augmentor(data_dict=data_dict)
 
@@ -312,6 +408,8 @@ class DataAugmentor(object):
             gt_boxes_mask = data_dict['gt_boxes_mask']
             data_dict['gt_boxes'] = data_dict['gt_boxes'][gt_boxes_mask]
             data_dict['gt_names'] = data_dict['gt_names'][gt_boxes_mask]
+            if 'gt_classes' in data_dict:
+                data_dict['gt_classes'] = data_dict['gt_classes'][gt_boxes_mask]
             if 'gt_boxes2d' in data_dict:
                 data_dict['gt_boxes2d'] = data_dict['gt_boxes2d'][gt_boxes_mask]
 
@@ -1,12 +1,9 @@
 import pickle
 
 import os
-import copy
 import numpy as np
 from skimage import io
 import torch
-import SharedArray
-import torch.distributed as dist
 
 from ...ops.iou3d_nms import iou3d_nms_utils
 from ...utils import box_utils, common_utils, calibration_kitti
@@ -44,7 +41,7 @@ class DataBaseSampler(object):
         for func_name, val in sampler_cfg.PREPARE.items():
             self.db_infos = getattr(self, func_name)(self.db_infos, val)
 
-        self.gt_database_data_key = self.load_db_to_shared_memory() if self.use_shared_memory else None
+        self.gt_database_pool = self.load_db_to_shared_memory() if self.use_shared_memory else None
 
         self.sample_groups = {}
         self.sample_class_num = {}
@@ -72,31 +69,25 @@ class DataBaseSampler(object):
     def __del__(self):
         if self.use_shared_memory:
             self.logger.info('Deleting GT database from shared memory')
-            cur_rank, num_gpus = common_utils.get_dist_info()
-            sa_key = self.sampler_cfg.DB_DATA_PATH[0]
-            if cur_rank % num_gpus == 0 and os.path.exists(f"/dev/shm/{sa_key}"):
-                SharedArray.delete(f"shm://{sa_key}")
-
-            if num_gpus > 1:
-                dist.barrier()
+            self.gt_database_pool.delete()
             self.logger.info('GT database has been removed from shared memory')
 
     def load_db_to_shared_memory(self):
         self.logger.info('Loading GT database to shared memory')
-        cur_rank, world_size, num_gpus = common_utils.get_dist_info(return_gpu_per_machine=True)
 
         assert self.sampler_cfg.DB_DATA_PATH.__len__() == 1, 'Current only support single DB_DATA'
         db_data_path = self.root_path.resolve() / self.sampler_cfg.DB_DATA_PATH[0]
-        sa_key = self.sampler_cfg.DB_DATA_PATH[0]
-
-        if cur_rank % num_gpus == 0 and not os.path.exists(f"/dev/shm/{sa_key}"):
-            gt_database_data = np.load(db_data_path)
-            common_utils.sa_create(f"shm://{sa_key}", gt_database_data)
-
-        if num_gpus > 1:
-            dist.barrier()
+        db_data = np.load(db_data_path, mmap_mode='r')
+        db_data_shape, db_data_dtype = db_data.shape, db_data.dtype
+        del db_data
+
+        # the global database as the only array of the pool, the objects are sliced with their global_data_offset
+        gt_database_pool = common_utils.SharedPointPool.create(
+            name=self.sampler_cfg.DB_DATA_PATH[0], num_arrays=1, num_features=db_data_shape[1],
+            load_func=lambda k: np.load(db_data_path), num_points_func=lambda k: db_data_shape[0], dtype=db_data_dtype
+        )
         self.logger.info('GT database has been saved to shared memory')
-        return sa_key
+        return gt_database_pool
 
     def filter_by_difficulty(self, db_infos, removed_difficulty):
         new_db_infos = {}
@@ -379,16 +370,12 @@ class DataBaseSampler(object):
         # convert sampled 3D boxes to image plane
         img_aug_gt_dict = self.initilize_image_aug_dict(data_dict, gt_boxes_mask)
 
-        if self.use_shared_memory:
-            gt_database_data = SharedArray.attach(f"shm://{self.gt_database_data_key}")
-            gt_database_data.setflags(write=0)
-        else:
-            gt_database_data = None
+        gt_database_data = self.gt_database_pool[0] if self.use_shared_memory else None
 
         for idx, info in enumerate(total_valid_sampled_dict):
             if self.use_shared_memory:
                 start_offset, end_offset = info['global_data_offset']
-                obj_points = copy.deepcopy(gt_database_data[start_offset:end_offset])
+                obj_points = gt_database_data[start_offset:end_offset].copy()
             else:
                 file_path = self.root_path / info['path']
 
@@ -435,6 +422,10 @@ class DataBaseSampler(object):
         gt_boxes = np.concatenate([gt_boxes, sampled_gt_boxes], axis=0)
         data_dict['gt_boxes'] = gt_boxes
         data_dict['gt_names'] = gt_names
+        if 'gt_classes' in data_dict:
+            data_dict['gt_classes'] = np.concatenate([
+                data_dict['gt_classes'][gt_boxes_mask], common_utils.get_class_ids(sampled_gt_names, self.class_names)
+            ], axis=0)
         data_dict['points'] = points
 
         if self.img_aug_type is not None:
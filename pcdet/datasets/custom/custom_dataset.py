@@ -1,6 +1,7 @@
 import copy
 import pickle
 import os
+from pathlib import Path
 
 import numpy as np
 
@@ -8,6 +9,21 @@ from ...ops.roiaware_pool3d import roiaware_pool3d_utils
 from ...utils import box_utils, common_utils
 from ..dataset import DatasetTemplate
 
+PACKED_POINTS_FILE = 'points_packed.bin'
+PACKED_POINTS_INDEX = 'points_packed_index.pkl'
+
+# dataset of the process, set once per worker by init_gt_database_worker
+_gt_database_worker_dataset = None
+
+
+def init_gt_database_worker(dataset):
+    global _gt_database_worker_dataset
+    _gt_database_worker_dataset = dataset
+
+
+def create_gt_database_of_single_scene_in_worker(info, **kwargs):
+    return _gt_database_worker_dataset.create_gt_database_of_single_scene(info, **kwargs)
+
 
 class CustomDataset(DatasetTemplate):
     def __init__(self, dataset_cfg, class_names, training=True, root_path=None, logger=None):
@@ -31,6 +47,12 @@ class CustomDataset(DatasetTemplate):
         self.include_data(self.mode)
         self.map_class_to_kitti = self.dataset_cfg.MAP_CLASS_TO_KITTI
 
+        # points of all frames packed in a single file, see create_packed_points
+        self.use_packed_points = self.dataset_cfg.get('USE_PACKED_POINTS', False)
+        self.packed_points = None
+        self.packed_frame_to_index = None
+        self.packed_offsets = None
+
     def include_data(self, mode):
         self.logger.info('Loading Custom dataset.')
         custom_infos = []
@@ -43,9 +65,28 @@ class CustomDataset(DatasetTemplate):
                 infos = pickle.load(f)
                 custom_infos.extend(infos)
 
+        # class ids of the boxes of all the frames at once, 1-based in self.class_names and 0 for the others
+        annos_list = [info['annos'] for info in custom_infos if 'annos' in info]
+        if len(annos_list) > 0:
+            num_boxes = [annos['name'].shape[0] for annos in annos_list]
+            gt_classes = common_utils.get_class_ids(np.concatenate([annos['name'] for annos in annos_list]), self.class_names)
+            for annos, cur_gt_classes in zip(annos_list, np.split(gt_classes, np.cumsum(num_boxes)[:-1])):
+                annos['gt_classes'] = cur_gt_classes
+
         self.custom_infos.extend(custom_infos)
         self.logger.info('Total samples for CUSTOM dataset: %d' % (len(custom_infos)))
 
+        if len(self.custom_infos) > 0 and 'annos' in self.custom_infos[0]:
+            self.non_empty_frame_index = np.flatnonzero(
+                [(info['annos']['gt_classes'] > 0).any() for info in self.custom_infos]
+            )
+            if self.training and self.dataset_cfg.get('SKIP_EMPTY_FRAMES', False):
+                num_frames = len(self.custom_infos)
+                self.custom_infos = [self.custom_infos[k] for k in self.non_empty_frame_index]
+                self.non_empty_frame_index = np.arange(len(self.custom_infos))
+                self.logger.info('Skip %d frames without gt boxes of %s' % (
+                    num_frames - len(self.custom_infos), self.class_names))
+
     def get_label(self, idx):
         label_file = self.root_path / 'labels' / ('%s.txt' % idx)
         assert label_file.exists()
@@ -62,12 +103,99 @@ class CustomDataset(DatasetTemplate):
 
         return np.array(gt_boxes, dtype=np.float32), np.array(gt_names)
 
+    def get_all_labels(self, sample_id_list, num_workers=4):
+        """
+        Parses the label files of all samples at once, cached in labels_cache_<split>.npz until a label file changes
+        Args:
+            sample_id_list:
+            num_workers: threads reading the label files
+        Returns:
+            labels: (M,) structured array with fields box (7,) float32 and class_id int32
+            class_names: (num_class,) names indexed by class_id
+            offsets: (N + 1,) labels of sample_id_list[k] are labels[offsets[k]:offsets[k + 1]]
+        """
+        import concurrent.futures as futures
+
+        label_dir = str(self.root_path / 'labels')
+        label_files = [os.path.join(label_dir, '%s.txt' % idx) for idx in sample_id_list]
+        frame_ids = np.array(sample_id_list, dtype=str)
+
+        # each thread handles a contiguous chunk, a task per file costs more than a local read
+        num_chunks = max(min(num_workers * 4, len(label_files)), 1)
+        bounds = np.linspace(0, len(label_files), num_chunks + 1).astype(np.int64)
+        chunks = [label_files[bounds[i]:bounds[i + 1]] for i in range(num_chunks)]
+
+        def map_chunks(func):
+            with futures.ThreadPoolExecutor(num_workers) as executor:
+                results = executor.map(lambda chunk: [func(x) for x in chunk], chunks)
+            return [x for chunk_results in results for x in chunk_results]
+
+        mtimes = np.array(map_chunks(lambda x: os.stat(x).st_mtime_ns), dtype=np.int64)
+
+        cache_file = self.root_path / ('labels_cache_%s.npz' % self.split)
+        if cache_file.exists():
+            cache = np.load(cache_file)
+            if np.array_equal(cache['frame_ids'], frame_ids) and np.array_equal(cache['mtimes'], mtimes):
+                return cache['labels'], cache['class_names'], cache['offsets']
+
+        def read_tokens(label_file):
+            with open(label_file, 'rb') as f:
+                return f.read().split()
+
+        tokens_list = map_chunks(read_tokens)
+
+        # (x y z dx dy dz heading_angle category_name) per line
+        num_tokens = np.array([len(tokens) for tokens in tokens_list], dtype=np.int64)
+        assert np.all(num_tokens % 8 == 0), 'label files need 8 fields per line'
+        offsets = np.concatenate([[0], np.cumsum(num_tokens // 8)]).astype(np.int64)
+        tokens = np.array([token for tokens in tokens_list for token in tokens], dtype=bytes).reshape(-1, 8)
+
+        class_names, class_ids = np.unique(tokens[:, 7], return_inverse=True)
+        labels = np.zeros(tokens.shape[0], dtype=[('box', np.float32, (7,)), ('class_id', np.int32)])
+        labels['box'] = tokens[:, :7].astype(np.float32)
+        labels['class_id'] = class_ids
+        class_names = class_names.astype(str)
+
+        np.savez(cache_file, labels=labels, class_names=class_names, offsets=offsets, frame_ids=frame_ids, mtimes=mtimes)
+        return labels, class_names, offsets
+
     def get_lidar(self, idx):
+        if self.use_packed_points:
+            return self.get_packed_lidar(idx)
+
         lidar_file = self.root_path / 'points' / ('%s.npy' % idx)
         assert lidar_file.exists()
         point_features = np.load(lidar_file)
         return point_features
 
+    def load_packed_points(self):
+        index_file = self.root_path / PACKED_POINTS_INDEX
+        assert index_file.exists(), 'Run create_packed_points first: %s' % index_file
+        with open(index_file, 'rb') as f:
+            packed_index = pickle.load(f)
+
+        self.packed_frame_to_index = {frame_id: k for k, frame_id in enumerate(packed_index['frame_ids'])}
+        self.packed_offsets = packed_index['offsets']
+        # read-only, the frames are read-only views that DataAugmentor.forward copies before the in-place
+        # augmentations, so a frame is never returned already augmented and the workers share the page cache
+        self.packed_points = np.memmap(
+            self.root_path / PACKED_POINTS_FILE, dtype=np.float32, mode='r',
+            shape=(int(self.packed_offsets[-1]), packed_index['num_features'])
+        )
+
+    def get_packed_lidar(self, idx):
+        # opened lazily, so that each dataloader worker maps the file itself
+        if self.packed_points is None:
+            self.load_packed_points()
+        k = self.packed_frame_to_index[idx]
+        return self.packed_points[self.packed_offsets[k]:self.packed_offsets[k + 1]]
+
+    def __getstate__(self):
+        # a pickled memmap would be a full copy of the points
+        d = super().__getstate__()
+        d['packed_points'] = None
+        return d
+
     def set_split(self, split):
         super().__init__(
             dataset_cfg=self.dataset_cfg, class_names=self.class_names, training=self.training,
@@ -80,7 +208,7 @@ class CustomDataset(DatasetTemplate):
 
     def __len__(self):
         if self._merge_all_iters_to_one_epoch:
-            return len(self.sample_id_list) * self.total_epochs
+            return len(self.custom_infos) * self.total_epochs
 
         return len(self.custom_infos)
 
@@ -88,13 +216,17 @@ class CustomDataset(DatasetTemplate):
         if self._merge_all_iters_to_one_epoch:
             index = index % len(self.custom_infos)
 
-        info = copy.deepcopy(self.custom_infos[index])
+        # not modified below, drop_info_with_name returns new arrays for the annos
+        info = self.custom_infos[index]
         sample_idx = info['point_cloud']['lidar_idx']
-        points = self.get_lidar(sample_idx)
         input_dict = {
-            'frame_id': self.sample_id_list[index],
-            'points': points
+            'frame_id': sample_idx,
         }
+        cached_dict = self.load_cached_frame(sample_idx)
+        if cached_dict is not None:
+            input_dict.update(cached_dict)
+        else:
+            input_dict['points'] = self.get_lidar(sample_idx)
 
         if 'annos' in info:
             annos = info['annos']
@@ -105,6 +237,8 @@ class CustomDataset(DatasetTemplate):
                 'gt_names': gt_names,
                 'gt_boxes': gt_boxes_lidar
             })
+            if 'gt_classes' in annos:
+                input_dict['gt_classes'] = annos['gt_classes']
 
         data_dict = self.prepare_data(data_dict=input_dict)
 
@@ -139,34 +273,50 @@ class CustomDataset(DatasetTemplate):
 
         return ap_result_str, ap_dict
 
+    def create_streaming_evaluator(self, class_names, **kwargs):
+        """
+        Evaluator that is updated with the prediction dicts of each batch, see eval_utils.eval_one_epoch
+        Returns None when the infos have no ground-truth boxes
+        """
+        if 'annos' not in self.custom_infos[0].keys():
+            return None
+        if kwargs['eval_metric'] != 'kitti':
+            raise NotImplementedError
+
+        from ..kitti.kitti_utils import StreamingKittiFormatEval
+
+        # keyed as the frame_id of the predictions
+        frame_id_to_gt_annos = {info['point_cloud']['lidar_idx']: info['annos'] for info in self.custom_infos}
+        return StreamingKittiFormatEval(
+            frame_id_to_gt_annos, class_names, self.map_class_to_kitti,
+            info_with_fakelidar=self.dataset_cfg.get('INFO_WITH_FAKELIDAR', False)
+        )
+
     def get_infos(self, class_names, num_workers=4, has_label=True, sample_id_list=None, num_features=4):
-        import concurrent.futures as futures
+        sample_id_list = sample_id_list if sample_id_list is not None else self.sample_id_list
+        print('%s samples: %d' % (self.split, len(sample_id_list)))
+
+        if has_label:
+            labels, label_class_names, offsets = self.get_all_labels(sample_id_list, num_workers=num_workers)
+            names = label_class_names[labels['class_id']]
+            boxes = np.ascontiguousarray(labels['box'])
 
-        def process_single_scene(sample_idx):
-            print('%s sample_idx: %s' % (self.split, sample_idx))
+        infos = []
+        for k, sample_idx in enumerate(sample_id_list):
             info = {}
             pc_info = {'num_features': num_features, 'lidar_idx': sample_idx}
             info['point_cloud'] = pc_info
 
             if has_label:
                 annotations = {}
-                gt_boxes_lidar, name = self.get_label(sample_idx)
-                annotations['name'] = name
-                annotations['gt_boxes_lidar'] = gt_boxes_lidar[:, :7]
+                annotations['name'] = names[offsets[k]:offsets[k + 1]]
+                annotations['gt_boxes_lidar'] = boxes[offsets[k]:offsets[k + 1]]
                 info['annos'] = annotations
 
-            return info
-
-        sample_id_list = sample_id_list if sample_id_list is not None else self.sample_id_list
-
-        # create a thread pool to improve the velocity
-        with futures.ThreadPoolExecutor(num_workers) as executor:
-            infos = executor.map(process_single_scene, sample_id_list)
-        return list(infos)
+            infos.append(info)
+        return infos
 
     def create_groundtruth_database(self, info_path=None, used_classes=None, split='train'):
-        import torch
-
         database_save_path = Path(self.root_path) / ('gt_database' if split == 'train' else ('gt_database_%s' % split))
         db_info_save_path = Path(self.root_path) / ('custom_dbinfos_%s.pkl' % split)
 
@@ -186,14 +336,12 @@ class CustomDataset(DatasetTemplate):
             gt_boxes = annos['gt_boxes_lidar']
 
             num_obj = gt_boxes.shape[0]
-            point_indices = roiaware_pool3d_utils.points_in_boxes_cpu(
-                torch.from_numpy(points[:, 0:3]), torch.from_numpy(gt_boxes)
-            ).numpy()  # (nboxes, npoints)
+            point_order, box_bounds = roiaware_pool3d_utils.group_points_in_boxes_cpu(points[:, 0:3], gt_boxes)
 
             for i in range(num_obj):
                 filename = '%s_%s_%d.bin' % (sample_idx, names[i], i)
                 filepath = database_save_path / filename
-                gt_points = points[point_indices[i] > 0]
+                gt_points = points[point_order[box_bounds[i]:box_bounds[i + 1]]]
 
                 gt_points[:, :3] -= gt_boxes[i, :3]
                 with open(filepath, 'w') as f:
@@ -215,6 +363,119 @@ class CustomDataset(DatasetTemplate):
         with open(db_info_save_path, 'wb') as f:
             pickle.dump(all_db_infos, f)
 
+    def create_gt_database_of_single_scene(self, info, database_dir_name='gt_database', save_object_files=True,
+                                           used_classes=None):
+        """
+        Returns:
+            objects: list of (db_info, gt_points) of the frame, the points relative to the box center
+        """
+        sample_idx = info['point_cloud']['lidar_idx']
+        points = self.get_lidar(sample_idx)
+        annos = info['annos']
+        names = annos['name']
+        gt_boxes = annos['gt_boxes_lidar']
+
+        num_obj = gt_boxes.shape[0]
+        if num_obj == 0:
+            return []
+
+        point_order, box_bounds = roiaware_pool3d_utils.group_points_in_boxes_cpu(points[:, 0:3], gt_boxes[:, 0:7])
+
+        objects = []
+        for i in range(num_obj):
+            if (used_classes is not None) and names[i] not in used_classes:
+                continue
+            gt_points = points[point_order[box_bounds[i]:box_bounds[i + 1]]].astype(np.float32)
+            gt_points[:, :3] -= gt_boxes[i, :3]
+
+            filename = '%s_%s_%d.bin' % (sample_idx, names[i], i)
+            db_path = str(Path(database_dir_name) / filename)  # gt_database/xxxxx.bin
+            if save_object_files:
+                with open(self.root_path / db_path, 'w') as f:
+                    gt_points.tofile(f)
+
+            db_info = {'name': names[i], 'path': db_path, 'gt_idx': i,
+                       'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0]}
+            objects.append((db_info, gt_points))
+        return objects
+
+    def create_groundtruth_database_parallel(self, info_path=None, used_classes=None, split='train', num_workers=4,
+                                             save_object_files=True):
+        """
+        Builds the GT database in a single pass over the frames, sharded across processes. The object points are
+        written straight into <root>/custom_gt_database_<split>_global.npy with 'global_data_offset' in the db infos,
+        as needed by USE_SHARED_MEMORY of the gt_sampling augmentation.
+        Args:
+            save_object_files: also write one .bin per object, read by gt_sampling without USE_SHARED_MEMORY
+        """
+        import multiprocessing
+        from functools import partial
+
+        database_dir_name = 'gt_database' if split == 'train' else ('gt_database_%s' % split)
+        database_save_path = Path(self.root_path) / database_dir_name
+        db_info_save_path = Path(self.root_path) / ('custom_dbinfos_%s.pkl' % split)
+        db_data_save_path = Path(self.root_path) / ('custom_gt_database_%s_global.npy' % split)
+        db_data_tmp_path = db_data_save_path.with_suffix('.tmp')
+
+        if save_object_files:
+            database_save_path.mkdir(parents=True, exist_ok=True)
+
+        with open(info_path, 'rb') as f:
+            infos = pickle.load(f)
+
+        # the dataset goes to each worker once through the initializer, the tasks only carry the infos
+        create_gt_database_of_single_scene = partial(
+            create_gt_database_of_single_scene_in_worker,
+            database_dir_name=database_dir_name, save_object_files=save_object_files, used_classes=used_classes
+        )
+        chunk_size = max(1, min(64, len(infos) // (num_workers * 4)))
+
+        all_db_infos = {}
+        point_offset_cnt = 0
+        num_point_features = 0
+        try:
+            with multiprocessing.Pool(num_workers, initializer=init_gt_database_worker, initargs=(self,)) as p, \
+                    open(db_data_tmp_path, 'wb') as f:
+                frame_objects_iter = p.imap(create_gt_database_of_single_scene, infos, chunksize=chunk_size)
+                for k, frame_objects in enumerate(frame_objects_iter):
+                    if k % 1000 == 0:
+                        print('gt_database sample: %d/%d' % (k + 1, len(infos)))
+                    for db_info, gt_points in frame_objects:
+                        num_point_features = gt_points.shape[1]
+                        f.write(gt_points.tobytes())
+                        db_info['global_data_offset'] = [point_offset_cnt, point_offset_cnt + gt_points.shape[0]]
+                        point_offset_cnt += gt_points.shape[0]
+
+                        if db_info['name'] in all_db_infos:
+                            all_db_infos[db_info['name']].append(db_info)
+                        else:
+                            all_db_infos[db_info['name']] = [db_info]
+
+            # the raw points only get the .npy header once their total number is known
+            if point_offset_cnt == 0:
+                np.save(db_data_save_path, np.zeros((0, 0), dtype=np.float32))
+            else:
+                raw_points = np.memmap(
+                    db_data_tmp_path, dtype=np.float32, mode='r', shape=(point_offset_cnt, num_point_features)
+                )
+                global_db = np.lib.format.open_memmap(
+                    db_data_save_path, mode='w+', dtype=np.float32, shape=(point_offset_cnt, num_point_features)
+                )
+                step = 1 << 22
+                for start in range(0, point_offset_cnt, step):
+                    global_db[start:start + step] = raw_points[start:start + step]
+                global_db.flush()
+                del global_db, raw_points
+        finally:
+            if db_data_tmp_path.exists():
+                os.remove(db_data_tmp_path)
+
+        for k, v in all_db_infos.items():
+            print('Database %s: %d' % (k, len(v)))
+
+        with open(db_info_save_path, 'wb') as f:
+            pickle.dump(all_db_infos, f)
+
     @staticmethod
     def create_label_file_with_name_and_box(class_names, gt_names, gt_boxes, save_label_path):
         with open(save_label_path, 'w') as f:
@@ -230,6 +491,40 @@ class CustomDataset(DatasetTemplate):
                 f.write(line)
 
 
+def create_packed_points(data_path, sample_id_list=None, num_features=4):
+    """
+    Packs points/*.npy into a single float32 file, read back by CustomDataset.get_lidar with USE_PACKED_POINTS
+    Args:
+        data_path: root of the custom dataset
+        sample_id_list: frames to pack, all of points/*.npy by default
+        num_features:
+    """
+    data_path = Path(data_path)
+    if sample_id_list is None:
+        sample_id_list = sorted(x.stem for x in (data_path / 'points').glob('*.npy'))
+
+    # the headers are enough to lay out the file
+    num_points = np.zeros(len(sample_id_list), dtype=np.int64)
+    for k, sample_idx in enumerate(sample_id_list):
+        points = np.load(data_path / 'points' / ('%s.npy' % sample_idx), mmap_mode='r')
+        assert points.ndim == 2 and points.shape[1] == num_features, (sample_idx, points.shape)
+        num_points[k] = points.shape[0]
+    offsets = np.concatenate([[0], np.cumsum(num_points)]).astype(np.int64)
+
+    packed_file = data_path / PACKED_POINTS_FILE
+    packed_points = np.memmap(packed_file, dtype=np.float32, mode='w+', shape=(max(int(offsets[-1]), 1), num_features))
+    for k, sample_idx in enumerate(sample_id_list):
+        print('packed points sample: %d/%d' % (k + 1, len(sample_id_list)))
+        packed_points[offsets[k]:offsets[k + 1]] = np.load(data_path / 'points' / ('%s.npy' % sample_idx))
+    packed_points.flush()
+    del packed_points
+
+    packed_index = {'num_features': num_features, 'frame_ids': list(sample_id_list), 'offsets': offsets}
+    with open(data_path / PACKED_POINTS_INDEX, 'wb') as f:
+        pickle.dump(packed_index, f)
+    print('Packed points of %d frames are saved to %s' % (len(sample_id_list), packed_file))
+
+
 def create_custom_infos(dataset_cfg, class_names, data_path, save_path, workers=4):
     dataset = CustomDataset(
         dataset_cfg=dataset_cfg, class_names=class_names, root_path=data_path,
@@ -261,7 +556,7 @@ def create_custom_infos(dataset_cfg, class_names, data_path, save_path, workers=
 
     print('------------------------Start create groundtruth database for data augmentation------------------------')
     dataset.set_split(train_split)
-    dataset.create_groundtruth_database(train_filename, split=train_split)
+    dataset.create_groundtruth_database_parallel(train_filename, split=train_split, num_workers=workers)
     print('------------------------Data preparation done------------------------')
 
 
@@ -281,3 +576,14 @@ if __name__ == '__main__':
             data_path=ROOT_DIR / 'data' / 'custom',
             save_path=ROOT_DIR / 'data' / 'custom',
         )
+    elif sys.argv.__len__() > 1 and sys.argv[1] == 'create_packed_points':
+        import yaml
+        from pathlib import Path
+        from easydict import EasyDict
+
+        dataset_cfg = EasyDict(yaml.safe_load(open(sys.argv[2])))
+        ROOT_DIR = (Path(__file__).resolve().parent / '../../../').resolve()
+        create_packed_points(
+            data_path=ROOT_DIR / 'data' / 'custom',
+            num_features=len(dataset_cfg.POINT_FEATURE_ENCODING.src_feature_list)
+        )
@@ -1,3 +1,4 @@
+import multiprocessing
 from collections import defaultdict
 from pathlib import Path
 
@@ -9,6 +10,12 @@ from ..utils import common_utils
 from .augmentor.data_augmentor import DataAugmentor
 from .processor.data_processor import DataProcessor
 from .processor.point_feature_encoder import PointFeatureEncoder
+from .processor.voxel_cache import VoxelCache, get_config_hash, get_uncacheable_processors
+
+
+class EmptyFrameError(Exception):
+    """Raised by prepare_data inside a resampling attempt, so that the attempts run in a loop, not recursively."""
+    pass
 
 
 class DatasetTemplate(torch_data.Dataset):
@@ -20,6 +27,12 @@ class DatasetTemplate(torch_data.Dataset):
         self.logger = logger
         self.root_path = root_path if root_path is not None else Path(self.dataset_cfg.DATA_PATH)
         self.logger = logger
+
+        # indices of the frames with at least one gt box of class_names, set by the datasets that know it
+        self.non_empty_frame_index = None
+        # frames resampled because no gt box was left, shared by the dataloader workers
+        self.resample_counter = multiprocessing.Value('q', 0)
+        self._resampling = False
         if self.dataset_cfg is None or class_names is None:
             return
 
@@ -45,18 +58,50 @@ class DatasetTemplate(torch_data.Dataset):
             self.depth_downsample_factor = self.data_processor.depth_downsample_factor
         else:
             self.depth_downsample_factor = None
+
+        self.voxel_cache = None
+        voxel_cache_cfg = self.dataset_cfg.get('VOXEL_CACHE', None)
+        if not self.training and voxel_cache_cfg is not None and voxel_cache_cfg.get('ENABLED', False):
+            uncacheable = get_uncacheable_processors(self.dataset_cfg.DATA_PROCESSOR)
+            assert len(uncacheable) == 0, 'VOXEL_CACHE: the output of %s is not deterministic' % uncacheable
+            cache_dir = voxel_cache_cfg.get('CACHE_DIR', None)
+            self.voxel_cache = VoxelCache(
+                cache_dir=Path(cache_dir) if cache_dir is not None else Path(self.root_path) / 'voxel_cache',
+                config_hash=get_config_hash(self.dataset_cfg, self.__class__.__name__),
+                max_size=int(voxel_cache_cfg.get('MAX_SIZE_GB', 20) * 1024 ** 3)
+            )
             
     @property
     def mode(self):
         return 'train' if self.training else 'test'
 
+    @property
+    def num_resampled_frames(self):
+        return self.resample_counter.value
+
     def __getstate__(self):
         d = dict(self.__dict__)
         del d['logger']
+        # the shared counter only goes to the processes started with the dataset (e.g. spawned dataloader
+        # workers), the pools of the info and gt database builders get a counter of their own
+        if multiprocessing.context.get_spawning_popen() is None:
+            d['resample_counter'] = None
         return d
 
     def __setstate__(self, d):
         self.__dict__.update(d)
+        if self.resample_counter is None:
+            self.resample_counter = multiprocessing.Value('q', 0)
+
+    def load_cached_frame(self, frame_id):
+        """
+        Returns:
+            the points and voxels of the frame saved by prepare_data in the voxel cache, None if not cached.
+            Datasets update their input_dict with it instead of loading the points.
+        """
+        if self.voxel_cache is None:
+            return None
+        return self.voxel_cache.load(frame_id)
 
     def generate_prediction_dicts(self, batch_dict, pred_dicts, class_names, output_path=None):
         """
@@ -135,6 +180,9 @@ class DatasetTemplate(torch_data.Dataset):
         """
             Get lidar augment matrix (4 x 4), which are used to recover orig point coordinates.
         """
+        if 'lidar_aug_matrix' in data_dict.keys():
+            # already composed by DataAugmentor.global_affine_aug
+            return data_dict
         lidar_aug_matrix = np.eye(4)
         if 'flip_y' in data_dict.keys():
             flip_x = data_dict['flip_x']
@@ -175,10 +223,15 @@ class DatasetTemplate(torch_data.Dataset):
                 voxel_coords: optional (num_voxels, 3)
                 voxel_num_points: optional (num_voxels)
                 ...
+            With VOXEL_CACHE in test mode, the points and voxels of the frames are saved after the data processor,
+            and loaded back instead of running the point feature encoder and the data processor again.
         """
+        if data_dict.get('gt_names', None) is not None and data_dict.get('gt_classes', None) is None:
+            data_dict['gt_classes'] = common_utils.get_class_ids(data_dict['gt_names'], self.class_names)
+
         if self.training:
             assert 'gt_boxes' in data_dict, 'gt_boxes should be provided for training'
-            gt_boxes_mask = np.array([n in self.class_names for n in data_dict['gt_names']], dtype=np.bool_)
+            gt_boxes_mask = data_dict['gt_classes'] > 0
             
             if 'calib' in data_dict:
                 calib = data_dict['calib']
@@ -192,31 +245,68 @@ class DatasetTemplate(torch_data.Dataset):
                 data_dict['calib'] = calib
         data_dict = self.set_lidar_aug_matrix(data_dict)
         if data_dict.get('gt_boxes', None) is not None:
-            selected = common_utils.keep_arrays_by_name(data_dict['gt_names'], self.class_names)
+            gt_classes = data_dict.get('gt_classes', None)
+            if gt_classes is None or gt_classes.shape[0] != data_dict['gt_names'].shape[0]:
+                gt_classes = common_utils.get_class_ids(data_dict['gt_names'], self.class_names)
+            selected = np.flatnonzero(gt_classes > 0)
             data_dict['gt_boxes'] = data_dict['gt_boxes'][selected]
             data_dict['gt_names'] = data_dict['gt_names'][selected]
-            gt_classes = np.array([self.class_names.index(n) + 1 for n in data_dict['gt_names']], dtype=np.int32)
+            gt_classes = gt_classes[selected]
             gt_boxes = np.concatenate((data_dict['gt_boxes'], gt_classes.reshape(-1, 1).astype(np.float32)), axis=1)
             data_dict['gt_boxes'] = gt_boxes
 
             if data_dict.get('gt_boxes2d', None) is not None:
                 data_dict['gt_boxes2d'] = data_dict['gt_boxes2d'][selected]
 
-        if data_dict.get('points', None) is not None:
-            data_dict = self.point_feature_encoder.forward(data_dict)
+        # use_lead_xyz is set by the point feature encoder, so the frame is already processed
+        if self.voxel_cache is not None and 'use_lead_xyz' not in data_dict:
+            data_dict.update(self.voxel_cache.load(data_dict['frame_id']) or {})
 
-        data_dict = self.data_processor.forward(
-            data_dict=data_dict
-        )
+        if 'use_lead_xyz' not in data_dict:
+            if data_dict.get('points', None) is not None:
+                data_dict = self.point_feature_encoder.forward(data_dict)
+
+            data_dict = self.data_processor.forward(
+                data_dict=data_dict
+            )
+            if self.voxel_cache is not None:
+                self.voxel_cache.save(data_dict['frame_id'], data_dict)
 
         if self.training and len(data_dict['gt_boxes']) == 0:
-            new_index = np.random.randint(self.__len__())
-            return self.__getitem__(new_index)
+            return self.resample_frame()
 
         data_dict.pop('gt_names', None)
+        data_dict.pop('gt_classes', None)
 
         return data_dict
 
+    def get_resample_index(self):
+        if self.non_empty_frame_index is not None and len(self.non_empty_frame_index) > 0:
+            return int(np.random.choice(self.non_empty_frame_index))
+        return np.random.randint(self.__len__())
+
+    def resample_frame(self):
+        """
+        Replaces a training frame left without gt boxes by a random frame, drawn from non_empty_frame_index
+        when it is known. At most MAX_RESAMPLE_TRIES frames are tried.
+        """
+        with self.resample_counter.get_lock():
+            self.resample_counter.value += 1
+        if self._resampling:
+            raise EmptyFrameError
+
+        max_tries = self.dataset_cfg.get('MAX_RESAMPLE_TRIES', 20)
+        self._resampling = True
+        try:
+            for _ in range(max_tries):
+                try:
+                    return self.__getitem__(self.get_resample_index())
+                except EmptyFrameError:
+                    continue
+        finally:
+            self._resampling = False
+        raise RuntimeError('No frame with gt boxes after %d resampling tries' % max_tries)
+
     @staticmethod
     def collate_batch(batch_list, _unused=False):
         data_dict = defaultdict(list)
@@ -235,13 +325,16 @@ class DatasetTemplate(torch_data.Dataset):
                         val = [i for item in val for i in item]
                     ret[key] = np.concatenate(val, axis=0)
                 elif key in ['points', 'voxel_coords']:
-                    coors = []
                     if isinstance(val[0], list):
                         val =  [i for item in val for i in item]
+                    # (batch_idx, ...) rows written in place into one array allocated for the whole batch
+                    num_rows = np.cumsum([0] + [len(coor) for coor in val])
+                    dtype = np.result_type(*{coor.dtype for coor in val})
+                    coors = np.empty((num_rows[-1], val[0].shape[-1] + 1), dtype=dtype)
                     for i, coor in enumerate(val):
-                        coor_pad = np.pad(coor, ((0, 0), (1, 0)), mode='constant', constant_values=i)
-                        coors.append(coor_pad)
-                    ret[key] = np.concatenate(coors, axis=0)
+                        coors[num_rows[i]:num_rows[i + 1], 0] = i
+                        coors[num_rows[i]:num_rows[i + 1], 1:] = coor
+                    ret[key] = coors
                 elif key in ['gt_boxes']:
                     max_gt = max([len(x) for x in val])
                     batch_gt_boxes3d = np.zeros((batch_size, max_gt, val[0].shape[-1]), dtype=np.float32)
@@ -2,8 +2,13 @@ import io as sysio
 
 import numba
 import numpy as np
+from numba import cuda
 
-from .rotate_iou import rotate_iou_gpu_eval
+# rotate_iou.py compiles its numba.cuda kernels at import, so it can only be imported with a CUDA device
+if cuda.is_available():
+    from .rotate_iou import rotate_iou_gpu_eval as rotate_iou_eval
+else:
+    from .rotate_iou_cpu import rotate_iou_cpu_eval as rotate_iou_eval
 
 
 @numba.jit
@@ -114,7 +119,7 @@ def image_box_overlap(boxes, query_boxes, criterion=-1):
 
 
 def bev_box_overlap(boxes, qboxes, criterion=-1):
-    riou = rotate_iou_gpu_eval(boxes, qboxes, criterion)
+    riou = rotate_iou_eval(boxes, qboxes, criterion)
     return riou
 
 
@@ -148,7 +153,7 @@ def d3_box_overlap_kernel(boxes, qboxes, rinc, criterion=-1):
 
 
 def d3_box_overlap(boxes, qboxes, criterion=-1):
-    rinc = rotate_iou_gpu_eval(boxes[:, [0, 2, 3, 5, 6]],
+    rinc = rotate_iou_eval(boxes[:, [0, 2, 3, 5, 6]],
                                qboxes[:, [0, 2, 3, 5, 6]], 2)
     d3_box_overlap_kernel(boxes, qboxes, rinc, criterion)
     return rinc
@@ -636,7 +641,7 @@ def do_coco_style_eval(gt_annos, dt_annos, current_classes, overlap_ranges,
     return mAP_bbox, mAP_bev, mAP_3d, mAP_aos
 
 
-def get_official_eval_result(gt_annos, dt_annos, current_classes, PR_detail_dict=None):
+def get_official_classes_and_overlaps(current_classes):
     overlap_0_7 = np.array([[0.7, 0.5, 0.5, 0.7,
                              0.5, 0.7], [0.7, 0.5, 0.5, 0.7, 0.5, 0.7],
                             [0.7, 0.5, 0.5, 0.7, 0.5, 0.7]])
@@ -663,7 +668,11 @@ def get_official_eval_result(gt_annos, dt_annos, current_classes, PR_detail_dict
             current_classes_int.append(curcls)
     current_classes = current_classes_int
     min_overlaps = min_overlaps[:, :, current_classes]
-    result = ''
+    return current_classes, min_overlaps
+
+
+def get_official_eval_result(gt_annos, dt_annos, current_classes, PR_detail_dict=None):
+    current_classes, min_overlaps = get_official_classes_and_overlaps(current_classes)
     # check whether alpha is valid
     compute_aos = False
     for anno in dt_annos:
@@ -671,9 +680,22 @@ def get_official_eval_result(gt_annos, dt_annos, current_classes, PR_detail_dict
             if anno['alpha'][0] != -10:
                 compute_aos = True
             break
-    mAPbbox, mAPbev, mAP3d, mAPaos, mAPbbox_R40, mAPbev_R40, mAP3d_R40, mAPaos_R40 = do_eval(
+    mAPs = do_eval(
         gt_annos, dt_annos, current_classes, min_overlaps, compute_aos, PR_detail_dict=PR_detail_dict)
+    return format_official_eval_result(current_classes, min_overlaps, compute_aos, *mAPs)
+
 
+def format_official_eval_result(current_classes, min_overlaps, compute_aos, mAPbbox, mAPbev, mAP3d, mAPaos,
+                                mAPbbox_R40, mAPbev_R40, mAP3d_R40, mAPaos_R40):
+    class_to_name = {
+        0: 'Car',
+        1: 'Pedestrian',
+        2: 'Cyclist',
+        3: 'Van',
+        4: 'Person_sitting',
+        5: 'Truck'
+    }
+    result = ''
     ret_dict = {}
     for j, curcls in enumerate(current_classes):
         # mAP threshold array: [num_minoverlap, metric, class]
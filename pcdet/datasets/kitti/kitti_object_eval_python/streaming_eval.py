@@ -0,0 +1,122 @@
+import numpy as np
+
+from .eval import (_prepare_data, calculate_iou_partly, format_official_eval_result, fused_compute_statistics,
+                   get_mAP, get_mAP_R40, get_official_classes_and_overlaps)
+
+
+class StreamingKittiEval(object):
+    """KITTI eval that ingests predictions one batch at a time.
+
+    The official eval picks its 41 score thresholds from the scores of every matched detection,
+    which requires the whole split in memory. Here tp / fp / fn / similarity are accumulated
+    exactly on a fixed score grid instead, and the precision at the 41 (R11) / 40 (R40) recall
+    sample points is interpolated from that PR curve. Memory only depends on the grid size, and
+    the result can be read at any time, e.g. for a partial mAP mid-epoch.
+    """
+
+    def __init__(self, current_classes, num_score_thresholds=201, compute_aos=None):
+        """
+        Args:
+            current_classes: list of class names or ints, same as get_official_eval_result
+            num_score_thresholds: size of the score grid spanning [0, 1]
+            compute_aos: None to decide from the alpha of the first detections, like the official eval
+        """
+        self.current_classes, self.min_overlaps = get_official_classes_and_overlaps(current_classes)
+        self.difficultys = [0, 1, 2]
+        # descending, so that recall grows along the threshold axis as in eval_class
+        self.thresholds = np.linspace(1.0, 0.0, num_score_thresholds)
+        self.compute_aos = compute_aos
+        self.num_examples = 0
+        # [metric, class, difficulty, min_overlap, threshold, (tp, fp, fn, similarity)]
+        self.pr = np.zeros([3, len(self.current_classes), len(self.difficultys), self.min_overlaps.shape[0],
+                            num_score_thresholds, 4])
+
+    def update(self, gt_annos, dt_annos):
+        """
+        Args:
+            gt_annos: list of KITTI format gt annos of this batch
+            dt_annos: list of KITTI format predictions, in the same order as gt_annos
+        """
+        assert len(gt_annos) == len(dt_annos)
+        if len(gt_annos) == 0:
+            return
+
+        if self.compute_aos is None:
+            for anno in dt_annos:
+                if anno['alpha'].shape[0] != 0:
+                    self.compute_aos = bool(anno['alpha'][0] != -10)
+                    break
+
+        for metric in range(3):
+            # the whole batch is a single part of calculate_iou_partly / fused_compute_statistics
+            _, parted_overlaps, total_dt_num, total_gt_num = calculate_iou_partly(
+                dt_annos, gt_annos, metric, num_parts=1
+            )
+            compute_aos = bool(self.compute_aos) and metric == 0
+            for m, current_class in enumerate(self.current_classes):
+                for l, difficulty in enumerate(self.difficultys):
+                    (gt_datas_list, dt_datas_list, ignored_gts, ignored_dets,
+                     dontcares, total_dc_num, _) = _prepare_data(gt_annos, dt_annos, current_class, difficulty)
+                    gt_datas_part = np.concatenate(gt_datas_list, 0)
+                    dt_datas_part = np.concatenate(dt_datas_list, 0)
+                    dc_datas_part = np.concatenate(dontcares, 0)
+                    ignored_dets_part = np.concatenate(ignored_dets, 0)
+                    ignored_gts_part = np.concatenate(ignored_gts, 0)
+                    for k, min_overlap in enumerate(self.min_overlaps[:, metric, m]):
+                        fused_compute_statistics(
+                            parted_overlaps[0],
+                            self.pr[metric, m, l, k],
+                            total_gt_num,
+                            total_dt_num,
+                            total_dc_num,
+                            gt_datas_part,
+                            dt_datas_part,
+                            dc_datas_part,
+                            ignored_gts_part,
+                            ignored_dets_part,
+                            metric,
+                            min_overlap=min_overlap,
+                            thresholds=self.thresholds,
+                            compute_aos=compute_aos)
+        self.num_examples += len(gt_annos)
+
+    def merge(self, other):
+        """Adds the statistics of another evaluator, e.g. the one of another rank."""
+        self.pr += other.pr
+        self.num_examples += other.num_examples
+        if self.compute_aos is None:
+            self.compute_aos = other.compute_aos
+
+    def interpolated_precision(self, metric, column=1):
+        """
+        Returns:
+            [num_class, num_difficulty, num_minoverlap, 41] precision (column=1) or aos (column=3)
+            at the recall sample points 0, 1/40, ..., 1
+        """
+        pr = self.pr[metric]
+        tp, fp, fn = pr[..., 0], pr[..., 1], pr[..., 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            recall = np.nan_to_num(tp / (tp + fn))
+            value = np.nan_to_num((tp if column == 1 else pr[..., 3]) / (tp + fp))
+        sample_pts = np.linspace(0.0, 1.0, 41)
+        reached = recall[..., np.newaxis, :] >= sample_pts[:, np.newaxis]
+        return np.where(reached, value[..., np.newaxis, :], 0.0).max(axis=-1)
+
+    def get_mAPs(self):
+        mAPs = []
+        for metric in range(3):
+            precision = self.interpolated_precision(metric)
+            mAPs.append((get_mAP(precision), get_mAP_R40(precision)))
+        if self.compute_aos:
+            aos = self.interpolated_precision(0, column=3)
+            mAP_aos, mAP_aos_R40 = get_mAP(aos), get_mAP_R40(aos)
+        else:
+            mAP_aos = mAP_aos_R40 = None
+        (mAP_bbox, mAP_bbox_R40), (mAP_bev, mAP_bev_R40), (mAP_3d, mAP_3d_R40) = mAPs
+        return mAP_bbox, mAP_bev, mAP_3d, mAP_aos, mAP_bbox_R40, mAP_bev_R40, mAP_3d_R40, mAP_aos_R40
+
+    def get_result(self):
+        """Returns (result_str, ret_dict) in the format of get_official_eval_result."""
+        return format_official_eval_result(
+            self.current_classes, self.min_overlaps, bool(self.compute_aos), *self.get_mAPs()
+        )
@@ -1,3 +1,5 @@
+import copy
+
 import numpy as np
 from ...utils import box_utils
 
@@ -49,6 +51,63 @@ def transform_annotations_to_kitti_format(annos, map_name_to_kitti=None, info_wi
     return annos
 
 
+class StreamingKittiFormatEval(object):
+    """
+    Feeds the predictions of each eval batch to the streaming KITTI eval, so that the
+    predictions of a whole split never have to be kept in memory.
+    """
+    def __init__(self, frame_id_to_gt_annos, class_names, map_name_to_kitti, info_with_fakelidar=False, **kwargs):
+        """
+        Args:
+            frame_id_to_gt_annos: dict or callable, frame_id => gt annos in the info format
+            class_names: names of the classes to evaluate
+            map_name_to_kitti: dict, map name to KITTI names (Car, Pedestrian, Cyclist)
+            info_with_fakelidar:
+            **kwargs: passed to StreamingKittiEval
+        """
+        from .kitti_object_eval_python.streaming_eval import StreamingKittiEval
+
+        self.frame_id_to_gt_annos = frame_id_to_gt_annos
+        self.map_name_to_kitti = map_name_to_kitti
+        self.info_with_fakelidar = info_with_fakelidar
+        self.evaluator = StreamingKittiEval([map_name_to_kitti[x] for x in class_names], **kwargs)
+
+    def get_gt_annos(self, frame_id):
+        if callable(self.frame_id_to_gt_annos):
+            return self.frame_id_to_gt_annos(frame_id)
+        return self.frame_id_to_gt_annos[frame_id]
+
+    def update(self, det_annos):
+        """
+        Args:
+            det_annos: prediction dicts of one batch from generate_prediction_dicts, including 'frame_id'
+        """
+        # only this batch is copied, transform_annotations_to_kitti_format works in place
+        eval_det_annos = copy.deepcopy(det_annos)
+        eval_gt_annos = [copy.deepcopy(self.get_gt_annos(anno['frame_id'])) for anno in det_annos]
+        transform_annotations_to_kitti_format(eval_det_annos, map_name_to_kitti=self.map_name_to_kitti)
+        transform_annotations_to_kitti_format(
+            eval_gt_annos, map_name_to_kitti=self.map_name_to_kitti, info_with_fakelidar=self.info_with_fakelidar
+        )
+        self.evaluator.update(eval_gt_annos, eval_det_annos)
+
+    def merge(self, other):
+        self.evaluator.merge(other.evaluator)
+
+    @property
+    def num_examples(self):
+        return self.evaluator.num_examples
+
+    def get_result(self):
+        return self.evaluator.get_result()
+
+    def __getstate__(self):
+        # the gt lookup stays on each rank, only the accumulated statistics are gathered
+        state = self.__dict__.copy()
+        state['frame_id_to_gt_annos'] = None
+        return state
+
+
 def calib_to_matricies(calib):
     """
     Converts calibration object to transformation matricies
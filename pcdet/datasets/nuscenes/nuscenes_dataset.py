@@ -1,5 +1,6 @@
 import copy
 import pickle
+from collections import OrderedDict
 from pathlib import Path
 
 import numpy as np
@@ -30,6 +31,17 @@ class NuScenesDataset(DatasetTemplate):
         if self.training and self.dataset_cfg.get('BALANCED_RESAMPLING', False):
             self.infos = self.balanced_infos_resampling(self.infos)
 
+        # points of the recently loaded sweeps of each dataloader worker, a sweep is shared by ~10 keyframes
+        self.sweep_cache = OrderedDict()
+        self.sweep_cache_bytes = 0
+        self.sweep_cache_max_bytes = int(self.dataset_cfg.get('SWEEP_CACHE_SIZE_MB', 64) * 1024 ** 2)
+
+    def __getstate__(self):
+        d = super().__getstate__()
+        d['sweep_cache'] = OrderedDict()
+        d['sweep_cache_bytes'] = 0
+        return d
+
     def include_nuscenes_data(self, mode):
         self.logger.info('Loading NuScenes dataset')
         nuscenes_infos = []
@@ -82,40 +94,53 @@ class NuScenesDataset(DatasetTemplate):
 
         return sampled_infos
 
-    def get_sweep(self, sweep_info):
-        def remove_ego_points(points, center_radius=1.0):
-            mask = ~((np.abs(points[:, 0]) < center_radius) & (np.abs(points[:, 1]) < center_radius))
-            return points[mask]
-
-        lidar_path = self.root_path / sweep_info['lidar_path']
-        points_sweep = np.fromfile(str(lidar_path), dtype=np.float32, count=-1).reshape([-1, 5])[:, :4]
-        points_sweep = remove_ego_points(points_sweep).T
-        if sweep_info['transform_matrix'] is not None:
-            num_points = points_sweep.shape[1]
-            points_sweep[:3, :] = sweep_info['transform_matrix'].dot(
-                np.vstack((points_sweep[:3, :], np.ones(num_points))))[:3, :]
-
-        cur_times = sweep_info['time_lag'] * np.ones((1, points_sweep.shape[1]))
-        return points_sweep.T, cur_times.T
+    def get_sweep_points(self, lidar_path):
+        """
+        Returns:
+            points_sweep: (N, 4) points of the sweep in its own frame, without the ego points. Read-only, kept in an LRU
+                cache of SWEEP_CACHE_SIZE_MB
+        """
+        points_sweep = self.sweep_cache.get(lidar_path, None)
+        if points_sweep is not None:
+            self.sweep_cache.move_to_end(lidar_path)
+            return points_sweep
+
+        points_sweep = np.memmap(self.root_path / lidar_path, dtype=np.float32, mode='r').reshape([-1, 5])
+        mask = ~((np.abs(points_sweep[:, 0]) < 1.0) & (np.abs(points_sweep[:, 1]) < 1.0))  # remove ego points
+        points_sweep = points_sweep[mask, :4]
+        if 0 < points_sweep.nbytes <= self.sweep_cache_max_bytes:
+            points_sweep.flags.writeable = False
+            self.sweep_cache[lidar_path] = points_sweep
+            self.sweep_cache_bytes += points_sweep.nbytes
+            while self.sweep_cache_bytes > self.sweep_cache_max_bytes:
+                self.sweep_cache_bytes -= self.sweep_cache.popitem(last=False)[1].nbytes
+        return points_sweep
 
     def get_lidar_with_sweeps(self, index, max_sweeps=1):
         info = self.infos[index]
-        lidar_path = self.root_path / info['lidar_path']
-        points = np.fromfile(str(lidar_path), dtype=np.float32, count=-1).reshape([-1, 5])[:, :4]
-
-        sweep_points_list = [points]
-        sweep_times_list = [np.zeros((points.shape[0], 1))]
-
-        for k in np.random.choice(len(info['sweeps']), max_sweeps - 1, replace=False):
-            points_sweep, times_sweep = self.get_sweep(info['sweeps'][k])
-            sweep_points_list.append(points_sweep)
-            sweep_times_list.append(times_sweep)
-
-        points = np.concatenate(sweep_points_list, axis=0)
-        times = np.concatenate(sweep_times_list, axis=0).astype(points.dtype)
-
-        points = np.concatenate((points, times), axis=1)
-        return points
+        points = np.memmap(self.root_path / info['lidar_path'], dtype=np.float32, mode='r').reshape([-1, 5])
+
+        sweep_infos = [info['sweeps'][k] for k in np.random.choice(len(info['sweeps']), max_sweeps - 1, replace=False)]
+        points_sweep_list = [self.get_sweep_points(sweep_info['lidar_path']) for sweep_info in sweep_infos]
+
+        # [x, y, z, intensity, time_lag] of the keyframe and all the sweeps, written into one array
+        num_points = np.cumsum([0, points.shape[0]] + [points_sweep.shape[0] for points_sweep in points_sweep_list])
+        points_all = np.empty((num_points[-1], 5), dtype=np.float32)
+        points_all[:num_points[1], :4] = points[:, :4]
+        points_all[:num_points[1], 4] = 0
+
+        for k, (sweep_info, points_sweep) in enumerate(zip(sweep_infos, points_sweep_list)):
+            cur_points = points_all[num_points[k + 1]:num_points[k + 2]]
+            if sweep_info['transform_matrix'] is not None:
+                # sweep -> keyframe
+                transform_matrix = sweep_info['transform_matrix'].astype(np.float32)
+                np.matmul(points_sweep[:, :3], transform_matrix[:3, :3].T, out=cur_points[:, :3])
+                cur_points[:, :3] += transform_matrix[:3, 3]
+            else:
+                cur_points[:, :3] = points_sweep[:, :3]
+            cur_points[:, 3] = points_sweep[:, 3]
+            cur_points[:, 4] = sweep_info['time_lag']
+        return points_all
 
     def crop_image(self, input_dict):
         W, H = input_dict["ori_shape"]
@@ -5,6 +5,7 @@ from skimage import transform
 import torch
 import torchvision
 from ...utils import box_utils, common_utils
+from .voxel_generator_cpu import VoxelGeneratorCPU
 
 tv = None
 try:
@@ -140,13 +141,23 @@ class DataProcessor(object):
             return partial(self.transform_points_to_voxels, config=config)
 
         if self.voxel_generator is None:
-            self.voxel_generator = VoxelGeneratorWrapper(
+            voxel_generator_kwargs = dict(
                 vsize_xyz=config.VOXEL_SIZE,
                 coors_range_xyz=self.point_cloud_range,
                 num_point_features=self.num_point_features,
                 max_num_points_per_voxel=config.MAX_POINTS_PER_VOXEL,
                 max_num_voxels=config.MAX_NUMBER_OF_VOXELS[self.mode],
             )
+            voxelizer = config.get('VOXELIZER', 'spconv')
+            assert voxelizer in ['spconv', 'numba']
+            if voxelizer == 'spconv':
+                try:
+                    self.voxel_generator = VoxelGeneratorWrapper(**voxel_generator_kwargs)
+                except ImportError:
+                    # same outputs without spconv
+                    voxelizer = 'numba'
+            if voxelizer == 'numba':
+                self.voxel_generator = VoxelGeneratorCPU(**voxel_generator_kwargs)
 
         points = data_dict['points']
         voxel_output = self.voxel_generator.generate(points)
@@ -0,0 +1,156 @@
+"""
+On-disk cache of the outputs of the point feature encoder and the data processor in test mode.
+
+Each frame is one packed file: a json header (frame id and dtype / shape / offset of each array)
+followed by the raw arrays, read back with np.memmap. The cache directory is keyed by a hash of the
+dataset config, so changing the point cloud range, the voxel size or the point loading options starts
+a new cache. The least recently used frames are removed once the cache is larger than max_size.
+"""
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+CACHE_VERSION = 1
+CACHED_KEYS = ['points', 'voxels', 'voxel_coords', 'voxel_num_points']
+# dataset config keys which do not change the processed points and voxels of a frame
+UNHASHED_CFG_KEYS = ['DATA_AUGMENTOR', 'VOXEL_CACHE', 'DATA_SPLIT', 'INFO_PATH']
+ALIGNMENT = 64
+MAGIC = b'PCDETVC\x00'
+
+
+def get_uncacheable_processors(processor_configs):
+    """
+    Returns:
+        names of the data processors whose test mode output is random or not an array of CACHED_KEYS
+    """
+    names = []
+    for cur_cfg in processor_configs:
+        if cur_cfg.NAME in ['mask_points_and_boxes_outside_range', 'transform_points_to_voxels_placeholder',
+                            'calculate_grid_size']:
+            continue
+        if cur_cfg.NAME == 'shuffle_points' and not cur_cfg.SHUFFLE_ENABLED['test']:
+            continue
+        if cur_cfg.NAME == 'sample_points' and cur_cfg.NUM_POINTS['test'] == -1:
+            continue
+        if cur_cfg.NAME == 'transform_points_to_voxels' and not cur_cfg.get('DOUBLE_FLIP', False):
+            continue
+        names.append(cur_cfg.NAME)
+    return names
+
+
+def get_config_hash(dataset_cfg, dataset_name):
+    cfg = {key: val for key, val in dataset_cfg.items() if key not in UNHASHED_CFG_KEYS}
+    cfg_str = json.dumps({'version': CACHE_VERSION, 'dataset': dataset_name, 'cfg': cfg}, sort_keys=True, default=str)
+    return hashlib.sha1(cfg_str.encode()).hexdigest()[:16]
+
+
+class VoxelCache(object):
+    def __init__(self, cache_dir, config_hash, max_size):
+        """
+        Args:
+            cache_dir: root of the caches, the frames are saved in cache_dir / config_hash
+            config_hash: see get_config_hash
+            max_size: bytes
+        """
+        self.cache_dir = Path(cache_dir) / config_hash
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        # size of the cache as last seen by this process, the other dataloader workers write to it too
+        self.cur_size = None
+
+    def get_frame_file(self, frame_id):
+        # the frame id is checked against the header, so that sanitized names may collide
+        return self.cache_dir / ('%s.bin' % re.sub(r'[^\w.-]', '_', str(frame_id)))
+
+    def load(self, frame_id):
+        """
+        Returns:
+            data_dict: the CACHED_KEYS arrays of the frame (copy-on-write memmaps) and use_lead_xyz,
+                None if the frame is not cached
+        """
+        frame_file = self.get_frame_file(frame_id)
+        try:
+            data = np.memmap(frame_file, dtype=np.uint8, mode='c')
+        except (FileNotFoundError, ValueError):
+            return None
+        if data[:len(MAGIC)].tobytes() != MAGIC:
+            return None
+        header_size = int(data[len(MAGIC):len(MAGIC) + 8].view(np.int64)[0])
+        header_start = len(MAGIC) + 8
+        header = json.loads(data[header_start:header_start + header_size].tobytes().decode())
+        if header['frame_id'] != str(frame_id):
+            return None
+
+        data_dict = {'use_lead_xyz': header['use_lead_xyz']}
+        for key, (dtype, shape, offset) in header['arrays'].items():
+            num_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            data_dict[key] = data[offset:offset + num_bytes].view(dtype).reshape(shape)
+        # mtime is the last use of the frame
+        os.utime(frame_file)
+        return data_dict
+
+    def save(self, frame_id, data_dict):
+        arrays = {key: np.ascontiguousarray(data_dict[key]) for key in CACHED_KEYS if key in data_dict}
+        header = {'frame_id': str(frame_id), 'use_lead_xyz': bool(data_dict['use_lead_xyz']), 'arrays': {}}
+
+        # the offsets are fixed before the header is encoded, so that its size is known
+        offset = 0
+        for key, val in arrays.items():
+            header['arrays'][key] = [val.dtype.str, list(val.shape), offset]
+            offset += -(-val.nbytes // ALIGNMENT) * ALIGNMENT
+        header_size = len(json.dumps(header).encode()) + 32 * len(arrays)
+        data_start = -(-(len(MAGIC) + 8 + header_size) // ALIGNMENT) * ALIGNMENT
+        for key in arrays:
+            header['arrays'][key][2] += data_start
+        header_bytes = json.dumps(header).encode()
+        assert len(MAGIC) + 8 + len(header_bytes) <= data_start
+
+        frame_file = self.get_frame_file(frame_id)
+        tmp_file = frame_file.with_suffix('.tmp%d' % os.getpid())
+        with open(tmp_file, 'wb') as f:
+            f.write(MAGIC)
+            f.write(np.int64(len(header_bytes)).tobytes())
+            f.write(header_bytes)
+            for key, val in arrays.items():
+                f.seek(header['arrays'][key][2])
+                f.write(val.tobytes())
+            f.truncate(data_start + offset)
+        # readers never see a partially written frame
+        os.replace(tmp_file, frame_file)
+
+        if self.cur_size is None:
+            self.cur_size = self.get_size()
+        self.cur_size += data_start + offset
+        if self.cur_size > self.max_size:
+            self.evict()
+
+    def get_frame_files(self):
+        frame_files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.bin'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                frame_files.append((stat.st_mtime, stat.st_size, entry.path))
+        return frame_files
+
+    def get_size(self):
+        return sum(size for _, size, _ in self.get_frame_files())
+
+    def evict(self):
+        # least recently used first, until the cache fits in max_size
+        frame_files = sorted(self.get_frame_files())
+        self.cur_size = sum(size for _, size, _ in frame_files)
+        for _, size, path in frame_files:
+            if self.cur_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # removed by another worker
+            self.cur_size -= size
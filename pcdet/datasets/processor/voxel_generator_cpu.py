@@ -0,0 +1,123 @@
+"""
+Multithreaded voxelization on the CPU with numba, same outputs as the CPU voxel generators of spconv
+(VoxelGeneratorV2 / Point2VoxelCPU3d): voxels in the order of their first point, the first
+max_num_points_per_voxel points of each voxel, and no new voxel once max_num_voxels are created.
+"""
+import numba
+import numpy as np
+
+
+@numba.jit(nopython=True, parallel=True)
+def points_to_voxel_keys(points, vsize, coors_min, grid_size, keys):
+    # linear (z, y, x) index of the voxel of each point, -1 outside of the range
+    for i in numba.prange(points.shape[0]):
+        key = 0
+        for j in range(2, -1, -1):
+            c = int(np.floor((points[i, j] - coors_min[j]) / vsize[j]))
+            if c < 0 or c >= grid_size[j]:
+                key = -1
+                break
+            key = key * grid_size[j] + c
+        keys[i] = key
+
+
+@numba.jit(nopython=True)
+def assign_points_to_voxels(keys, max_num_points, max_num_voxels, voxel_keys, num_points, point_voxel_ids,
+                            point_slots):
+    # count pass, sequential to keep the voxel order and the kept points of spconv
+    # open addressing hash table of the voxel keys, at most half full
+    num_bits = 10
+    while (1 << num_bits) < 2 * keys.shape[0]:
+        num_bits += 1
+    mask = (1 << num_bits) - 1
+    shift = np.uint64(64 - num_bits)
+    table_keys = np.full(1 << num_bits, -1, dtype=np.int64)
+    table_voxel_ids = np.zeros(1 << num_bits, dtype=np.int64)
+
+    num_voxels = 0
+    for i in range(keys.shape[0]):
+        point_voxel_ids[i] = -1
+        key = keys[i]
+        if key < 0:
+            continue
+        # fibonacci hashing
+        h = np.int64((np.uint64(key) * np.uint64(11400714819323198485)) >> shift)
+        voxel_id = -1
+        while True:
+            if table_keys[h] == key:
+                voxel_id = table_voxel_ids[h]
+                break
+            if table_keys[h] == -1:
+                if num_voxels < max_num_voxels:
+                    table_keys[h] = key
+                    table_voxel_ids[h] = num_voxels
+                    voxel_keys[num_voxels] = key
+                    voxel_id = num_voxels
+                    num_voxels += 1
+                break
+            h = (h + 1) & mask
+        if voxel_id < 0 or num_points[voxel_id] >= max_num_points:
+            continue
+        point_voxel_ids[i] = voxel_id
+        point_slots[i] = num_points[voxel_id]
+        num_points[voxel_id] += 1
+    return num_voxels
+
+
+@numba.jit(nopython=True, parallel=True)
+def scatter_points_to_voxels(points, point_voxel_ids, point_slots, voxel_keys, grid_size, voxels, coordinates):
+    # scatter pass, every point has its own slot
+    for i in numba.prange(points.shape[0]):
+        voxel_id = point_voxel_ids[i]
+        if voxel_id < 0:
+            continue
+        for j in range(voxels.shape[2]):
+            voxels[voxel_id, point_slots[i], j] = points[i, j]
+    for k in numba.prange(coordinates.shape[0]):
+        key = voxel_keys[k]
+        coordinates[k, 2] = key % grid_size[0]
+        key //= grid_size[0]
+        coordinates[k, 1] = key % grid_size[1]
+        coordinates[k, 0] = key // grid_size[1]
+
+
+class VoxelGeneratorCPU(object):
+    def __init__(self, vsize_xyz, coors_range_xyz, num_point_features, max_num_points_per_voxel, max_num_voxels):
+        self.vsize = np.array(vsize_xyz, dtype=np.float32)
+        self.coors_range = np.array(coors_range_xyz, dtype=np.float32)
+        self.grid_size = np.round((self.coors_range[3:6] - self.coors_range[0:3]) / self.vsize).astype(np.int64)
+        self.num_point_features = num_point_features
+        self.max_num_points_per_voxel = max_num_points_per_voxel
+        self.max_num_voxels = max_num_voxels
+
+    def generate(self, points):
+        """
+        Args:
+            points: (N, num_point_features)
+        Returns:
+            voxels: (num_voxels, max_num_points_per_voxel, num_point_features), zero padded
+            coordinates: (num_voxels, 3) int32, [z, y, x] voxel indices
+            num_points: (num_voxels) int32
+        """
+        points = np.ascontiguousarray(points[:, :self.num_point_features], dtype=np.float32)
+        num_all_points = points.shape[0]
+        max_num_voxels = min(self.max_num_voxels, num_all_points)
+
+        keys = np.empty(num_all_points, dtype=np.int64)
+        points_to_voxel_keys(points, self.vsize, self.coors_range[0:3], self.grid_size, keys)
+
+        voxel_keys = np.empty(max_num_voxels, dtype=np.int64)
+        num_points = np.zeros(max_num_voxels, dtype=np.int32)
+        point_voxel_ids = np.empty(num_all_points, dtype=np.int64)
+        point_slots = np.empty(num_all_points, dtype=np.int64)
+        num_voxels = assign_points_to_voxels(
+            keys, self.max_num_points_per_voxel, max_num_voxels, voxel_keys, num_points, point_voxel_ids,
+            point_slots
+        )
+
+        voxels = np.zeros((num_voxels, self.max_num_points_per_voxel, self.num_point_features), dtype=np.float32)
+        coordinates = np.empty((num_voxels, 3), dtype=np.int32)
+        scatter_points_to_voxels(
+            points, point_voxel_ids, point_slots, voxel_keys[:num_voxels], self.grid_size, voxels, coordinates
+        )
+        return voxels, coordinates, num_points[:num_voxels]
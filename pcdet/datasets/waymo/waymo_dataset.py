@@ -9,11 +9,10 @@ import copy
 import numpy as np
 import torch
 import multiprocessing
-import SharedArray
-import torch.distributed as dist
 from tqdm import tqdm
 from pathlib import Path
 from functools import partial
+from collections import OrderedDict
 
 from ...ops.roiaware_pool3d import roiaware_pool3d_utils
 from ...utils import box_utils, common_utils
@@ -45,6 +44,21 @@ class WaymoDataset(DatasetTemplate):
         else:
             self.pred_boxes_dict = {}
 
+        # points of the recently loaded frames of each dataloader worker, shared by the samples of a sequence
+        self.frame_cache = OrderedDict()
+        sequence_cfg = self.dataset_cfg.get('SEQUENCE_CONFIG', None)
+        if sequence_cfg is not None and sequence_cfg.ENABLED:
+            self.frame_cache_size = sequence_cfg.get(
+                'FRAME_CACHE_SIZE', sequence_cfg.SAMPLE_OFFSET[1] - sequence_cfg.SAMPLE_OFFSET[0] + 1
+            )
+        else:
+            self.frame_cache_size = 0
+
+    def __getstate__(self):
+        d = super().__getstate__()
+        d['frame_cache'] = OrderedDict()
+        return d
+
     def set_split(self, split):
         super().__init__(
             dataset_cfg=self.dataset_cfg, class_names=self.class_names, training=self.training,
@@ -111,48 +125,30 @@ class WaymoDataset(DatasetTemplate):
         self.logger.info(f'Predicted boxes has been loaded, total sequences: {len(pred_boxes_dict)}')
         return pred_boxes_dict
 
+    def get_shared_memory_infos(self):
+        return self.infos[:self.shared_memory_file_limit] \
+            if self.shared_memory_file_limit < len(self.infos) else self.infos
+
     def load_data_to_shared_memory(self):
         self.logger.info(f'Loading training data to shared memory (file limit={self.shared_memory_file_limit})')
 
-        cur_rank, num_gpus = common_utils.get_dist_info()
-        all_infos = self.infos[:self.shared_memory_file_limit] \
-            if self.shared_memory_file_limit < len(self.infos) else self.infos
-        cur_infos = all_infos[cur_rank::num_gpus]
-        for info in cur_infos:
-            pc_info = info['point_cloud']
-            sequence_name = pc_info['lidar_sequence']
-            sample_idx = pc_info['sample_idx']
-
-            sa_key = f'{sequence_name}___{sample_idx}'
-            if os.path.exists(f"/dev/shm/{sa_key}"):
-                continue
+        all_infos = self.get_shared_memory_infos()
 
-            points = self.get_lidar(sequence_name, sample_idx)
-            common_utils.sa_create(f"shm://{sa_key}", points)
+        def get_frame(k):
+            pc_info = all_infos[k]['point_cloud']
+            return pc_info['lidar_sequence'], pc_info['sample_idx']
 
-        dist.barrier()
+        # the points of all the frames in one segment, sample k is shared_point_pool[k]
+        self.shared_point_pool = common_utils.SharedPointPool.create(
+            name=f'{self.dataset_cfg.PROCESSED_DATA_TAG}___{self.split}___points', num_arrays=len(all_infos),
+            num_features=5, load_func=lambda k: self.get_lidar(*get_frame(k)),
+            num_points_func=lambda k: self.get_lidar_num_points(*get_frame(k))
+        )
         self.logger.info('Training data has been saved to shared memory')
 
     def clean_shared_memory(self):
         self.logger.info(f'Clean training data from shared memory (file limit={self.shared_memory_file_limit})')
-
-        cur_rank, num_gpus = common_utils.get_dist_info()
-        all_infos = self.infos[:self.shared_memory_file_limit] \
-            if self.shared_memory_file_limit < len(self.infos) else self.infos
-        cur_infos = all_infos[cur_rank::num_gpus]
-        for info in cur_infos:
-            pc_info = info['point_cloud']
-            sequence_name = pc_info['lidar_sequence']
-            sample_idx = pc_info['sample_idx']
-
-            sa_key = f'{sequence_name}___{sample_idx}'
-            if not os.path.exists(f"/dev/shm/{sa_key}"):
-                continue
-
-            SharedArray.delete(f"shm://{sa_key}")
-
-        if num_gpus > 1:
-            dist.barrier()
+        self.shared_point_pool.delete()
         self.logger.info('Training data has been deleted from shared memory')
 
     @staticmethod
@@ -207,6 +203,32 @@ class WaymoDataset(DatasetTemplate):
                 points_all[:, dim_idx] = np.tanh(points_all[:, dim_idx])
         return points_all
 
+    def get_lidar_num_points(self, sequence_name, sample_idx):
+        # number of points of get_lidar, only the NLZ flags are read
+        lidar_file = self.data_path / sequence_name / ('%04d.npy' % sample_idx)
+        point_features = np.load(lidar_file, mmap_mode='r')
+        if self.dataset_cfg.get('DISABLE_NLZ_FLAG_ON_POINTS', False):
+            return point_features.shape[0]
+        return int(np.count_nonzero(point_features[:, 5] == -1))
+
+    def get_cached_lidar(self, sequence_name, sample_idx):
+        """
+        Points of get_lidar, kept in an LRU cache of FRAME_CACHE_SIZE frames. Read-only, copy them before modifying.
+        """
+        key = (sequence_name, sample_idx)
+        points = self.frame_cache.get(key, None)
+        if points is not None:
+            self.frame_cache.move_to_end(key)
+            return points
+
+        points = self.get_lidar(sequence_name, sample_idx)
+        if self.frame_cache_size > 0:
+            points.flags.writeable = False
+            self.frame_cache[key] = points
+            if len(self.frame_cache) > self.frame_cache_size:
+                self.frame_cache.popitem(last=False)
+        return points
+
     @staticmethod
     def transform_prebox_to_current(pred_boxes3d, pose_pre, pose_cur):
         """
@@ -258,10 +280,6 @@ class WaymoDataset(DatasetTemplate):
         Returns:
         """
 
-        def remove_ego_points(points, center_radius=1.0):
-            mask = ~((np.abs(points[:, 0]) < center_radius) & (np.abs(points[:, 1]) < center_radius))
-            return points[mask]
-
         def load_pred_boxes_from_dict(sequence_name, sample_idx):
             """
             boxes: (N, 11)  [x, y, z, dx, dy, dn, raw, vx, vy, score, label]
@@ -276,15 +294,8 @@ class WaymoDataset(DatasetTemplate):
         num_pts_cur = points.shape[0]
         sample_idx_pre_list = np.clip(sample_idx + np.arange(sequence_cfg.SAMPLE_OFFSET[0], sequence_cfg.SAMPLE_OFFSET[1]), 0, 0x7FFFFFFF)
         sample_idx_pre_list = sample_idx_pre_list[::-1]
-
-        if sequence_cfg.get('ONEHOT_TIMESTAMP', False):
-            onehot_cur = np.zeros((points.shape[0], len(sample_idx_pre_list) + 1)).astype(points.dtype)
-            onehot_cur[:, 0] = 1
-            points = np.hstack([points, onehot_cur])
-        else:
-            points = np.hstack([points, np.zeros((points.shape[0], 1)).astype(points.dtype)])
-        points_pre_all = []
-        num_points_pre = []
+        onehot_timestamp = sequence_cfg.get('ONEHOT_TIMESTAMP', False)
+        num_time_features = len(sample_idx_pre_list) + 1 if onehot_timestamp else 1
 
         pose_all = [pose_cur]
         pred_boxes_all = []
@@ -293,35 +304,46 @@ class WaymoDataset(DatasetTemplate):
             pred_boxes_all.append(pred_boxes)
 
         sequence_info = self.seq_name_to_infos[sequence_name]
+        points_pre_list = [self.get_cached_lidar(sequence_name, sample_idx_pre) for sample_idx_pre in sample_idx_pre_list]
 
-        for idx, sample_idx_pre in enumerate(sample_idx_pre_list):
+        # the points of all the frames and their time features are written into one buffer, sized before the
+        # ego points of the previous frames are removed and trimmed at the end
+        num_features = points.shape[1]
+        buffer_size = num_pts_cur + sum(points_pre.shape[0] for points_pre in points_pre_list)
+        alloc = np.zeros if onehot_timestamp else np.empty
+        points_all = alloc((buffer_size, num_features + num_time_features), dtype=np.float32)
+        points_all[:num_pts_cur, :num_features] = points
+        points_all[:num_pts_cur, num_features] = 1 if onehot_timestamp else 0
 
-            points_pre = self.get_lidar(sequence_name, sample_idx_pre)
+        num_points_pre = []
+        pose_cur_inv = np.linalg.inv(pose_cur)
+        cur_idx = num_pts_cur
+        for idx, (sample_idx_pre, points_pre) in enumerate(zip(sample_idx_pre_list, points_pre_list)):
             pose_pre = sequence_info[sample_idx_pre]['pose'].reshape((4, 4))
-            expand_points_pre = np.concatenate([points_pre[:, :3], np.ones((points_pre.shape[0], 1))], axis=-1)
-            points_pre_global = np.dot(expand_points_pre, pose_pre.T)[:, :3]
-            expand_points_pre_global = np.concatenate([points_pre_global, np.ones((points_pre_global.shape[0], 1))], axis=-1)
-            points_pre2cur = np.dot(expand_points_pre_global, np.linalg.inv(pose_cur.T))[:, :3]
-            points_pre = np.concatenate([points_pre2cur, points_pre[:, 3:]], axis=-1)
-            if sequence_cfg.get('ONEHOT_TIMESTAMP', False):
-                onehot_vector = np.zeros((points_pre.shape[0], len(sample_idx_pre_list) + 1))
-                onehot_vector[:, idx + 1] = 1
-                points_pre = np.hstack([points_pre, onehot_vector])
+            # pre -> global -> cur in a single transform
+            pose_pre2cur = (pose_cur_inv @ pose_pre).astype(np.float32)
+            xyz_pre2cur = points_pre[:, :3] @ pose_pre2cur[:3, :3].T + pose_pre2cur[:3, 3]
+            # remove ego points, take is faster than a boolean mask
+            keep_idx = np.flatnonzero(~((np.abs(xyz_pre2cur[:, 0]) < 1.0) & (np.abs(xyz_pre2cur[:, 1]) < 1.0)))
+            num_keep = keep_idx.shape[0]
+
+            cur_points = points_all[cur_idx:cur_idx + num_keep]
+            cur_points[:, :3] = xyz_pre2cur.take(keep_idx, axis=0)
+            cur_points[:, 3:num_features] = points_pre[:, 3:].take(keep_idx, axis=0)
+            if onehot_timestamp:
+                cur_points[:, num_features + idx + 1] = 1
             else:
-                # add timestamp
-                points_pre = np.hstack([points_pre, 0.1 * (sample_idx - sample_idx_pre) * np.ones((points_pre.shape[0], 1)).astype(points_pre.dtype)])  # one frame 0.1s
-            points_pre = remove_ego_points(points_pre, 1.0)
-            points_pre_all.append(points_pre)
-            num_points_pre.append(points_pre.shape[0])
+                cur_points[:, num_features] = 0.1 * (sample_idx - sample_idx_pre)  # one frame 0.1s
+            cur_idx += num_keep
+            num_points_pre.append(num_keep)
             pose_all.append(pose_pre)
 
             if load_pred_boxes:
-                pose_pre = sequence_info[sample_idx_pre]['pose'].reshape((4, 4))
                 pred_boxes = load_pred_boxes_from_dict(sequence_name, sample_idx_pre)
                 pred_boxes = self.transform_prebox_to_current(pred_boxes, pose_pre, pose_cur)
                 pred_boxes_all.append(pred_boxes)
 
-        points = np.concatenate([points] + points_pre_all, axis=0).astype(np.float32)
+        points = points_all[:cur_idx]
         num_points_all = np.array([num_pts_cur] + num_points_pre).astype(np.int32)
         poses = np.concatenate(pose_all, axis=0).astype(np.float32)
 
@@ -353,10 +375,11 @@ class WaymoDataset(DatasetTemplate):
             'sample_idx': sample_idx
         }
         if self.use_shared_memory and index < self.shared_memory_file_limit:
-            sa_key = f'{sequence_name}___{sample_idx}'
-            points = SharedArray.attach(f"shm://{sa_key}").copy()
+            # read-only view, copied by the data augmentor before the augmentations modify it
+            points = self.shared_point_pool[index]
         else:
-            points = self.get_lidar(sequence_name, sample_idx)
+            # read-only only with SEQUENCE_CONFIG, copied into the points of all the frames by get_sequence_data
+            points = self.get_cached_lidar(sequence_name, sample_idx)
 
         if self.dataset_cfg.get('SEQUENCE_CONFIG', None) is not None and self.dataset_cfg.SEQUENCE_CONFIG.ENABLED:
             points, num_points_all, sample_idx_pre_list, poses, pred_boxes, pred_scores, pred_labels = self.get_sequence_data(
@@ -5,13 +5,6 @@ import torch
 
 from .detectors import build_detector
 
-try:
-    import kornia
-except:
-    pass 
-    # print('Warning: kornia is not installed. This package is only required by CaDDN')
-
-
 
 def build_network(model_cfg, num_class, dataset):
     model = build_detector(
@@ -21,19 +14,25 @@ def build_network(model_cfg, num_class, dataset):
 
 
 def load_data_to_gpu(batch_dict):
+    load_data_to_device(batch_dict, device=torch.device('cuda'))
+
+
+def load_data_to_device(batch_dict, device):
     for key, val in batch_dict.items():
         if key == 'camera_imgs':
-            batch_dict[key] = val.cuda()
+            batch_dict[key] = val.to(device)
         elif not isinstance(val, np.ndarray):
             continue
         elif key in ['frame_id', 'metadata', 'calib', 'image_paths','ori_shape','img_process_infos']:
             continue
         elif key in ['images']:
-            batch_dict[key] = kornia.image_to_tensor(val).float().cuda().contiguous()
+            # only required by CaDDN, imported here as it is slow to import
+            import kornia
+            batch_dict[key] = kornia.image_to_tensor(val).float().to(device).contiguous()
         elif key in ['image_shape']:
-            batch_dict[key] = torch.from_numpy(val).int().cuda()
+            batch_dict[key] = torch.from_numpy(val).int().to(device)
         else:
-            batch_dict[key] = torch.from_numpy(val).float().cuda()
+            batch_dict[key] = torch.from_numpy(val).float().to(device)
 
 
 def model_fn_decorator():
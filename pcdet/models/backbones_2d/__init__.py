@@ -1,7 +1,8 @@
-from .base_bev_backbone import BaseBEVBackbone, BaseBEVBackboneV1, BaseBEVResBackbone
+from ...utils import common_utils
 
-__all__ = {
-    'BaseBEVBackbone': BaseBEVBackbone,
-    'BaseBEVBackboneV1': BaseBEVBackboneV1,
-    'BaseBEVResBackbone': BaseBEVResBackbone,
-}
+__all__ = common_utils.LazyRegistry(__name__, {
+    'BaseBEVBackbone': ('.base_bev_backbone', 'BaseBEVBackbone'),
+    'BaseBEVBackboneV1': ('.base_bev_backbone', 'BaseBEVBackboneV1'),
+    'BaseBEVResBackbone': ('.base_bev_backbone', 'BaseBEVResBackbone'),
+})
+__getattr__ = __all__.module_getattr
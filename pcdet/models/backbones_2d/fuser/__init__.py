@@ -1,4 +1,6 @@
-from .convfuser import ConvFuser
-__all__ = {
-    'ConvFuser':ConvFuser
-}
\ No newline at end of file
+from ....utils import common_utils
+
+__all__ = common_utils.LazyRegistry(__name__, {
+    'ConvFuser': ('.convfuser', 'ConvFuser'),
+})
+__getattr__ = __all__.module_getattr
@@ -1,10 +1,9 @@
-from .height_compression import HeightCompression
-from .pointpillar_scatter import PointPillarScatter, PointPillarScatter3d
-from .conv2d_collapse import Conv2DCollapse
+from ....utils import common_utils
 
-__all__ = {
-    'HeightCompression': HeightCompression,
-    'PointPillarScatter': PointPillarScatter,
-    'Conv2DCollapse': Conv2DCollapse,
-    'PointPillarScatter3d': PointPillarScatter3d,
-}
+__all__ = common_utils.LazyRegistry(__name__, {
+    'HeightCompression': ('.height_compression', 'HeightCompression'),
+    'PointPillarScatter': ('.pointpillar_scatter', 'PointPillarScatter'),
+    'Conv2DCollapse': ('.conv2d_collapse', 'Conv2DCollapse'),
+    'PointPillarScatter3d': ('.pointpillar_scatter', 'PointPillarScatter3d'),
+})
+__getattr__ = __all__.module_getattr
@@ -1,22 +1,16 @@
-from .pointnet2_backbone import PointNet2Backbone, PointNet2MSG
-from .spconv_backbone import VoxelBackBone8x, VoxelResBackBone8x
-from .spconv_backbone_2d import PillarBackBone8x, PillarRes18BackBone8x
-from .spconv_backbone_focal import VoxelBackBone8xFocal
-from .spconv_backbone_voxelnext import VoxelResBackBone8xVoxelNeXt
-from .spconv_backbone_voxelnext2d import VoxelResBackBone8xVoxelNeXt2D
-from .spconv_unet import UNetV2
-from .dsvt import DSVT
+from ...utils import common_utils
 
-__all__ = {
-    'VoxelBackBone8x': VoxelBackBone8x,
-    'UNetV2': UNetV2,
-    'PointNet2Backbone': PointNet2Backbone,
-    'PointNet2MSG': PointNet2MSG,
-    'VoxelResBackBone8x': VoxelResBackBone8x,
-    'VoxelBackBone8xFocal': VoxelBackBone8xFocal,
-    'VoxelResBackBone8xVoxelNeXt': VoxelResBackBone8xVoxelNeXt,
-    'VoxelResBackBone8xVoxelNeXt2D': VoxelResBackBone8xVoxelNeXt2D,
-    'PillarBackBone8x': PillarBackBone8x,
-    'PillarRes18BackBone8x': PillarRes18BackBone8x,
-    'DSVT': DSVT,
-}
+__all__ = common_utils.LazyRegistry(__name__, {
+    'VoxelBackBone8x': ('.spconv_backbone', 'VoxelBackBone8x'),
+    'UNetV2': ('.spconv_unet', 'UNetV2'),
+    'PointNet2Backbone': ('.pointnet2_backbone', 'PointNet2Backbone'),
+    'PointNet2MSG': ('.pointnet2_backbone', 'PointNet2MSG'),
+    'VoxelResBackBone8x': ('.spconv_backbone', 'VoxelResBackBone8x'),
+    'VoxelBackBone8xFocal': ('.spconv_backbone_focal', 'VoxelBackBone8xFocal'),
+    'VoxelResBackBone8xVoxelNeXt': ('.spconv_backbone_voxelnext', 'VoxelResBackBone8xVoxelNeXt'),
+    'VoxelResBackBone8xVoxelNeXt2D': ('.spconv_backbone_voxelnext2d', 'VoxelResBackBone8xVoxelNeXt2D'),
+    'PillarBackBone8x': ('.spconv_backbone_2d', 'PillarBackBone8x'),
+    'PillarRes18BackBone8x': ('.spconv_backbone_2d', 'PillarRes18BackBone8x'),
+    'DSVT': ('.dsvt', 'DSVT'),
+})
+__getattr__ = __all__.module_getattr
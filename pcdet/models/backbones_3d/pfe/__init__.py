@@ -1,5 +1,6 @@
-from .voxel_set_abstraction import VoxelSetAbstraction
+from ....utils import common_utils
 
-__all__ = {
-    'VoxelSetAbstraction': VoxelSetAbstraction
-}
+__all__ = common_utils.LazyRegistry(__name__, {
+    'VoxelSetAbstraction': ('.voxel_set_abstraction', 'VoxelSetAbstraction'),
+})
+__getattr__ = __all__.module_getattr
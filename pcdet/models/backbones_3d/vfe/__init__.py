@@ -1,18 +1,13 @@
-from .mean_vfe import MeanVFE
-from .pillar_vfe import PillarVFE
-from .dynamic_mean_vfe import DynamicMeanVFE
-from .dynamic_pillar_vfe import DynamicPillarVFE, DynamicPillarVFESimple2D
-from .dynamic_voxel_vfe import DynamicVoxelVFE
-from .image_vfe import ImageVFE
-from .vfe_template import VFETemplate
+from ....utils import common_utils
 
-__all__ = {
-    'VFETemplate': VFETemplate,
-    'MeanVFE': MeanVFE,
-    'PillarVFE': PillarVFE,
-    'ImageVFE': ImageVFE,
-    'DynMeanVFE': DynamicMeanVFE,
-    'DynPillarVFE': DynamicPillarVFE,
-    'DynamicPillarVFESimple2D': DynamicPillarVFESimple2D,
-    'DynamicVoxelVFE': DynamicVoxelVFE,
-}
+__all__ = common_utils.LazyRegistry(__name__, {
+    'VFETemplate': ('.vfe_template', 'VFETemplate'),
+    'MeanVFE': ('.mean_vfe', 'MeanVFE'),
+    'PillarVFE': ('.pillar_vfe', 'PillarVFE'),
+    'ImageVFE': ('.image_vfe', 'ImageVFE'),
+    'DynMeanVFE': ('.dynamic_mean_vfe', 'DynamicMeanVFE'),
+    'DynPillarVFE': ('.dynamic_pillar_vfe', 'DynamicPillarVFE'),
+    'DynamicPillarVFESimple2D': ('.dynamic_pillar_vfe', 'DynamicPillarVFESimple2D'),
+    'DynamicVoxelVFE': ('.dynamic_voxel_vfe', 'DynamicVoxelVFE'),
+})
+__getattr__ = __all__.module_getattr
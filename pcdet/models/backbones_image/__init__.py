@@ -1,4 +1,6 @@
-from .swin import SwinTransformer
-__all__ = {
-    'SwinTransformer':SwinTransformer,
-}
\ No newline at end of file
+from ...utils import common_utils
+
+__all__ = common_utils.LazyRegistry(__name__, {
+    'SwinTransformer': ('.swin', 'SwinTransformer'),
+})
+__getattr__ = __all__.module_getattr
@@ -1,21 +1,14 @@
-from .anchor_head_multi import AnchorHeadMulti
-from .anchor_head_single import AnchorHeadSingle
-from .anchor_head_template import AnchorHeadTemplate
-from .point_head_box import PointHeadBox
-from .point_head_simple import PointHeadSimple
-from .point_intra_part_head import PointIntraPartOffsetHead
-from .center_head import CenterHead
-from .voxelnext_head import VoxelNeXtHead
-from .transfusion_head import TransFusionHead
+from ...utils import common_utils
 
-__all__ = {
-    'AnchorHeadTemplate': AnchorHeadTemplate,
-    'AnchorHeadSingle': AnchorHeadSingle,
-    'PointIntraPartOffsetHead': PointIntraPartOffsetHead,
-    'PointHeadSimple': PointHeadSimple,
-    'PointHeadBox': PointHeadBox,
-    'AnchorHeadMulti': AnchorHeadMulti,
-    'CenterHead': CenterHead,
-    'VoxelNeXtHead': VoxelNeXtHead,
-    'TransFusionHead': TransFusionHead,
-}
+__all__ = common_utils.LazyRegistry(__name__, {
+    'AnchorHeadTemplate': ('.anchor_head_template', 'AnchorHeadTemplate'),
+    'AnchorHeadSingle': ('.anchor_head_single', 'AnchorHeadSingle'),
+    'PointIntraPartOffsetHead': ('.point_intra_part_head', 'PointIntraPartOffsetHead'),
+    'PointHeadSimple': ('.point_head_simple', 'PointHeadSimple'),
+    'PointHeadBox': ('.point_head_box', 'PointHeadBox'),
+    'AnchorHeadMulti': ('.anchor_head_multi', 'AnchorHeadMulti'),
+    'CenterHead': ('.center_head', 'CenterHead'),
+    'VoxelNeXtHead': ('.voxelnext_head', 'VoxelNeXtHead'),
+    'TransFusionHead': ('.transfusion_head', 'TransFusionHead'),
+})
+__getattr__ = __all__.module_getattr
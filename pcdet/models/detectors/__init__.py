@@ -1,41 +1,25 @@
-from .detector3d_template import Detector3DTemplate
-from .PartA2_net import PartA2Net
-from .point_rcnn import PointRCNN
-from .pointpillar import PointPillar
-from .pv_rcnn import PVRCNN
-from .second_net import SECONDNet
-from .second_net_iou import SECONDNetIoU
-from .caddn import CaDDN
-from .voxel_rcnn import VoxelRCNN
-from .centerpoint import CenterPoint
-from .pv_rcnn_plusplus import PVRCNNPlusPlus
-from .mppnet import MPPNet
-from .mppnet_e2e import MPPNetE2E
-from .pillarnet import PillarNet
-from .voxelnext import VoxelNeXt
-from .transfusion import TransFusion
-from .bevfusion import BevFusion
+from ...utils import common_utils
 
-__all__ = {
-    'Detector3DTemplate': Detector3DTemplate,
-    'SECONDNet': SECONDNet,
-    'PartA2Net': PartA2Net,
-    'PVRCNN': PVRCNN,
-    'PointPillar': PointPillar,
-    'PointRCNN': PointRCNN,
-    'SECONDNetIoU': SECONDNetIoU,
-    'CaDDN': CaDDN,
-    'VoxelRCNN': VoxelRCNN,
-    'CenterPoint': CenterPoint,
-    'PillarNet': PillarNet,
-    'PVRCNNPlusPlus': PVRCNNPlusPlus,
-    'MPPNet': MPPNet,
-    'MPPNetE2E': MPPNetE2E,
-    'PillarNet': PillarNet,
-    'VoxelNeXt': VoxelNeXt,
-    'TransFusion': TransFusion,
-    'BevFusion': BevFusion,
-}
+__all__ = common_utils.LazyRegistry(__name__, {
+    'Detector3DTemplate': ('.detector3d_template', 'Detector3DTemplate'),
+    'SECONDNet': ('.second_net', 'SECONDNet'),
+    'PartA2Net': ('.PartA2_net', 'PartA2Net'),
+    'PVRCNN': ('.pv_rcnn', 'PVRCNN'),
+    'PointPillar': ('.pointpillar', 'PointPillar'),
+    'PointRCNN': ('.point_rcnn', 'PointRCNN'),
+    'SECONDNetIoU': ('.second_net_iou', 'SECONDNetIoU'),
+    'CaDDN': ('.caddn', 'CaDDN'),
+    'VoxelRCNN': ('.voxel_rcnn', 'VoxelRCNN'),
+    'CenterPoint': ('.centerpoint', 'CenterPoint'),
+    'PillarNet': ('.pillarnet', 'PillarNet'),
+    'PVRCNNPlusPlus': ('.pv_rcnn_plusplus', 'PVRCNNPlusPlus'),
+    'MPPNet': ('.mppnet', 'MPPNet'),
+    'MPPNetE2E': ('.mppnet_e2e', 'MPPNetE2E'),
+    'VoxelNeXt': ('.voxelnext', 'VoxelNeXt'),
+    'TransFusion': ('.transfusion', 'TransFusion'),
+    'BevFusion': ('.bevfusion', 'BevFusion'),
+})
+__getattr__ = __all__.module_getattr
 
 
 def build_detector(model_cfg, num_class, dataset):
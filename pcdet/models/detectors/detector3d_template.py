@@ -193,6 +193,9 @@ class Detector3DTemplate(nn.Module):
 
         """
         post_process_cfg = self.model_cfg.POST_PROCESSING
+        if post_process_cfg.NMS_CONFIG.get('BATCHED_NMS', False) and batch_dict.get('batch_index', None) is None:
+            return self.post_processing_batched_nms(batch_dict)
+
         batch_size = batch_dict['batch_size']
         recall_dict = {}
         pred_dicts = []
@@ -283,6 +286,88 @@ class Detector3DTemplate(nn.Module):
 
         return pred_dicts, recall_dict
 
+    def post_processing_batched_nms(self, batch_dict):
+        """
+        Same outputs as post_processing, with one NMS call for the whole batch, see
+        model_nms_utils.batched_class_aware_nms
+        Args:
+            batch_dict: see post_processing, without batch_index
+
+        Returns:
+
+        """
+        post_process_cfg = self.model_cfg.POST_PROCESSING
+        batch_box_preds = batch_dict['batch_box_preds']
+        assert batch_box_preds.shape.__len__() == 3
+
+        if not isinstance(batch_dict['batch_cls_preds'], list):
+            cls_preds = batch_dict['batch_cls_preds']
+            src_cls_preds = cls_preds
+            assert cls_preds.shape[2] in [1, self.num_class]
+
+            if not batch_dict['cls_preds_normalized']:
+                cls_preds = torch.sigmoid(cls_preds)
+        else:
+            cls_preds = batch_dict['batch_cls_preds']
+            src_cls_preds = cls_preds
+            if not batch_dict['cls_preds_normalized']:
+                cls_preds = [torch.sigmoid(x) for x in cls_preds]
+
+        if post_process_cfg.NMS_CONFIG.MULTI_CLASSES_NMS:
+            if not isinstance(cls_preds, list):
+                cls_preds = [cls_preds]
+                multihead_label_mapping = [torch.arange(1, self.num_class, device=cls_preds[0].device)]
+            else:
+                multihead_label_mapping = batch_dict['multihead_label_mapping']
+
+            batch_results = model_nms_utils.batched_multi_classes_nms(
+                cls_scores=cls_preds, box_preds=batch_box_preds,
+                nms_config=post_process_cfg.NMS_CONFIG,
+                score_thresh=post_process_cfg.SCORE_THRESH,
+                label_mappings=multihead_label_mapping
+            )
+        else:
+            cls_preds, label_preds = torch.max(cls_preds, dim=-1)
+            if batch_dict.get('has_class_labels', False):
+                label_key = 'roi_labels' if 'roi_labels' in batch_dict else 'batch_pred_labels'
+                label_preds = batch_dict[label_key]
+            else:
+                label_preds = label_preds + 1
+            batch_selected, batch_selected_scores = model_nms_utils.batched_class_agnostic_nms(
+                box_scores=cls_preds, box_preds=batch_box_preds,
+                nms_config=post_process_cfg.NMS_CONFIG,
+                score_thresh=post_process_cfg.SCORE_THRESH
+            )
+
+            if post_process_cfg.OUTPUT_RAW_SCORE:
+                max_cls_preds, _ = torch.max(src_cls_preds, dim=-1)
+                batch_selected_scores = [
+                    max_cls_preds[index][selected] for index, selected in enumerate(batch_selected)
+                ]
+
+            batch_results = [
+                (selected_scores, label_preds[index][selected], batch_box_preds[index][selected])
+                for index, (selected, selected_scores) in enumerate(zip(batch_selected, batch_selected_scores))
+            ]
+
+        recall_dict = {}
+        pred_dicts = []
+        for index, (final_scores, final_labels, final_boxes) in enumerate(batch_results):
+            recall_dict = self.generate_recall_record(
+                box_preds=final_boxes if 'rois' not in batch_dict else batch_box_preds[index],
+                recall_dict=recall_dict, batch_index=index, data_dict=batch_dict,
+                thresh_list=post_process_cfg.RECALL_THRESH_LIST
+            )
+
+            record_dict = {
+                'pred_boxes': final_boxes,
+                'pred_scores': final_scores,
+                'pred_labels': final_labels
+            }
+            pred_dicts.append(record_dict)
+
+        return pred_dicts, recall_dict
+
     @staticmethod
     def generate_recall_record(box_preds, recall_dict, batch_index, data_dict=None, thresh_list=None):
         if 'gt_boxes' not in data_dict:
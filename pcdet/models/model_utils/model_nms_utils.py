@@ -1,7 +1,11 @@
+import math
+
 import torch
 
 from ...ops.iou3d_nms import iou3d_nms_utils
 
+MAX_CUDA_NMS_BOXES = 20000
+
 
 def class_agnostic_nms(box_scores, box_preds, nms_config, score_thresh=None):
     src_box_scores = box_scores
@@ -66,6 +70,173 @@ def multi_classes_nms(cls_scores, box_preds, nms_config, score_thresh=None):
     return pred_scores, pred_labels, pred_boxes
 
 
+def batched_class_aware_nms(box_scores, box_preds, box_groups, num_groups, nms_config):
+    """
+    One NMS call for all the groups (e.g. the (sample, class) pairs of a batch): the boxes of each group are
+    moved to their own cell of a grid in bev, far enough apart that the boxes of different groups never overlap.
+    Args:
+        box_scores: (N)
+        box_preds: (N, 7 + C)
+        box_groups: (N) int64 in [0, num_groups)
+        num_groups:
+        nms_config:
+
+    Returns:
+        selected: (K) sorted by group, then by descending score, at most NMS_POST_MAXSIZE per group
+    """
+    if box_scores.shape[0] == 0:
+        return box_groups.new_zeros(0)
+
+    counts = torch.bincount(box_groups, minlength=num_groups)
+    if counts.max() > nms_config.NMS_PRE_MAXSIZE or (box_preds.is_cuda and box_scores.shape[0] > MAX_CUDA_NMS_BOXES):
+        # NMS_PRE_MAXSIZE highest scores of each group, in (group, descending score) order
+        order = torch.sort(box_scores, descending=True)[1]
+        order = order[torch.sort(box_groups[order], stable=True)[1]]
+        starts = torch.cumsum(counts, dim=0) - counts
+        rank = torch.arange(order.shape[0], device=order.device) - starts[box_groups[order]]
+        candidates = order[rank < nms_config.NMS_PRE_MAXSIZE]
+    else:
+        candidates = torch.arange(box_scores.shape[0], device=box_scores.device)
+    groups = box_groups[candidates]
+
+    # the boxes of a group lie within [-extent, extent] in x and y, the grid is centered on the origin
+    # to keep the offset coordinates small, as the iou kernels run in float32
+    boxes_for_nms = box_preds[candidates, 0:7].clone()
+    extent = boxes_for_nms[:, 0:2].abs().max() + boxes_for_nms[:, 3:5].max()
+    cell_size = 2 * extent + 1
+    grid_size = int(math.ceil(math.sqrt(num_groups)))
+    boxes_for_nms[:, 0] += (groups % grid_size - grid_size // 2).to(boxes_for_nms.dtype) * cell_size
+    boxes_for_nms[:, 1] += (groups // grid_size - grid_size // 2).to(boxes_for_nms.dtype) * cell_size
+
+    nms_func = getattr(iou3d_nms_utils, nms_config.NMS_TYPE)
+    scores_for_nms = box_scores[candidates]
+    if boxes_for_nms.is_cuda and candidates.shape[0] > MAX_CUDA_NMS_BOXES:
+        # the suppression mask of the CUDA NMS grows with the square of the number of boxes, consecutive
+        # groups (the candidates are sorted by group) are run in chunks of about MAX_CUDA_NMS_BOXES boxes
+        counts = torch.bincount(groups, minlength=num_groups)
+        starts = torch.cumsum(counts, dim=0) - counts
+        chunk_ends = torch.cumsum(torch.bincount(starts[groups] // MAX_CUDA_NMS_BOXES), dim=0).tolist()
+        keep_idx, chunk_start = [], 0
+        for chunk_end in chunk_ends:
+            if chunk_end > chunk_start:
+                cur_keep_idx, _ = nms_func(
+                    boxes_for_nms[chunk_start:chunk_end], scores_for_nms[chunk_start:chunk_end],
+                    nms_config.NMS_THRESH, **nms_config
+                )
+                keep_idx.append(cur_keep_idx + chunk_start)
+            chunk_start = chunk_end
+        keep_idx = torch.cat(keep_idx, dim=0)
+    else:
+        keep_idx, _ = nms_func(boxes_for_nms, scores_for_nms, nms_config.NMS_THRESH, **nms_config)
+
+    # keep_idx is in descending score order, a stable sort by group keeps that order within each group
+    keep_groups = groups[keep_idx]
+    group_order = torch.sort(keep_groups, stable=True)[1]
+    keep_idx, keep_groups = keep_idx[group_order], keep_groups[group_order]
+    counts = torch.bincount(keep_groups, minlength=num_groups)
+    starts = torch.cumsum(counts, dim=0) - counts
+    rank = torch.arange(keep_idx.shape[0], device=keep_idx.device) - starts[keep_groups]
+    return candidates[keep_idx[rank < nms_config.NMS_POST_MAXSIZE]]
+
+
+def batched_class_agnostic_nms(box_scores, box_preds, nms_config, score_thresh=None):
+    """
+    class_agnostic_nms of all the samples of a batch with one NMS call
+    Args:
+        box_scores: (B, N)
+        box_preds: (B, N, 7 + C)
+        nms_config:
+        score_thresh:
+
+    Returns:
+        selected: [(K1), (K2), ...] indices into the N boxes of each sample
+        selected_scores: [(K1), (K2), ...]
+    """
+    batch_size, num_boxes = box_scores.shape
+    # NMS_PRE_MAXSIZE highest scores of each sample with one topk, then the score threshold
+    box_scores_nms, indices = torch.topk(box_scores, k=min(nms_config.NMS_PRE_MAXSIZE, num_boxes), dim=1, sorted=False)
+    batch_index = torch.arange(batch_size, device=box_scores.device).view(-1, 1).expand_as(indices)
+    if score_thresh is not None:
+        scores_mask = box_scores_nms >= score_thresh
+        box_scores_nms, indices, batch_index = \
+            box_scores_nms[scores_mask], indices[scores_mask], batch_index[scores_mask]
+    else:
+        box_scores_nms, indices, batch_index = box_scores_nms.view(-1), indices.view(-1), batch_index.reshape(-1)
+
+    keep_idx = batched_class_aware_nms(
+        box_scores_nms, box_preds[batch_index, indices], batch_index, batch_size, nms_config
+    )
+
+    # keep_idx is sorted by sample, one split gives the results of each sample
+    num_selected = torch.bincount(batch_index[keep_idx], minlength=batch_size).tolist()
+    selected = torch.split(indices[keep_idx], num_selected)
+    selected_scores = torch.split(box_scores_nms[keep_idx], num_selected)
+    return selected, selected_scores
+
+
+def batched_multi_classes_nms(cls_scores, box_preds, nms_config, score_thresh=None, label_mappings=None):
+    """
+    multi_classes_nms of all the samples of a batch with one NMS call
+    Args:
+        cls_scores: (B, N, num_class) or [(B, N1, num_class1), (B, N2, num_class2), ...] of the heads
+        box_preds: (B, N, 7 + C) or (B, N1 + N2 + ..., 7 + C)
+        nms_config:
+        score_thresh:
+        label_mappings: [(num_class1), (num_class2), ...] labels of the columns of each head,
+            defaults to the column indices
+
+    Returns:
+        pred_dicts: [(pred_scores, pred_labels, pred_boxes), ...] of each sample, ordered as multi_classes_nms
+    """
+    if not isinstance(cls_scores, list):
+        cls_scores = [cls_scores]
+    if label_mappings is None:
+        label_mappings = [torch.arange(x.shape[2], device=x.device) for x in cls_scores]
+    batch_size = box_preds.shape[0]
+    num_columns = sum([x.shape[2] for x in cls_scores])
+
+    # NMS_PRE_MAXSIZE highest scores of each (sample, column of a head) with one topk per head, then the score
+    # threshold, each (sample, column) pair is a group
+    box_ids, box_scores, box_labels, box_groups = [], [], [], []
+    cur_start_idx, cur_start_column = 0, 0
+    for cur_cls_scores, cur_label_mapping in zip(cls_scores, label_mappings):
+        assert cur_cls_scores.shape[2] == len(cur_label_mapping)
+        cur_num_boxes, cur_num_columns = cur_cls_scores.shape[1:]
+        cur_scores, cur_indices = torch.topk(
+            cur_cls_scores.transpose(1, 2), k=min(nms_config.NMS_PRE_MAXSIZE, cur_num_boxes), dim=2, sorted=False
+        )
+        if score_thresh is not None:
+            cur_batch_index, cur_columns, cur_ranks = (cur_scores >= score_thresh).nonzero(as_tuple=True)
+        else:
+            cur_batch_index, cur_columns, cur_ranks = torch.ones_like(cur_scores, dtype=torch.bool).nonzero(
+                as_tuple=True
+            )
+        box_scores.append(cur_scores[cur_batch_index, cur_columns, cur_ranks])
+        box_labels.append(cur_label_mapping[cur_columns])
+        box_ids.append(
+            cur_batch_index * box_preds.shape[1] + cur_start_idx + cur_indices[cur_batch_index, cur_columns, cur_ranks]
+        )
+        box_groups.append(cur_batch_index * num_columns + cur_start_column + cur_columns)
+        cur_start_idx += cur_num_boxes
+        cur_start_column += cur_num_columns
+
+    box_ids = torch.cat(box_ids, dim=0)
+    box_scores = torch.cat(box_scores, dim=0)
+    box_labels = torch.cat(box_labels, dim=0)
+    box_groups = torch.cat(box_groups, dim=0)
+    box_preds = box_preds.reshape(-1, box_preds.shape[-1])
+    selected = batched_class_aware_nms(
+        box_scores, box_preds[box_ids], box_groups, batch_size * num_columns, nms_config
+    )
+
+    # selected is sorted by sample, one split gives the results of each sample
+    num_selected = torch.bincount(box_groups[selected] // num_columns, minlength=batch_size).tolist()
+    pred_scores = torch.split(box_scores[selected], num_selected)
+    pred_labels = torch.split(box_labels[selected], num_selected)
+    pred_boxes = torch.split(box_preds[box_ids[selected]], num_selected)
+    return list(zip(pred_scores, pred_labels, pred_boxes))
+
+
 def class_specific_nms(box_scores, box_preds, box_labels, nms_config, score_thresh=None):
     """
     Args:
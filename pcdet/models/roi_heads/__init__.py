@@ -1,19 +1,13 @@
-from .partA2_head import PartA2FCHead
-from .pointrcnn_head import PointRCNNHead
-from .pvrcnn_head import PVRCNNHead
-from .second_head import SECONDHead
-from .voxelrcnn_head import VoxelRCNNHead
-from .roi_head_template import RoIHeadTemplate
-from .mppnet_head import MPPNetHead
-from .mppnet_memory_bank_e2e import MPPNetHeadE2E
+from ...utils import common_utils
 
-__all__ = {
-    'RoIHeadTemplate': RoIHeadTemplate,
-    'PartA2FCHead': PartA2FCHead,
-    'PVRCNNHead': PVRCNNHead,
-    'SECONDHead': SECONDHead,
-    'PointRCNNHead': PointRCNNHead,
-    'VoxelRCNNHead': VoxelRCNNHead,
-    'MPPNetHead': MPPNetHead,
-    'MPPNetHeadE2E': MPPNetHeadE2E,
-}
+__all__ = common_utils.LazyRegistry(__name__, {
+    'RoIHeadTemplate': ('.roi_head_template', 'RoIHeadTemplate'),
+    'PartA2FCHead': ('.partA2_head', 'PartA2FCHead'),
+    'PVRCNNHead': ('.pvrcnn_head', 'PVRCNNHead'),
+    'SECONDHead': ('.second_head', 'SECONDHead'),
+    'PointRCNNHead': ('.pointrcnn_head', 'PointRCNNHead'),
+    'VoxelRCNNHead': ('.voxelrcnn_head', 'VoxelRCNNHead'),
+    'MPPNetHead': ('.mppnet_head', 'MPPNetHead'),
+    'MPPNetHeadE2E': ('.mppnet_memory_bank_e2e', 'MPPNetHeadE2E'),
+})
+__getattr__ = __all__.module_getattr
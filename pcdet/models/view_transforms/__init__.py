@@ -1,4 +1,6 @@
-from .depth_lss import DepthLSSTransform
-__all__ = {
-    'DepthLSSTransform': DepthLSSTransform,
-}
\ No newline at end of file
+from ...utils import common_utils
+
+__all__ = common_utils.LazyRegistry(__name__, {
+    'DepthLSSTransform': ('.depth_lss', 'DepthLSSTransform'),
+})
+__getattr__ = __all__.module_getattr
@@ -0,0 +1,276 @@
+"""
+3D IoU Calculation and Rotated NMS on the CPU with numba
+Port of src/iou3d_cpu.cpp and the NMS of src/iou3d_nms_kernel.cu, used by iou3d_nms_utils
+when the iou3d_nms_cuda extension is not built.
+"""
+import math
+
+import numba
+import numpy as np
+
+EPS = 1e-8
+
+
+@numba.jit(nopython=True)
+def cross(p1x, p1y, p2x, p2y, p0x, p0y):
+    return (p1x - p0x) * (p2y - p0y) - (p2x - p0x) * (p1y - p0y)
+
+
+@numba.jit(nopython=True)
+def check_rect_cross(p1x, p1y, p2x, p2y, q1x, q1y, q2x, q2y):
+    return min(p1x, p2x) <= max(q1x, q2x) and min(q1x, q2x) <= max(p1x, p2x) and \
+        min(p1y, p2y) <= max(q1y, q2y) and min(q1y, q2y) <= max(p1y, p2y)
+
+
+@numba.jit(nopython=True)
+def check_in_box2d(box, px, py):
+    # params: box (7) [x, y, z, dx, dy, dz, heading]
+    margin = 1e-2
+    angle_cos, angle_sin = math.cos(-box[6]), math.sin(-box[6])  # rotate the point in the opposite direction of box
+    rot_x = (px - box[0]) * angle_cos + (py - box[1]) * (-angle_sin)
+    rot_y = (px - box[0]) * angle_sin + (py - box[1]) * angle_cos
+    return abs(rot_x) < box[3] / 2 + margin and abs(rot_y) < box[4] / 2 + margin
+
+
+@numba.jit(nopython=True)
+def intersection(p1x, p1y, p0x, p0y, q1x, q1y, q0x, q0y, ans):
+    # fast exclusion
+    if not check_rect_cross(p0x, p0y, p1x, p1y, q0x, q0y, q1x, q1y):
+        return False
+
+    # check cross standing
+    s1 = cross(q0x, q0y, p1x, p1y, p0x, p0y)
+    s2 = cross(p1x, p1y, q1x, q1y, p0x, p0y)
+    s3 = cross(p0x, p0y, q1x, q1y, q0x, q0y)
+    s4 = cross(q1x, q1y, p1x, p1y, q0x, q0y)
+    if not (s1 * s2 > 0 and s3 * s4 > 0):
+        return False
+
+    # calculate intersection of two lines
+    s5 = cross(q1x, q1y, p1x, p1y, p0x, p0y)
+    if abs(s5 - s1) > EPS:
+        ans[0] = (s5 * q0x - s1 * q1x) / (s5 - s1)
+        ans[1] = (s5 * q0y - s1 * q1y) / (s5 - s1)
+    else:
+        a0, b0, c0 = p0y - p1y, p1x - p0x, p0x * p1y - p1x * p0y
+        a1, b1, c1 = q0y - q1y, q1x - q0x, q0x * q1y - q1x * q0y
+        d = a0 * b1 - a1 * b0
+        ans[0] = (b0 * c1 - b1 * c0) / d
+        ans[1] = (a1 * c0 - a0 * c1) / d
+    return True
+
+
+@numba.jit(nopython=True)
+def box_corners(box, corners):
+    # corners (5, 2), the first corner repeated at the end
+    angle_cos, angle_sin = math.cos(box[6]), math.sin(box[6])
+    dx_half, dy_half = box[3] / 2, box[4] / 2
+    signs_x = (-1.0, 1.0, 1.0, -1.0)
+    signs_y = (-1.0, -1.0, 1.0, 1.0)
+    for k in range(4):
+        x, y = signs_x[k] * dx_half, signs_y[k] * dy_half
+        corners[k, 0] = x * angle_cos - y * angle_sin + box[0]
+        corners[k, 1] = x * angle_sin + y * angle_cos + box[1]
+    corners[4] = corners[0]
+
+
+@numba.jit(nopython=True)
+def box_overlap(box_a, box_b, corners_a, corners_b, cross_points, ans):
+    box_corners(box_a, corners_a)
+    box_corners(box_b, corners_b)
+
+    # get intersection of lines
+    cnt = 0
+    center_x, center_y = 0.0, 0.0
+    for i in range(4):
+        for j in range(4):
+            if intersection(corners_a[i + 1, 0], corners_a[i + 1, 1], corners_a[i, 0], corners_a[i, 1],
+                            corners_b[j + 1, 0], corners_b[j + 1, 1], corners_b[j, 0], corners_b[j, 1], ans):
+                cross_points[cnt] = ans
+                center_x += ans[0]
+                center_y += ans[1]
+                cnt += 1
+
+    # check corners
+    for k in range(4):
+        if check_in_box2d(box_a, corners_b[k, 0], corners_b[k, 1]):
+            cross_points[cnt] = corners_b[k]
+            center_x += corners_b[k, 0]
+            center_y += corners_b[k, 1]
+            cnt += 1
+        if check_in_box2d(box_b, corners_a[k, 0], corners_a[k, 1]):
+            cross_points[cnt] = corners_a[k]
+            center_x += corners_a[k, 0]
+            center_y += corners_a[k, 1]
+            cnt += 1
+
+    if cnt == 0:
+        return 0.0
+    center_x /= cnt
+    center_y /= cnt
+
+    # sort the points of polygon by angle around the center
+    for j in range(cnt - 1):
+        for i in range(cnt - j - 1):
+            if math.atan2(cross_points[i, 1] - center_y, cross_points[i, 0] - center_x) > \
+                    math.atan2(cross_points[i + 1, 1] - center_y, cross_points[i + 1, 0] - center_x):
+                tx, ty = cross_points[i, 0], cross_points[i, 1]
+                cross_points[i] = cross_points[i + 1]
+                cross_points[i + 1, 0], cross_points[i + 1, 1] = tx, ty
+
+    # get the overlap areas
+    area = 0.0
+    for k in range(cnt - 1):
+        area += (cross_points[k, 0] - cross_points[0, 0]) * (cross_points[k + 1, 1] - cross_points[0, 1]) - \
+            (cross_points[k + 1, 0] - cross_points[0, 0]) * (cross_points[k, 1] - cross_points[0, 1])
+    return abs(area) / 2.0
+
+
+@numba.jit(nopython=True)
+def iou_bev(box_a, box_b, corners_a, corners_b, cross_points, ans):
+    sa = box_a[3] * box_a[4]
+    sb = box_b[3] * box_b[4]
+    s_overlap = box_overlap(box_a, box_b, corners_a, corners_b, cross_points, ans)
+    return s_overlap / max(sa + sb - s_overlap, EPS)
+
+
+@numba.jit(nopython=True)
+def iou_normal(a, b):
+    left, right = max(a[0] - a[3] / 2, b[0] - b[3] / 2), min(a[0] + a[3] / 2, b[0] + b[3] / 2)
+    top, bottom = max(a[1] - a[4] / 2, b[1] - b[4] / 2), min(a[1] + a[4] / 2, b[1] + b[4] / 2)
+    inter_s = max(right - left, 0.0) * max(bottom - top, 0.0)
+    sa = a[3] * a[4]
+    sb = b[3] * b[4]
+    return inter_s / max(sa + sb - inter_s, EPS)
+
+
+@numba.jit(nopython=True, parallel=True)
+def boxes_overlap_bev_kernel(boxes_a, boxes_b, ans, compute_iou):
+    for i in numba.prange(boxes_a.shape[0]):
+        corners_a = np.zeros((5, 2))
+        corners_b = np.zeros((5, 2))
+        cross_points = np.zeros((24, 2))
+        tmp = np.zeros(2)
+        for j in range(boxes_b.shape[0]):
+            if compute_iou:
+                ans[i, j] = iou_bev(boxes_a[i], boxes_b[j], corners_a, corners_b, cross_points, tmp)
+            else:
+                ans[i, j] = box_overlap(boxes_a[i], boxes_b[j], corners_a, corners_b, cross_points, tmp)
+
+
+@numba.jit(nopython=True)
+def nms_kernel(boxes, thresh, rotated):
+    # greedy suppression in the given order, the same keep list as the bitmask NMS of nms_gpu
+    num_boxes = boxes.shape[0]
+    removed = np.zeros(num_boxes, dtype=np.bool_)
+    keep = np.zeros(num_boxes, dtype=np.int64)
+    corners_a = np.zeros((5, 2))
+    corners_b = np.zeros((5, 2))
+    cross_points = np.zeros((24, 2))
+    tmp = np.zeros(2)
+
+    # radius of the bev circumcircle with the margin of check_in_box2d, boxes whose circles do not
+    # intersect have no overlap
+    margin = 1e-2
+    radius = np.empty(num_boxes)
+    for i in range(num_boxes):
+        radius[i] = math.sqrt((boxes[i, 3] / 2 + margin) ** 2 + (boxes[i, 4] / 2 + margin) ** 2)
+
+    # bev grid with cells of at least the largest diameter, a box only overlaps the boxes of the 3 x 3
+    # cells around its own, so that far apart boxes (e.g. the groups of a batched NMS) are never compared
+    min_x, min_y = boxes[:, 0].min(), boxes[:, 1].min()
+    cell_size = 2 * radius.max()
+    num_x = int((boxes[:, 0].max() - min_x) / cell_size) + 1
+    num_y = int((boxes[:, 1].max() - min_y) / cell_size) + 1
+    while num_x * num_y > 4 * num_boxes:
+        cell_size *= 2
+        num_x = int((boxes[:, 0].max() - min_x) / cell_size) + 1
+        num_y = int((boxes[:, 1].max() - min_y) / cell_size) + 1
+    cell_x = np.empty(num_boxes, dtype=np.int64)
+    cell_y = np.empty(num_boxes, dtype=np.int64)
+    cell_start = np.zeros(num_x * num_y + 1, dtype=np.int64)
+    for i in range(num_boxes):
+        cell_x[i] = int((boxes[i, 0] - min_x) / cell_size)
+        cell_y[i] = int((boxes[i, 1] - min_y) / cell_size)
+        cell_start[cell_y[i] * num_x + cell_x[i] + 1] += 1
+    for k in range(num_x * num_y):
+        cell_start[k + 1] += cell_start[k]
+    # the boxes of each cell in ascending order
+    cell_boxes = np.empty(num_boxes, dtype=np.int64)
+    cell_fill = cell_start[:-1].copy()
+    for i in range(num_boxes):
+        cell = cell_y[i] * num_x + cell_x[i]
+        cell_boxes[cell_fill[cell]] = i
+        cell_fill[cell] += 1
+
+    num_to_keep = 0
+    for i in range(num_boxes):
+        if removed[i]:
+            continue
+        keep[num_to_keep] = i
+        num_to_keep += 1
+        for y in range(max(cell_y[i] - 1, 0), min(cell_y[i] + 2, num_y)):
+            for x in range(max(cell_x[i] - 1, 0), min(cell_x[i] + 2, num_x)):
+                cell = y * num_x + x
+                first = cell_start[cell] + np.searchsorted(cell_boxes[cell_start[cell]:cell_start[cell + 1]], i + 1)
+                for k in range(first, cell_start[cell + 1]):
+                    j = cell_boxes[k]
+                    if removed[j]:
+                        continue
+                    dist_x, dist_y = boxes[i, 0] - boxes[j, 0], boxes[i, 1] - boxes[j, 1]
+                    if dist_x * dist_x + dist_y * dist_y > (radius[i] + radius[j]) ** 2:
+                        continue
+                    if rotated:
+                        iou = iou_bev(boxes[i], boxes[j], corners_a, corners_b, cross_points, tmp)
+                    else:
+                        iou = iou_normal(boxes[i], boxes[j])
+                    if iou > thresh:
+                        removed[j] = True
+    return keep[:num_to_keep]
+
+
+def boxes_overlap_bev_cpu(boxes_a, boxes_b):
+    """
+    Args:
+        boxes_a: (N, 7) [x, y, z, dx, dy, dz, heading], numpy
+        boxes_b: (M, 7) [x, y, z, dx, dy, dz, heading], numpy
+
+    Returns:
+        ans_overlap: (N, M) float32 bev overlap area
+    """
+    ans = np.zeros((boxes_a.shape[0], boxes_b.shape[0]), dtype=np.float32)
+    boxes_overlap_bev_kernel(
+        np.ascontiguousarray(boxes_a, dtype=np.float32), np.ascontiguousarray(boxes_b, dtype=np.float32), ans, False
+    )
+    return ans
+
+
+def boxes_iou_bev_cpu(boxes_a, boxes_b):
+    """
+    Args:
+        boxes_a: (N, 7) [x, y, z, dx, dy, dz, heading], numpy
+        boxes_b: (M, 7) [x, y, z, dx, dy, dz, heading], numpy
+
+    Returns:
+        ans_iou: (N, M) float32
+    """
+    ans = np.zeros((boxes_a.shape[0], boxes_b.shape[0]), dtype=np.float32)
+    boxes_overlap_bev_kernel(
+        np.ascontiguousarray(boxes_a, dtype=np.float32), np.ascontiguousarray(boxes_b, dtype=np.float32), ans, True
+    )
+    return ans
+
+
+def nms_cpu(boxes, thresh, rotated=True):
+    """
+    Args:
+        boxes: (N, 7) [x, y, z, dx, dy, dz, heading], numpy, sorted by descending score
+        thresh: boxes with a bev iou above thresh to a kept box are removed
+        rotated: rotated bev iou as nms_gpu, otherwise axis-aligned iou as nms_normal_gpu
+
+    Returns:
+        keep: (K,) int64 indices into boxes
+    """
+    if boxes.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+    return nms_kernel(np.ascontiguousarray(boxes, dtype=np.float32), float(thresh), rotated)
@@ -6,7 +6,13 @@ All Rights Reserved 2019-2020.
 import torch
 
 from ...utils import common_utils
-from . import iou3d_nms_cuda
+from . import iou3d_nms_cpu
+
+try:
+    from . import iou3d_nms_cuda
+except ImportError:
+    # CPU-only installs: the CPU entry points and the NMS fall back to the numba kernels of iou3d_nms_cpu
+    iou3d_nms_cuda = None
 
 
 def boxes_bev_iou_cpu(boxes_a, boxes_b):
@@ -22,8 +28,11 @@ def boxes_bev_iou_cpu(boxes_a, boxes_b):
     boxes_b, is_numpy = common_utils.check_numpy_to_torch(boxes_b)
     assert not (boxes_a.is_cuda or boxes_b.is_cuda), 'Only support CPU tensors'
     assert boxes_a.shape[1] == 7 and boxes_b.shape[1] == 7
-    ans_iou = boxes_a.new_zeros(torch.Size((boxes_a.shape[0], boxes_b.shape[0])))
-    iou3d_nms_cuda.boxes_iou_bev_cpu(boxes_a.contiguous(), boxes_b.contiguous(), ans_iou)
+    if iou3d_nms_cuda is None:
+        ans_iou = torch.from_numpy(iou3d_nms_cpu.boxes_iou_bev_cpu(boxes_a.numpy(), boxes_b.numpy())).to(boxes_a.dtype)
+    else:
+        ans_iou = boxes_a.new_zeros(torch.Size((boxes_a.shape[0], boxes_b.shape[0])))
+        iou3d_nms_cuda.boxes_iou_bev_cpu(boxes_a.contiguous(), boxes_b.contiguous(), ans_iou)
 
     return ans_iou.numpy() if is_numpy else ans_iou
 
@@ -117,6 +126,38 @@ def boxes_aligned_iou3d_gpu(boxes_a, boxes_b):
     return iou3d
 
 
+def nms_cpu(boxes, scores, thresh, pre_maxsize=None, **kwargs):
+    """
+    Same keep indices as nms_gpu, for CPU tensors or without the iou3d_nms_cuda extension
+    :param boxes: (N, 7) [x, y, z, dx, dy, dz, heading]
+    :param scores: (N)
+    :param thresh:
+    :return:
+    """
+    assert boxes.shape[1] == 7
+    order = scores.sort(0, descending=True)[1]
+    if pre_maxsize is not None:
+        order = order[:pre_maxsize]
+
+    keep = iou3d_nms_cpu.nms_cpu(boxes[order].detach().cpu().numpy(), thresh, rotated=True)
+    return order[torch.from_numpy(keep).to(order.device)].contiguous(), None
+
+
+def nms_normal_cpu(boxes, scores, thresh, **kwargs):
+    """
+    Same keep indices as nms_normal_gpu, for CPU tensors or without the iou3d_nms_cuda extension
+    :param boxes: (N, 7) [x, y, z, dx, dy, dz, heading]
+    :param scores: (N)
+    :param thresh:
+    :return:
+    """
+    assert boxes.shape[1] == 7
+    order = scores.sort(0, descending=True)[1]
+
+    keep = iou3d_nms_cpu.nms_cpu(boxes[order].detach().cpu().numpy(), thresh, rotated=False)
+    return order[torch.from_numpy(keep).to(order.device)].contiguous(), None
+
+
 def nms_gpu(boxes, scores, thresh, pre_maxsize=None, **kwargs):
     """
     :param boxes: (N, 7) [x, y, z, dx, dy, dz, heading]
@@ -124,6 +165,9 @@ def nms_gpu(boxes, scores, thresh, pre_maxsize=None, **kwargs):
     :param thresh:
     :return:
     """
+    if iou3d_nms_cuda is None or not boxes.is_cuda:
+        return nms_cpu(boxes, scores, thresh, pre_maxsize=pre_maxsize, **kwargs)
+
     assert boxes.shape[1] == 7
     order = scores.sort(0, descending=True)[1]
     if pre_maxsize is not None:
@@ -142,6 +186,9 @@ def nms_normal_gpu(boxes, scores, thresh, **kwargs):
     :param thresh:
     :return:
     """
+    if iou3d_nms_cuda is None or not boxes.is_cuda:
+        return nms_normal_cpu(boxes, scores, thresh, **kwargs)
+
     assert boxes.shape[1] == 7
     order = scores.sort(0, descending=True)[1]
 
@@ -0,0 +1,122 @@
+"""
+points_in_boxes on the CPU with numba
+Port of points_in_boxes_cpu of src/roiaware_pool3d.cpp, used by roiaware_pool3d_utils
+when the roiaware_pool3d_cuda extension is not built.
+"""
+import math
+
+import numba
+import numpy as np
+
+
+@numba.jit(nopython=True, parallel=True)
+def points_in_boxes_kernel(boxes, pts, pts_indices):
+    margin = 1e-2
+    for i in numba.prange(boxes.shape[0]):
+        cx, cy, cz = boxes[i, 0], boxes[i, 1], boxes[i, 2]
+        dx, dy, dz = boxes[i, 3], boxes[i, 4], boxes[i, 5]
+        cosa, sina = math.cos(-boxes[i, 6]), math.sin(-boxes[i, 6])
+        for j in range(pts.shape[0]):
+            if abs(pts[j, 2] - cz) > dz / 2.0:
+                continue
+            shift_x, shift_y = pts[j, 0] - cx, pts[j, 1] - cy
+            local_x = shift_x * cosa + shift_y * (-sina)
+            local_y = shift_x * sina + shift_y * cosa
+            if abs(local_x) < dx / 2.0 + margin and abs(local_y) < dy / 2.0 + margin:
+                pts_indices[i, j] = 1
+
+
+def points_in_boxes_cpu(points, boxes):
+    """
+    Args:
+        points: (num_points, 3), numpy
+        boxes: (N, 7) [x, y, z, dx, dy, dz, heading], numpy
+
+    Returns:
+        point_indices: (N, num_points) int32
+    """
+    point_indices = np.zeros((boxes.shape[0], points.shape[0]), dtype=np.int32)
+    points_in_boxes_kernel(
+        np.ascontiguousarray(boxes, dtype=np.float32), np.ascontiguousarray(points, dtype=np.float32), point_indices
+    )
+    return point_indices
+
+
+@numba.jit(nopython=True)
+def build_box_grid(boxes, cell_size, margin):
+    # bev grid over the boxes: cell_boxes[cell_start[c]:cell_start[c + 1]] are the boxes whose circumscribed
+    # square overlaps cell c, in ascending box order
+    num_boxes = boxes.shape[0]
+    radius = np.sqrt(boxes[:, 3] ** 2 + boxes[:, 4] ** 2) / 2.0 + 2 * margin
+    min_x, min_y = (boxes[:, 0] - radius).min(), (boxes[:, 1] - radius).min()
+    num_x = int(((boxes[:, 0] + radius).max() - min_x) // cell_size) + 1
+    num_y = int(((boxes[:, 1] + radius).max() - min_y) // cell_size) + 1
+
+    box_cells = np.zeros((num_boxes, 4), dtype=np.int64)  # x0, x1, y0, y1 (inclusive)
+    cell_count = np.zeros(num_x * num_y + 1, dtype=np.int64)
+    for i in range(num_boxes):
+        box_cells[i, 0] = int((boxes[i, 0] - radius[i] - min_x) // cell_size)
+        box_cells[i, 1] = min(int((boxes[i, 0] + radius[i] - min_x) // cell_size), num_x - 1)
+        box_cells[i, 2] = int((boxes[i, 1] - radius[i] - min_y) // cell_size)
+        box_cells[i, 3] = min(int((boxes[i, 1] + radius[i] - min_y) // cell_size), num_y - 1)
+        for cx in range(box_cells[i, 0], box_cells[i, 1] + 1):
+            for cy in range(box_cells[i, 2], box_cells[i, 3] + 1):
+                cell_count[cx * num_y + cy + 1] += 1
+
+    cell_start = np.cumsum(cell_count)
+    cell_fill = cell_start[:-1].copy()
+    cell_boxes = np.zeros(cell_start[-1], dtype=np.int64)
+    for i in range(num_boxes):
+        for cx in range(box_cells[i, 0], box_cells[i, 1] + 1):
+            for cy in range(box_cells[i, 2], box_cells[i, 3] + 1):
+                cell_boxes[cell_fill[cx * num_y + cy]] = i
+                cell_fill[cx * num_y + cy] += 1
+    return min_x, min_y, num_x, num_y, cell_start, cell_boxes
+
+
+@numba.jit(nopython=True, parallel=True)
+def points_in_boxes_idx_kernel(boxes, pts, cell_size, margin, box_idxs_of_pts):
+    min_x, min_y, num_x, num_y, cell_start, cell_boxes = build_box_grid(boxes, cell_size, margin)
+    cosa, sina = np.cos(-boxes[:, 6]), np.sin(-boxes[:, 6])
+    for j in numba.prange(pts.shape[0]):
+        cx = int(np.floor((pts[j, 0] - min_x) / cell_size))
+        cy = int(np.floor((pts[j, 1] - min_y) / cell_size))
+        if cx < 0 or cy < 0 or cx >= num_x or cy >= num_y:
+            continue
+        cell = cx * num_y + cy
+        # the first box containing the point, as points_in_boxes_gpu
+        for k in range(cell_start[cell], cell_start[cell + 1]):
+            i = cell_boxes[k]
+            if abs(pts[j, 2] - boxes[i, 2]) > boxes[i, 5] / 2.0:
+                continue
+            shift_x, shift_y = pts[j, 0] - boxes[i, 0], pts[j, 1] - boxes[i, 1]
+            local_x = shift_x * cosa[i] + shift_y * (-sina[i])
+            local_y = shift_x * sina[i] + shift_y * cosa[i]
+            if abs(local_x) < boxes[i, 3] / 2.0 + margin and abs(local_y) < boxes[i, 4] / 2.0 + margin:
+                box_idxs_of_pts[j] = i
+                break
+
+
+def points_in_boxes_idx_cpu(points, boxes, cell_size=None, margin=1e-2):
+    """
+    Args:
+        points: (num_points, 3), numpy
+        boxes: (N, 7) [x, y, z, dx, dy, dz, heading], numpy
+        cell_size: bev grid cell size, the largest box diagonal by default, bounded to at most 1024 x 1024 cells
+        margin: tolerance on the bev extent of the boxes
+
+    Returns:
+        box_idxs_of_pts: (num_points,) int64, index of the box containing each point, -1 for background
+    """
+    box_idxs_of_pts = np.full(points.shape[0], -1, dtype=np.int64)
+    if boxes.shape[0] == 0 or points.shape[0] == 0:
+        return box_idxs_of_pts
+    boxes = np.ascontiguousarray(boxes, dtype=np.float32)
+    if cell_size is None:
+        cell_size = float(np.sqrt(boxes[:, 3] ** 2 + boxes[:, 4] ** 2).max())
+    extent = float(np.ptp(boxes[:, 0:2], axis=0).max())
+    cell_size = max(cell_size, extent / 1024, 1e-3)
+    points_in_boxes_idx_kernel(
+        boxes, np.ascontiguousarray(points, dtype=np.float32), cell_size, margin, box_idxs_of_pts
+    )
+    return box_idxs_of_pts
@@ -1,9 +1,17 @@
+import numpy as np
 import torch
 import torch.nn as nn
 from torch.autograd import Function
 
 from ...utils import common_utils
-from . import roiaware_pool3d_cuda
+from ..iou3d_nms import iou3d_nms_utils
+from . import roiaware_pool3d_cpu
+
+try:
+    from . import roiaware_pool3d_cuda
+except ImportError:
+    # CPU-only installs: points_in_boxes_cpu falls back to the numba kernel of roiaware_pool3d_cpu
+    roiaware_pool3d_cuda = None
 
 
 def points_in_boxes_cpu(points, boxes):
@@ -19,12 +27,89 @@ def points_in_boxes_cpu(points, boxes):
     points, is_numpy = common_utils.check_numpy_to_torch(points)
     boxes, is_numpy = common_utils.check_numpy_to_torch(boxes)
 
-    point_indices = points.new_zeros((boxes.shape[0], points.shape[0]), dtype=torch.int)
-    roiaware_pool3d_cuda.points_in_boxes_cpu(boxes.float().contiguous(), points.float().contiguous(), point_indices)
+    if roiaware_pool3d_cuda is None:
+        point_indices = torch.from_numpy(roiaware_pool3d_cpu.points_in_boxes_cpu(points.numpy(), boxes.numpy()))
+    else:
+        point_indices = points.new_zeros((boxes.shape[0], points.shape[0]), dtype=torch.int)
+        roiaware_pool3d_cuda.points_in_boxes_cpu(boxes.float().contiguous(), points.float().contiguous(), point_indices)
 
     return point_indices.numpy() if is_numpy else point_indices
 
 
+def points_in_boxes_idx_cpu(points, boxes, margin=1e-2):
+    """
+    Per-point box index found through a bev grid of the boxes, without the (N, num_points) mask of points_in_boxes_cpu
+    Args:
+        points: (num_points, 3)
+        boxes: [x, y, z, dx, dy, dz, heading], (x, y, z) is the box center, each box DO NOT overlaps
+        margin: tolerance on the bev extent of the boxes
+    Returns:
+        box_idxs_of_pts: (num_points), default background = -1
+    """
+    assert boxes.shape[1] == 7
+    assert points.shape[1] == 3
+    points, is_numpy = common_utils.check_numpy_to_torch(points)
+    boxes, is_numpy = common_utils.check_numpy_to_torch(boxes)
+
+    box_idxs_of_pts = roiaware_pool3d_cpu.points_in_boxes_idx_cpu(
+        points.cpu().numpy(), boxes.cpu().numpy(), margin=margin
+    )
+
+    return box_idxs_of_pts if is_numpy else torch.from_numpy(box_idxs_of_pts)
+
+
+def group_points_by_box(box_idxs_of_pts, num_boxes):
+    """
+    CSR layout of the points of each box
+    Args:
+        box_idxs_of_pts: (num_points), numpy, from points_in_boxes_idx_cpu
+        num_boxes:
+    Returns:
+        point_order: (num_fg_points), the points of box i are point_order[box_bounds[i]:box_bounds[i + 1]]
+        box_bounds: (num_boxes + 1)
+    """
+    fg_idxs = np.flatnonzero(box_idxs_of_pts >= 0)
+    point_order = fg_idxs[np.argsort(box_idxs_of_pts[fg_idxs], kind='stable')]
+    box_bounds = np.concatenate([[0], np.cumsum(np.bincount(box_idxs_of_pts[fg_idxs], minlength=num_boxes))])
+    return point_order, box_bounds
+
+
+def group_points_in_boxes_cpu(points, boxes):
+    """
+    Points of each box in the CSR layout of group_points_by_box, a point inside several boxes belongs to all of them
+    as with the mask of points_in_boxes_cpu. Only the boxes overlapping another box are taken from the dense mask.
+    Args:
+        points: (num_points, 3), numpy
+        boxes: (N, 7) [x, y, z, dx, dy, dz, heading], numpy
+    Returns:
+        point_order: (num_fg_points), the points of box i are point_order[box_bounds[i]:box_bounds[i + 1]]
+        box_bounds: (N + 1)
+    """
+    margin = 1e-2  # the tolerance of points_in_boxes_cpu
+    num_boxes = boxes.shape[0]
+    box_idxs_of_pts = points_in_boxes_idx_cpu(points, boxes, margin=margin)
+    if num_boxes < 2:
+        return group_points_by_box(box_idxs_of_pts, num_boxes)
+
+    # boxes whose bev extents, with the margin, overlap can share points
+    enlarged_boxes = np.array(boxes, dtype=np.float32)
+    enlarged_boxes[:, 3:5] += 2 * margin
+    bev_iou = iou3d_nms_utils.boxes_bev_iou_cpu(enlarged_boxes, enlarged_boxes)
+    np.fill_diagonal(bev_iou, 0)
+    overlapping = np.flatnonzero(bev_iou.max(axis=1) > 0)
+    if overlapping.shape[0] == 0:
+        return group_points_by_box(box_idxs_of_pts, num_boxes)
+
+    box_idxs_of_pts[np.isin(box_idxs_of_pts, overlapping)] = -1
+    point_order, box_bounds = group_points_by_box(box_idxs_of_pts, num_boxes)
+    point_masks = points_in_boxes_cpu(points, boxes[overlapping]) > 0
+    points_of_boxes = [point_order[box_bounds[i]:box_bounds[i + 1]] for i in range(num_boxes)]
+    for k, i in enumerate(overlapping):
+        points_of_boxes[i] = np.flatnonzero(point_masks[k])
+    box_bounds = np.concatenate([[0], np.cumsum([x.shape[0] for x in points_of_boxes])])
+    return np.concatenate(points_of_boxes), box_bounds
+
+
 def points_in_boxes_gpu(points, boxes):
     """
     :param points: (B, M, 3)
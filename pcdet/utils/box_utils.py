@@ -39,6 +39,9 @@ def boxes_to_corners_3d(boxes3d):
 
     Returns:
     """
+    if isinstance(boxes3d, np.ndarray):
+        return boxes_to_corners_3d_numpy(boxes3d)
+
     boxes3d, is_numpy = common_utils.check_numpy_to_torch(boxes3d)
 
     template = boxes3d.new_tensor((
@@ -52,6 +55,27 @@ def boxes_to_corners_3d(boxes3d):
 
     return corners3d.numpy() if is_numpy else corners3d
 
+
+def boxes_to_corners_3d_numpy(boxes3d):
+    """
+    Numpy version of boxes_to_corners_3d, keeps the dtype of the boxes
+    Args:
+        boxes3d:  (N, 7) [x, y, z, dx, dy, dz, heading], (x, y, z) is the box center
+
+    Returns:
+        corners3d: (N, 8, 3)
+    """
+    template = np.array((
+        [1, 1, -1], [1, -1, -1], [-1, -1, -1], [-1, 1, -1],
+        [1, 1, 1], [1, -1, 1], [-1, -1, 1], [-1, 1, 1],
+    ), dtype=boxes3d.dtype) / 2
+
+    corners3d = boxes3d[:, None, 3:6] * template[None, :, :]
+    corners3d = common_utils.rotate_points_along_z_numpy(corners3d, boxes3d[:, 6], inplace=True)
+    corners3d += boxes3d[:, None, 0:3]
+    return corners3d
+
+
 def corners_rect_to_camera(corners):
     """
         7 -------- 4
@@ -125,8 +149,8 @@ def remove_points_in_boxes3d(points, boxes3d):
     """
     boxes3d, is_numpy = common_utils.check_numpy_to_torch(boxes3d)
     points, is_numpy = common_utils.check_numpy_to_torch(points)
-    point_masks = roiaware_pool3d_utils.points_in_boxes_cpu(points[:, 0:3], boxes3d)
-    points = points[point_masks.sum(dim=0) == 0]
+    box_idxs_of_pts = roiaware_pool3d_utils.points_in_boxes_idx_cpu(points[:, 0:3], boxes3d)
+    points = points[box_idxs_of_pts < 0]
 
     return points.numpy() if is_numpy else points
 
@@ -1,9 +1,11 @@
+import importlib
 import logging
 import os
 import pickle
 import random
 import shutil
 import subprocess
+from collections.abc import Mapping
 import SharedArray
 
 import numpy as np
@@ -19,6 +21,9 @@ def check_numpy_to_torch(x):
 
 
 def limit_period(val, offset=0.5, period=np.pi):
+    if isinstance(val, np.ndarray):
+        # numpy path, keeps the dtype of val
+        return val - np.floor(val / period + offset) * period
     val, is_numpy = check_numpy_to_torch(val)
     ans = val - torch.floor(val / period + offset) * period
     return ans.numpy() if is_numpy else ans
@@ -40,6 +45,9 @@ def rotate_points_along_z(points, angle):
     Returns:
 
     """
+    if isinstance(points, np.ndarray):
+        return rotate_points_along_z_numpy(points, angle)
+
     points, is_numpy = check_numpy_to_torch(points)
     angle, _ = check_numpy_to_torch(angle)
 
@@ -57,6 +65,31 @@ def rotate_points_along_z(points, angle):
     return points_rot.numpy() if is_numpy else points_rot
 
 
+def rotate_points_along_z_numpy(points, angle, inplace=False):
+    """
+    Numpy version of rotate_points_along_z, keeps the dtype of the points
+    Args:
+        points: (B, N, 3 + C) numpy
+        angle: (B), angle along z-axis, angle increases x ==> y
+        inplace: rotate the xyz of points in place instead of copying the feature columns
+    Returns:
+
+    """
+    dtype = points.dtype if np.issubdtype(points.dtype, np.floating) else np.float32
+    angle = np.asarray(angle)
+    cosa = np.cos(angle).astype(dtype)[:, None]
+    sina = np.sin(angle).astype(dtype)[:, None]
+
+    # xyz @ [[cosa, sina, 0], [-sina, cosa, 0], [0, 0, 1]], z is unchanged
+    points_x, points_y = points[:, :, 0], points[:, :, 1]
+    rot_x = points_x * cosa - points_y * sina
+    rot_y = points_x * sina + points_y * cosa
+    points_rot = points if inplace else points.astype(dtype, copy=True)
+    points_rot[:, :, 0] = rot_x
+    points_rot[:, :, 1] = rot_y
+    return points_rot
+
+
 def angle2matrix(angle):
     """
     Args:
@@ -159,6 +192,23 @@ def keep_arrays_by_name(gt_names, used_classes):
     return inds
 
 
+def get_class_ids(gt_names, class_names):
+    """
+    Args:
+        gt_names: (N), string
+        class_names: list of the used class names
+    Returns:
+        gt_classes: (N) int32, index in class_names + 1, 0 for the names not in class_names
+    """
+    gt_names = np.asarray(gt_names)
+    if gt_names.shape[0] == 0:
+        return np.zeros(0, dtype=np.int32)
+    # only the distinct names are looked up
+    unique_names, inverse = np.unique(gt_names, return_inverse=True)
+    unique_ids = np.array([class_names.index(x) + 1 if x in class_names else 0 for x in unique_names], dtype=np.int32)
+    return unique_ids[inverse.reshape(-1)]
+
+
 def init_dist_slurm(tcp_port, local_rank, backend='nccl'):
     """
     modified from https://github.com/open-mmlab/mmdetection
@@ -277,6 +327,161 @@ def sa_create(name, var):
     return x
 
 
+class SharedPointPool(object):
+    """
+    Arrays with the same number of columns packed into one shared memory segment shm://<name>, with the row offsets
+    of the arrays in shm://<name>___offsets, instead of one SharedArray per array. pool[k] is a read-only view.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.data = None
+        self.offsets = None
+
+    @property
+    def offsets_name(self):
+        return f'{self.name}___offsets'
+
+    def exists(self):
+        return os.path.exists(f'/dev/shm/{self.name}') and os.path.exists(f'/dev/shm/{self.offsets_name}')
+
+    def attach(self):
+        # attached lazily, so that each dataloader worker maps the segment itself
+        if self.data is None:
+            self.data = SharedArray.attach(f'shm://{self.name}')
+            self.data.setflags(write=0)
+            self.offsets = SharedArray.attach(f'shm://{self.offsets_name}')
+            self.offsets.setflags(write=0)
+        return self
+
+    def __len__(self):
+        return self.attach().offsets.shape[0] - 1
+
+    def __getitem__(self, k):
+        self.attach()
+        return self.data[self.offsets[k]:self.offsets[k + 1]]
+
+    def __getstate__(self):
+        # a pickled SharedArray would be a full copy
+        d = dict(self.__dict__)
+        d['data'] = d['offsets'] = None
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+
+    @staticmethod
+    def get_local_rank():
+        # the ranks of a machine share its /dev/shm
+        cur_rank, world_size, num_gpus = get_dist_info(return_gpu_per_machine=True)
+        num_local_ranks = min(max(num_gpus, 1), world_size)
+        return cur_rank % num_local_ranks, num_local_ranks, world_size
+
+    @classmethod
+    def create(cls, name, num_arrays, num_features, load_func, num_points_func=None, dtype=np.float32):
+        """
+        Loads the arrays in parallel on the ranks of each machine, which first count their rows, then write them
+        at their offsets. An existing pool of the same name and length is reused.
+        Args:
+            name:
+            num_arrays:
+            num_features:
+            load_func: k -> (num_points, num_features) array
+            num_points_func: k -> num_points without loading the array, load_func(k).shape[0] by default
+            dtype:
+        Returns:
+            pool:
+        """
+        pool = cls(name)
+        local_rank, num_local_ranks, world_size = cls.get_local_rank()
+        if num_points_func is None:
+            num_points_func = lambda k: load_func(k).shape[0]
+
+        def barrier():
+            # same number of barriers on all the ranks, whether the pool exists on their machine or not
+            if world_size > 1:
+                dist.barrier()
+
+        create_pool = not pool.exists()
+        num_points_name = f'shm://{name}___num_points'
+        if create_pool and local_rank == 0:
+            SharedArray.create(num_points_name, num_arrays, dtype=np.int64)
+        barrier()
+        if create_pool:
+            num_points = SharedArray.attach(num_points_name)
+            for k in range(local_rank, num_arrays, num_local_ranks):
+                num_points[k] = num_points_func(k)
+            del num_points
+        barrier()
+        if create_pool and local_rank == 0:
+            num_points = SharedArray.attach(num_points_name)
+            offsets = SharedArray.create(f'shm://{pool.offsets_name}', num_arrays + 1, dtype=np.int64)
+            offsets[0] = 0
+            np.cumsum(num_points, out=offsets[1:])
+            SharedArray.create(f'shm://{name}', (int(offsets[-1]), num_features), dtype=dtype)
+            del num_points, offsets
+            SharedArray.delete(num_points_name)
+        barrier()
+        if create_pool:
+            data = SharedArray.attach(f'shm://{name}')
+            offsets = SharedArray.attach(f'shm://{pool.offsets_name}')
+            for k in range(local_rank, num_arrays, num_local_ranks):
+                data[offsets[k]:offsets[k + 1]] = load_func(k)
+            del data, offsets
+        barrier()
+
+        assert len(pool) == num_arrays, \
+            f'shm://{name} holds {len(pool)} arrays instead of {num_arrays}, delete the stale /dev/shm/{name}*'
+        return pool
+
+    def delete(self):
+        self.data = self.offsets = None
+        local_rank, _, world_size = self.get_local_rank()
+        # the other ranks are done with the pool
+        if world_size > 1:
+            dist.barrier()
+        if local_rank == 0:
+            for name in [self.name, self.offsets_name]:
+                if os.path.exists(f'/dev/shm/{name}'):
+                    SharedArray.delete(f'shm://{name}')
+        if world_size > 1:
+            dist.barrier()
+
+
+class LazyRegistry(Mapping):
+    """
+    Name -> class registry of a package, the modules of the classes are imported on first access, so that only the
+    classes named in the configs are imported with their dependencies
+    """
+    def __init__(self, package, import_paths):
+        """
+        Args:
+            package: __name__ of the package of the registry
+            import_paths: name -> (module relative to the package, class name)
+        """
+        self.package = package
+        self.import_paths = import_paths
+
+    def __getitem__(self, name):
+        module_name, class_name = self.import_paths[name]
+        return getattr(importlib.import_module(module_name, self.package), class_name)
+
+    def __contains__(self, name):
+        # without importing the class
+        return name in self.import_paths
+
+    def __iter__(self):
+        return iter(self.import_paths)
+
+    def __len__(self):
+        return len(self.import_paths)
+
+    def module_getattr(self, name):
+        # module __getattr__ of the package, keeps `from package import SomeClass` working
+        if name not in self.import_paths:
+            raise AttributeError(f'module {self.package!r} has no attribute {name!r}')
+        return self[name]
+
+
 class AverageMeter(object):
     """Computes and stores the average and current value"""
     def __init__(self):
@@ -0,0 +1,124 @@
+"""
+Throughput of DatasetTemplate.collate_batch and of a DataLoader using it.
+
+Without --cfg_file, synthetic samples shaped like the output of prepare_data (points, voxels, voxel_coords,
+voxel_num_points, gt_boxes) are used, and collate_batch is also compared with the per-sample np.pad +
+np.concatenate collate of points / voxel_coords it replaced. With --cfg_file, the training dataloader of
+the config is iterated, after checking that its dataset can be pickled.
+
+Usage: python dataloader_benchmark.py [--batch_size 32] [--workers 4] [--cfg_file cfgs/...yaml]
+"""
+import argparse
+import pickle
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from pcdet.datasets import DatasetTemplate
+
+
+class SyntheticDataset(Dataset):
+    def __init__(self, num_samples, num_points, num_voxels, num_boxes, max_points_per_voxel=5, seed=0):
+        rng = np.random.RandomState(seed)
+        self.num_samples = num_samples
+        self.sample = {
+            'points': rng.rand(num_points, 4).astype(np.float32),
+            'voxels': rng.rand(num_voxels, max_points_per_voxel, 4).astype(np.float32),
+            'voxel_coords': rng.randint(0, 1000, (num_voxels, 3)).astype(np.int32),
+            'voxel_num_points': rng.randint(1, max_points_per_voxel + 1, num_voxels).astype(np.int32),
+            'gt_boxes': rng.rand(num_boxes, 8).astype(np.float32),
+            'use_lead_xyz': True,
+            'frame_id': '000000',
+        }
+
+    def __len__(self):
+        return self.num_samples
+
+    def __getitem__(self, index):
+        sample = {key: val.copy() if isinstance(val, np.ndarray) else val for key, val in self.sample.items()}
+        # vary the number of boxes as gt sampling does
+        sample['gt_boxes'] = sample['gt_boxes'][:sample['gt_boxes'].shape[0] - index % 5]
+        return sample
+
+
+def pad_concatenate(val):
+    coors = []
+    for i, coor in enumerate(val):
+        coors.append(np.pad(coor, ((0, 0), (1, 0)), mode='constant', constant_values=i))
+    return np.concatenate(coors, axis=0)
+
+
+def timeit(func, repeat):
+    func()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def iterate(dataloader, num_batches):
+    start, num_samples = None, 0
+    for k, batch_dict in enumerate(dataloader):
+        if k == 0:
+            start = time.perf_counter()  # skip the startup of the workers
+            continue
+        num_samples += batch_dict['batch_size']
+        if k == num_batches:
+            break
+    return num_samples / (time.perf_counter() - start)
+
+
+def parse_config():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--batch_size', type=int, default=32, help='batch size')
+    parser.add_argument('--workers', type=int, default=4, help='number of dataloader workers')
+    parser.add_argument('--num_batches', type=int, default=20, help='number of timed batches')
+    parser.add_argument('--num_points', type=int, default=120000, help='points per synthetic sample')
+    parser.add_argument('--num_voxels', type=int, default=40000, help='voxels per synthetic sample')
+    parser.add_argument('--num_boxes', type=int, default=60, help='gt boxes per synthetic sample')
+    parser.add_argument('--cfg_file', type=str, default=None, help='iterate the training dataloader of this config')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed collate runs')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_config()
+
+    if args.cfg_file is not None:
+        from pcdet.config import cfg, cfg_from_yaml_file
+        from pcdet.datasets import build_dataloader
+        cfg_from_yaml_file(args.cfg_file, cfg)
+        _, dataloader, _ = build_dataloader(
+            dataset_cfg=cfg.DATA_CONFIG, class_names=cfg.CLASS_NAMES, batch_size=args.batch_size,
+            dist=False, workers=args.workers, training=True
+        )
+        # the datasets are sent to the multiprocessing pools of the info and gt database builders
+        print('pickled dataset: %.1f MB' % (len(pickle.dumps(dataloader.dataset)) / 2 ** 20))
+        print('%s: %.1f samples/s' % (args.cfg_file, iterate(dataloader, args.num_batches)))
+        return
+
+    dataset = SyntheticDataset(
+        args.batch_size * (args.num_batches + 1), args.num_points, args.num_voxels, args.num_boxes
+    )
+    batch_list = [dataset[k] for k in range(args.batch_size)]
+    collate_time = timeit(lambda: DatasetTemplate.collate_batch(batch_list), args.repeat)
+    pad_time = sum(
+        timeit(lambda: pad_concatenate([sample[key] for sample in batch_list]), args.repeat)
+        for key in ['points', 'voxel_coords']
+    )
+    print('collate_batch of %d samples: %.2f ms (np.pad + np.concatenate of points / voxel_coords alone: %.2f ms)' % (
+        args.batch_size, collate_time * 1000, pad_time * 1000))
+
+    dataloader = DataLoader(
+        dataset, batch_size=args.batch_size, num_workers=args.workers, collate_fn=DatasetTemplate.collate_batch,
+        pin_memory=torch.cuda.is_available()
+    )
+    print('DataLoader with %d workers: %.1f samples/s' % (args.workers, iterate(dataloader, args.num_batches)))
+
+
+if __name__ == '__main__':
+    main()
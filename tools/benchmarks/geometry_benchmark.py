@@ -0,0 +1,79 @@
+"""
+Micro-benchmarks of the geometry functions used per sample by the data augmentor and data processor.
+The numpy paths (numpy input) are compared with the torch paths (the same input as a float32 tensor,
+converted back with .numpy() as the torch round-trip of check_numpy_to_torch did).
+
+Usage: python geometry_benchmark.py [--num_points 120000] [--num_boxes 100]
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from pcdet.utils import box_utils, common_utils
+
+
+def timeit(func, repeat):
+    func()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def to_torch(x):
+    return torch.from_numpy(x).float()
+
+
+def parse_config():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--num_points', type=int, default=120000, help='number of points')
+    parser.add_argument('--num_boxes', type=int, default=100, help='number of boxes')
+    parser.add_argument('--repeat', type=int, default=20, help='number of timed runs')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_config()
+    rng = np.random.RandomState(0)
+    points = np.concatenate([
+        rng.uniform(-70, 70, (args.num_points, 2)), rng.uniform(-2, 2, (args.num_points, 1)),
+        rng.rand(args.num_points, 2)
+    ], axis=1).astype(np.float32)
+    boxes = np.concatenate([
+        rng.uniform(-70, 70, (args.num_boxes, 2)), rng.uniform(-1, 1, (args.num_boxes, 1)),
+        rng.uniform(1, 5, (args.num_boxes, 3)), rng.uniform(-10, 10, (args.num_boxes, 1))
+    ], axis=1)  # float64 as loaded from the infos
+    angle = np.array([0.3])
+    points_buffer = points.copy()  # rotated in place over and over, only the first result is compared
+
+    benchmarks = [
+        ('limit_period',
+         lambda: common_utils.limit_period(boxes[:, 6], offset=0.5, period=2 * np.pi),
+         lambda: common_utils.limit_period(to_torch(boxes[:, 6]), offset=0.5, period=2 * np.pi).numpy()),
+        ('rotate_points_along_z',
+         lambda: common_utils.rotate_points_along_z(points[np.newaxis], angle)[0],
+         lambda: common_utils.rotate_points_along_z(to_torch(points[np.newaxis]), to_torch(angle))[0].numpy()),
+        ('rotate_points_along_z_numpy inplace',
+         lambda: common_utils.rotate_points_along_z_numpy(points_buffer[np.newaxis], angle, inplace=True)[0],
+         lambda: common_utils.rotate_points_along_z(to_torch(points[np.newaxis]), to_torch(angle))[0].numpy()),
+        ('boxes_to_corners_3d',
+         lambda: box_utils.boxes_to_corners_3d(boxes),
+         lambda: box_utils.boxes_to_corners_3d(to_torch(boxes)).numpy()),
+    ]
+
+    print('%-36s %12s %12s %12s %10s' % ('function', 'numpy', 'torch', 'max diff', 'dtype'))
+    for name, numpy_func, torch_func in benchmarks:
+        numpy_result, torch_result = numpy_func(), torch_func()
+        max_diff = np.abs(numpy_result.astype(np.float64) - torch_result.astype(np.float64)).max()
+        print('%-36s %10.3fms %10.3fms %12.2e %10s' % (
+            name, timeit(numpy_func, args.repeat) * 1000, timeit(torch_func, args.repeat) * 1000,
+            max_diff, numpy_result.dtype
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Import time of the pcdet entry points, measured with `python -X importtime` in fresh interpreters.
+The dataset and detector registries are lazy, so importing pcdet.datasets / pcdet.models does not import the
+dataset and model modules, and a config only imports its own dataset class and detector.
+
+Usage: python import_time_benchmark.py [--cfg_file cfgs/kitti_models/pointpillar.yaml] [--max_ms 2000]
+"""
+import argparse
+import subprocess
+import sys
+
+STATEMENTS = [
+    ('pcdet.datasets', 'import pcdet.datasets'),
+    ('pcdet.models', 'import pcdet.models'),
+    ('tools entry points', 'from pcdet.datasets import build_dataloader; from pcdet.models import build_network'),
+]
+
+
+def import_time(statement, repeat):
+    """
+    Returns:
+        total_ms: sum of the self import times of all the modules, the fastest of repeat runs
+        modules: (self_us, module) of the slowest run, every module imported by the statement
+    """
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', statement], stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+            universal_newlines=True, check=True
+        ).stderr
+        modules = []
+        for line in output.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, _, module = line[len('import time:'):].split('|')
+            modules.append((int(self_us), module.strip()))
+        total_ms = sum(self_us for self_us, _ in modules) / 1000
+        if best is None or total_ms < best[0]:
+            best = (total_ms, modules)
+    return best
+
+
+def parse_config():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--cfg_file', type=str, default=None, help='also import the dataset and detector of this config')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs of each statement')
+    parser.add_argument('--top', type=int, default=10, help='number of the slowest modules to print')
+    parser.add_argument('--max_ms', type=float, default=None, help='exit with an error above this import time')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_config()
+    statements = list(STATEMENTS)
+    if args.cfg_file is not None:
+        statements.append(('%s classes' % args.cfg_file, '; '.join([
+            'from pcdet.config import cfg, cfg_from_yaml_file',
+            'from pcdet.datasets import __all__ as datasets',
+            'from pcdet.models.detectors import __all__ as detectors',
+            'cfg_from_yaml_file(%r, cfg)' % args.cfg_file,
+            'datasets[cfg.DATA_CONFIG.DATASET]',
+            'detectors[cfg.MODEL.NAME]',
+        ])))
+
+    slowest = 0
+    for name, statement in statements:
+        total_ms, modules = import_time(statement, args.repeat)
+        num_pcdet_modules = sum(module.strip().startswith('pcdet') for _, module in modules)
+        print('%-40s %9.1f ms  %4d modules (%d of pcdet)' % (name, total_ms, len(modules), num_pcdet_modules))
+        for self_us, module in sorted(modules, reverse=True)[:args.top]:
+            print('    %9.1f ms  %s' % (self_us / 1000, module))
+        slowest = max(slowest, total_ms)
+
+    if args.max_ms is not None and slowest > args.max_ms:
+        print('import time %.1f ms is above --max_ms %.1f ms' % (slowest, args.max_ms))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Throughput of the rotated IoU backends used by the KITTI evaluator, measured on the same
+partitions calculate_iou_partly builds from a synthetic split.
+
+Usage: python kitti_iou_benchmark.py [--num_frames 3769] [--num_parts 100] [--metric 1|2]
+"""
+import argparse
+import time
+
+import numpy as np
+from numba import cuda
+
+from pcdet.datasets.kitti.kitti_object_eval_python import eval as kitti_eval
+from pcdet.datasets.kitti.kitti_object_eval_python.rotate_iou_cpu import rotate_iou_cpu_eval
+
+
+def random_annos(num_frames, max_boxes, seed=0):
+    rng = np.random.RandomState(seed)
+    annos = []
+    for _ in range(num_frames):
+        num_boxes = rng.randint(0, max_boxes + 1)
+        annos.append({
+            'name': np.array(['Car'] * num_boxes),
+            'bbox': np.concatenate([rng.uniform(0, 600, (num_boxes, 2)), rng.uniform(600, 1200, (num_boxes, 2))], axis=1),
+            'location': np.stack([rng.uniform(-20, 20, num_boxes), rng.uniform(1, 2, num_boxes),
+                                  rng.uniform(0, 60, num_boxes)], axis=1),
+            'dimensions': np.stack([rng.uniform(3, 5, num_boxes), rng.uniform(1.4, 1.8, num_boxes),
+                                    rng.uniform(1.5, 2, num_boxes)], axis=1),
+            'rotation_y': rng.uniform(-np.pi, np.pi, num_boxes),
+        })
+    return annos
+
+
+def parse_config():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--num_frames', type=int, default=3769, help='number of synthetic frames (KITTI val size)')
+    parser.add_argument('--max_gt', type=int, default=20, help='max number of gt boxes per frame')
+    parser.add_argument('--max_dt', type=int, default=50, help='max number of detections per frame')
+    parser.add_argument('--num_parts', type=int, default=100, help='num_parts passed to calculate_iou_partly')
+    parser.add_argument('--metric', type=int, default=2, help='1: bev, 2: 3d')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs per backend')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_config()
+    gt_annos = random_annos(args.num_frames, args.max_gt, seed=0)
+    dt_annos = random_annos(args.num_frames, args.max_dt, seed=1)
+
+    backends = {'cpu': rotate_iou_cpu_eval}
+    if cuda.is_available():
+        from pcdet.datasets.kitti.kitti_object_eval_python.rotate_iou import rotate_iou_gpu_eval
+        backends['gpu'] = rotate_iou_gpu_eval
+
+    for name, backend in backends.items():
+        kitti_eval.rotate_iou_eval = backend
+        # the first call compiles the kernels
+        kitti_eval.calculate_iou_partly(gt_annos[:10], dt_annos[:10], args.metric, num_parts=1)
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            _, parted_overlaps, _, _ = kitti_eval.calculate_iou_partly(
+                gt_annos, dt_annos, args.metric, num_parts=args.num_parts
+            )
+            timings.append(time.perf_counter() - start)
+
+        num_pairs = sum(overlap.size for overlap in parted_overlaps)
+        best = min(timings)
+        print('%s: %d partitions, %d box pairs, %.3f s, %.2f M pairs/s' % (
+            name, len(parted_overlaps), num_pairs, best, num_pairs / best / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Time of the per-object local augmentations of augmentor_utils against the number of gt boxes.
+The box augmentations assign the points to the boxes once and the pyramid augmentations test the
+points against the face planes of the pyramids near them, so the time grows with the number of points
+rather than with num_boxes x num_points.
+The box augmentations are also checked against the reference loops below (one get_points_in_box call per box):
+under the same seed both give the same boxes and points when the boxes do not overlap. Where boxes overlap, the
+distribution of the per-point displacement over --num_seeds seeds must agree within STATS_TOLERANCE for the points
+inside a single box. The loops apply the noise of every box containing a point while the vectorized path applies
+the noise of one of them, so for the points inside several boxes the distributions are only reported.
+
+Usage: python local_augmentation_benchmark.py [--num_points 120000] [--num_boxes 10 50 100 200]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from pcdet.datasets.augmentor import augmentor_utils
+from pcdet.utils import common_utils
+
+AUGMENTATIONS = [
+    ('random_local_translation_along_x', ([-0.5, 0.5],)),
+    ('local_scaling', ([0.95, 1.05],)),
+    ('local_rotation', ([-0.785, 0.785],)),
+    ('local_frustum_dropout_top', ([0, 0.2],)),
+    ('local_pyramid_dropout', (0.25,)),
+    ('local_pyramid_sparsify', (0.05, 50)),
+    ('local_pyramid_swap', (0.1, 50)),
+]
+
+# relative tolerance on the mean / std / p99 of the per-point displacement in the overlapping case
+STATS_TOLERANCE = 0.05
+
+
+# the reference loops take the points of each box before the augmentation, so that a point moved into a later box
+# is not moved again
+def reference_local_translation(gt_boxes, points, offset_range, axis):
+    input_points = points.copy()
+    for idx, box in enumerate(gt_boxes):
+        offset = np.random.uniform(offset_range[0], offset_range[1])
+        _, mask = augmentor_utils.get_points_in_box(input_points, box)
+        points[mask, axis] += offset
+        gt_boxes[idx, axis] += offset
+    return gt_boxes, points
+
+
+def reference_local_scaling(gt_boxes, points, scale_range):
+    if scale_range[1] - scale_range[0] < 1e-3:
+        return gt_boxes, points
+    input_points = points.copy()
+    for idx, box in enumerate(gt_boxes):
+        noise_scale = np.random.uniform(scale_range[0], scale_range[1])
+        _, mask = augmentor_utils.get_points_in_box(input_points, box)
+        points[mask, 0:3] = (points[mask, 0:3] - box[0:3]) * noise_scale + box[0:3]
+        gt_boxes[idx, 3:6] *= noise_scale
+    return gt_boxes, points
+
+
+def reference_local_rotation(gt_boxes, points, rot_range):
+    input_points = points.copy()
+    for idx, box in enumerate(gt_boxes):
+        noise_rotation = np.random.uniform(rot_range[0], rot_range[1])
+        _, mask = augmentor_utils.get_points_in_box(input_points, box)
+        points[mask, 0:3] = common_utils.rotate_points_along_z(
+            (points[np.newaxis, mask, 0:3] - box[0:3]).astype(np.float32), np.array([noise_rotation])
+        )[0] + box[0:3]
+        gt_boxes[idx, 6] += noise_rotation
+        if gt_boxes.shape[1] > 8:
+            gt_boxes[idx, 7:9] = common_utils.rotate_points_along_z(
+                np.array([[[gt_boxes[idx, 7], gt_boxes[idx, 8], 0]]]), np.array([noise_rotation])
+            )[0, 0, 0:2]
+    return gt_boxes, points
+
+
+def reference_local_frustum_dropout(gt_boxes, points, intensity_range, axis, from_top):
+    for box in gt_boxes:
+        intensity = np.random.uniform(intensity_range[0], intensity_range[1])
+        _, mask = augmentor_utils.get_points_in_box(points, box)
+        if from_top:
+            threshold = (box[axis] + box[axis + 3] / 2) - intensity * box[axis + 3]
+            points = points[~(mask & (points[:, axis] >= threshold))]
+        else:
+            threshold = (box[axis] - box[axis + 3] / 2) + intensity * box[axis + 3]
+            points = points[~(mask & (points[:, axis] <= threshold))]
+    return gt_boxes, points
+
+
+REFERENCES = {
+    'random_local_translation_along_x': lambda gt_boxes, points, offset_range: reference_local_translation(
+        gt_boxes, points, offset_range, axis=0),
+    'local_scaling': reference_local_scaling,
+    'local_rotation': reference_local_rotation,
+    'local_frustum_dropout_top': lambda gt_boxes, points, intensity_range: reference_local_frustum_dropout(
+        gt_boxes, points, intensity_range, axis=2, from_top=True),
+}
+
+
+def random_scene(num_boxes, num_points, rng, extent=70.0):
+    gt_boxes = np.concatenate([
+        rng.uniform(-extent, extent, (num_boxes, 2)), rng.uniform(-1, 1, (num_boxes, 1)),
+        rng.uniform(1, 5, (num_boxes, 3)), rng.uniform(-np.pi, np.pi, (num_boxes, 1))
+    ], axis=1)
+    points = np.concatenate([
+        rng.uniform(-extent, extent, (num_points, 2)), rng.uniform(-2, 2, (num_points, 1)), rng.rand(num_points, 1)
+    ], axis=1).astype(np.float32)
+    return gt_boxes, points
+
+
+def non_overlapping_scene(num_boxes, num_points, rng, spacing=10.0):
+    # boxes on a grid, far enough apart that no point is near two of them after the augmentations
+    grid_size = int(np.ceil(np.sqrt(num_boxes)))
+    extent = grid_size * spacing / 2
+    cells = rng.permutation(grid_size * grid_size)[:num_boxes]
+    gt_boxes = np.concatenate([
+        np.stack((cells % grid_size, cells // grid_size), axis=1) * spacing - extent + spacing / 2,
+        rng.uniform(-1, 1, (num_boxes, 1)), rng.uniform(1, 5, (num_boxes, 3)),
+        rng.uniform(-np.pi, np.pi, (num_boxes, 1))
+    ], axis=1)
+    points = np.concatenate([
+        rng.uniform(-extent, extent, (num_points, 2)), rng.uniform(-2, 2, (num_points, 1)), rng.rand(num_points, 1)
+    ], axis=1).astype(np.float32)
+    return gt_boxes, points
+
+
+def run_with_seed(func, gt_boxes, points, aug_args, seed):
+    np.random.seed(seed)
+    return func(gt_boxes.copy(), points.copy(), *aug_args)
+
+
+def num_boxes_of_points(points, gt_boxes):
+    num_boxes = np.zeros(points.shape[0], dtype=np.int64)
+    for box in gt_boxes:
+        num_boxes += augmentor_utils.get_points_in_box(points, box)[1]
+    return num_boxes
+
+
+def displacement_stats(func, gt_boxes, points, aug_args, point_mask, num_seeds):
+    displacements = []
+    for seed in range(num_seeds):
+        _, aug_points = run_with_seed(func, gt_boxes, points, aug_args, seed)
+        displacements.append(np.linalg.norm(aug_points[point_mask, 0:3] - points[point_mask, 0:3], axis=1))
+    displacements = np.concatenate(displacements)
+    return np.array([displacements.mean(), displacements.std(), np.percentile(displacements, 99)])
+
+
+def timeit(func, repeat):
+    func()  # compile / warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def parse_config():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--num_points', type=int, default=120000, help='number of points of the scene')
+    parser.add_argument('--num_boxes', type=int, nargs='+', default=[10, 50, 100, 200], help='numbers of gt boxes')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs')
+    parser.add_argument('--num_seeds', type=int, default=20, help='seeds of the displacement distributions')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_config()
+    rng = np.random.RandomState(0)
+    print('num_boxes ' + ' '.join('%34s' % name for name, _ in AUGMENTATIONS))
+    for num_boxes in args.num_boxes:
+        gt_boxes, points = random_scene(num_boxes, args.num_points, rng)
+        timings = []
+        for name, aug_args in AUGMENTATIONS:
+            func = getattr(augmentor_utils, name)
+            timings.append(timeit(lambda: func(gt_boxes.copy(), points.copy(), *aug_args), args.repeat))
+        print('%9d ' % num_boxes + ' '.join('%32.2fms' % (t * 1000) for t in timings))
+
+    # per-box parity with the reference loops under a fixed seed
+    gt_boxes, points = non_overlapping_scene(max(args.num_boxes), args.num_points, rng)
+    for name, reference in REFERENCES.items():
+        aug_args = dict(AUGMENTATIONS)[name]
+        boxes_a, points_a = run_with_seed(getattr(augmentor_utils, name), gt_boxes, points, aug_args, seed=0)
+        boxes_b, points_b = run_with_seed(reference, gt_boxes, points, aug_args, seed=0)
+        assert points_a.shape == points_b.shape, '%s: %d points, reference %d' % (
+            name, points_a.shape[0], points_b.shape[0])
+        box_diff, point_diff = np.abs(boxes_a - boxes_b).max(), np.abs(points_a - points_b).max()
+        print('%s non-overlapping boxes: max abs diff of boxes %.2e, of points %.2e' % (name, box_diff, point_diff))
+        assert box_diff < 1e-5 and point_diff < 1e-4, name
+
+    # overlapping boxes: the vectorized path moves each point by the noise of one box, the loops by all of them
+    gt_boxes, points = random_scene(max(args.num_boxes), args.num_points, rng, extent=10.0)
+    num_boxes_of_pts = num_boxes_of_points(points, gt_boxes)
+    for name in ['random_local_translation_along_x', 'local_scaling', 'local_rotation']:
+        aug_args = dict(AUGMENTATIONS)[name]
+        for point_mask, points_desc in [
+                (num_boxes_of_pts == 1, 'in one box'), (num_boxes_of_pts > 1, 'in several boxes')]:
+            stats, reference_stats = [
+                displacement_stats(func, gt_boxes, points, aug_args, point_mask, args.num_seeds)
+                for func in [getattr(augmentor_utils, name), REFERENCES[name]]
+            ]
+            print('%s overlapping boxes, %d points %s: displacement mean / std / p99 %.3f / %.3f / %.3f, '
+                  'reference %.3f / %.3f / %.3f' % ((name, point_mask.sum(), points_desc) +
+                                                    tuple(stats) + tuple(reference_stats)))
+            if points_desc == 'in one box':
+                assert np.all(np.abs(stats - reference_stats) <= STATS_TOLERANCE * reference_stats), name
+
+
+if __name__ == '__main__':
+    main()
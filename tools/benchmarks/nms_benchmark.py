@@ -0,0 +1,97 @@
+"""
+Latency of the multi-class NMS of post_processing against the batch size: multi_classes_nms called per sample
+(a topk and an NMS call per class) compared with batched_multi_classes_nms (one NMS call for the batch).
+The synthetic predictions are clusters of overlapping boxes with random class scores, and the outputs of
+both are compared.
+
+Usage: python nms_benchmark.py [--batch_sizes 1 2 4 8 16] [--num_boxes 20000] [--num_class 10] [--device cpu]
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from easydict import EasyDict
+
+from pcdet.models.model_utils import model_nms_utils
+
+
+def random_predictions(batch_size, num_boxes, num_class, rng, extent=50.0, num_clusters=500):
+    centers = rng.uniform(-extent, extent, (batch_size, num_clusters, 2))
+    cluster_ids = rng.randint(0, num_clusters, (batch_size, num_boxes))
+    box_preds = np.concatenate([
+        np.take_along_axis(centers, cluster_ids[..., np.newaxis].repeat(2, axis=-1), axis=1) +
+        rng.randn(batch_size, num_boxes, 2) * 0.5,
+        rng.uniform(-1, 1, (batch_size, num_boxes, 1)), rng.uniform(1, 5, (batch_size, num_boxes, 3)),
+        rng.uniform(-np.pi, np.pi, (batch_size, num_boxes, 1)), rng.randn(batch_size, num_boxes, 2)
+    ], axis=-1)
+    cls_scores = rng.rand(batch_size, num_boxes, num_class) ** 4  # most of the boxes below the score threshold
+    return torch.from_numpy(box_preds).float(), torch.from_numpy(cls_scores).float()
+
+
+def timeit(func, repeat, device):
+    func()  # compile / warm up
+    timings = []
+    for _ in range(repeat):
+        if device == 'cuda':
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        func()
+        if device == 'cuda':
+            torch.cuda.synchronize()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def parse_config():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='batch sizes')
+    parser.add_argument('--num_boxes', type=int, default=20000, help='predicted boxes per sample')
+    parser.add_argument('--num_class', type=int, default=10, help='number of classes')
+    parser.add_argument('--score_thresh', type=float, default=0.1, help='score threshold')
+    parser.add_argument('--nms_thresh', type=float, default=0.2, help='nms threshold')
+    parser.add_argument('--pre_maxsize', type=int, default=1000, help='NMS_PRE_MAXSIZE')
+    parser.add_argument('--post_maxsize', type=int, default=83, help='NMS_POST_MAXSIZE')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help='cpu or cuda')
+    parser.add_argument('--repeat', type=int, default=10, help='number of timed runs')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_config()
+    rng = np.random.RandomState(0)
+    nms_config = EasyDict(
+        MULTI_CLASSES_NMS=True, NMS_TYPE='nms_gpu', NMS_THRESH=args.nms_thresh,
+        NMS_PRE_MAXSIZE=args.pre_maxsize, NMS_POST_MAXSIZE=args.post_maxsize
+    )
+
+    print('%10s %14s %14s %10s %12s' % ('batch_size', 'per sample', 'batched', 'speedup', 'same boxes'))
+    for batch_size in args.batch_sizes:
+        box_preds, cls_scores = random_predictions(batch_size, args.num_boxes, args.num_class, rng)
+        box_preds, cls_scores = box_preds.to(args.device), cls_scores.to(args.device)
+
+        def per_sample():
+            return [model_nms_utils.multi_classes_nms(
+                cls_scores[k], box_preds[k], nms_config, score_thresh=args.score_thresh
+            ) for k in range(batch_size)]
+
+        def batched():
+            return model_nms_utils.batched_multi_classes_nms(
+                cls_scores, box_preds, nms_config, score_thresh=args.score_thresh
+            )
+
+        num_same = sum(
+            int(torch.equal(per_sample_boxes, batched_boxes))
+            for (_, _, per_sample_boxes), (_, _, batched_boxes) in zip(per_sample(), batched())
+        )
+        per_sample_time = timeit(per_sample, args.repeat, args.device)
+        batched_time = timeit(batched, args.repeat, args.device)
+        print('%10d %12.2fms %12.2fms %9.2fx %8d / %d' % (
+            batch_size, per_sample_time * 1000, batched_time * 1000, per_sample_time / batched_time,
+            num_same, batch_size
+        ))
+
+
+if __name__ == '__main__':
+    main()
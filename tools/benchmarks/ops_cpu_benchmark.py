@@ -0,0 +1,214 @@
+"""
+Parity and speed of the numba CPU kernels of pcdet.ops (iou3d_nms_cpu, roiaware_pool3d_cpu). The kernels are
+checked against brute-force numpy references (polygon clipping for the bev iou, greedy NMS on the reference
+iou, per-box point tests), and against the compiled iou3d_nms_cuda / roiaware_pool3d_cuda extensions when
+they are importable. Any disagreement beyond the tolerances below fails with an AssertionError.
+
+Usage: python ops_cpu_benchmark.py [--num_boxes 500] [--num_points 200000]
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from pcdet.ops.iou3d_nms import iou3d_nms_cpu, iou3d_nms_utils
+from pcdet.ops.roiaware_pool3d import roiaware_pool3d_cpu, roiaware_pool3d_utils
+
+# float32 kernels against float64 references; the compiled check_in_box2d also counts the corners within
+# 1e-2 of the other box as inside, which shifts the overlap polygon by up to that margin
+IOU_TOLERANCE = 1e-2
+# points closer than this to a face of a box may fall either way
+POINT_TOLERANCE = 1e-4
+
+def random_boxes(num_boxes, rng, extent=50.0):
+    return np.concatenate([
+        rng.uniform(-extent, extent, (num_boxes, 2)), rng.uniform(-1, 1, (num_boxes, 1)),
+        rng.uniform(1, 5, (num_boxes, 3)), rng.uniform(-np.pi, np.pi, (num_boxes, 1))
+    ], axis=1).astype(np.float32)
+
+
+def box_corners_bev(box):
+    # counter-clockwise corners of the bev rectangle
+    x, y, dx, dy, heading = box[0], box[1], box[3], box[4], box[6]
+    local_corners = np.array([[dx, dy], [-dx, dy], [-dx, -dy], [dx, -dy]]) / 2
+    cosa, sina = np.cos(heading), np.sin(heading)
+    return local_corners @ np.array([[cosa, sina], [-sina, cosa]]) + np.array([x, y])
+
+
+def clip_polygon(polygon, clip_corners):
+    # Sutherland-Hodgman, clip_corners is convex and counter-clockwise
+    for k in range(clip_corners.shape[0]):
+        a, b = clip_corners[k], clip_corners[(k + 1) % clip_corners.shape[0]]
+        if len(polygon) == 0:
+            break
+        side = [(b[0] - a[0]) * (p[1] - a[1]) - (b[1] - a[1]) * (p[0] - a[0]) for p in polygon]
+        clipped = []
+        for i in range(len(polygon)):
+            j = (i + 1) % len(polygon)
+            if side[i] >= 0:
+                clipped.append(polygon[i])
+            if (side[i] >= 0) != (side[j] >= 0):
+                t = side[i] / (side[i] - side[j])
+                clipped.append(polygon[i] + t * (polygon[j] - polygon[i]))
+        polygon = clipped
+    return polygon
+
+
+def reference_iou_bev(boxes_a, boxes_b):
+    boxes_a, boxes_b = boxes_a.astype(np.float64), boxes_b.astype(np.float64)
+    corners_b = [box_corners_bev(box) for box in boxes_b]
+    iou = np.zeros((boxes_a.shape[0], boxes_b.shape[0]))
+    for i, box_a in enumerate(boxes_a):
+        corners_a = box_corners_bev(box_a)
+        for j, box_b in enumerate(boxes_b):
+            polygon = clip_polygon(list(corners_a), corners_b[j])
+            if len(polygon) < 3:
+                continue
+            polygon = np.array(polygon)
+            overlap = 0.5 * abs(np.dot(polygon[:, 0], np.roll(polygon[:, 1], -1)) -
+                                np.dot(polygon[:, 1], np.roll(polygon[:, 0], -1)))
+            iou[i, j] = overlap / max(box_a[3] * box_a[4] + box_b[3] * box_b[4] - overlap, 1e-8)
+    return iou
+
+
+def reference_iou_normal(boxes_a, boxes_b):
+    boxes_a, boxes_b = boxes_a.astype(np.float64), boxes_b.astype(np.float64)
+    min_a, max_a = boxes_a[:, None, 0:2] - boxes_a[:, None, 3:5] / 2, boxes_a[:, None, 0:2] + boxes_a[:, None, 3:5] / 2
+    min_b, max_b = boxes_b[None, :, 0:2] - boxes_b[None, :, 3:5] / 2, boxes_b[None, :, 0:2] + boxes_b[None, :, 3:5] / 2
+    overlap = np.clip(np.minimum(max_a, max_b) - np.maximum(min_a, min_b), 0, None).prod(axis=-1)
+    area_a, area_b = boxes_a[:, None, 3] * boxes_a[:, None, 4], boxes_b[None, :, 3] * boxes_b[None, :, 4]
+    return overlap / np.maximum(area_a + area_b - overlap, 1e-8)
+
+
+def reference_nms(iou, thresh):
+    # greedy suppression in the given order
+    removed = np.zeros(iou.shape[0], dtype=bool)
+    keep = []
+    for i in range(iou.shape[0]):
+        if removed[i]:
+            continue
+        keep.append(i)
+        removed[i + 1:] |= iou[i, i + 1:] > thresh
+    return np.array(keep, dtype=np.int64)
+
+
+def reference_points_in_boxes(points, boxes, tolerance=0.0):
+    # same test as points_in_boxes_cpu (1e-2 bev margin), with every face moved out by tolerance
+    points, boxes = points.astype(np.float64), boxes.astype(np.float64)
+    margin = 1e-2
+    point_masks = np.zeros((boxes.shape[0], points.shape[0]), dtype=bool)
+    for i, box in enumerate(boxes):
+        shift_x, shift_y = points[:, 0] - box[0], points[:, 1] - box[1]
+        cosa, sina = np.cos(box[6]), np.sin(box[6])
+        local_x, local_y = shift_x * cosa + shift_y * sina, -shift_x * sina + shift_y * cosa
+        point_masks[i] = (np.abs(points[:, 2] - box[2]) <= box[5] / 2 + tolerance) & \
+            (np.abs(local_x) < box[3] / 2 + margin + tolerance) & (np.abs(local_y) < box[4] / 2 + margin + tolerance)
+    return point_masks
+
+
+def timeit(func, repeat):
+    func()  # compile / warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def parse_config():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--num_boxes', type=int, default=500, help='number of boxes for the iou and nms')
+    parser.add_argument('--num_gt', type=int, default=100, help='number of boxes for points_in_boxes')
+    parser.add_argument('--num_points', type=int, default=200000, help='number of points for points_in_boxes')
+    parser.add_argument('--nms_thresh', type=float, default=0.1, help='nms iou threshold')
+    parser.add_argument('--num_check', type=int, default=100, help='boxes compared with the polygon clipping reference')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_config()
+    rng = np.random.RandomState(0)
+    # dense enough that the boxes overlap
+    boxes_a = random_boxes(args.num_boxes, rng, extent=10.0)
+    boxes_b = random_boxes(args.num_boxes, rng, extent=10.0)
+    scores = rng.rand(args.num_boxes).astype(np.float32)
+    gt_boxes = random_boxes(args.num_gt, rng)
+    points = np.concatenate([
+        rng.uniform(-50, 50, (args.num_points, 2)), rng.uniform(-2, 2, (args.num_points, 1))
+    ], axis=1).astype(np.float32)
+
+    iou3d_nms_cuda = iou3d_nms_utils.iou3d_nms_cuda
+    roiaware_pool3d_cuda = roiaware_pool3d_utils.roiaware_pool3d_cuda
+    has_cuda_device = torch.cuda.is_available()
+
+    # boxes_iou_bev_cpu
+    iou = iou3d_nms_cpu.boxes_iou_bev_cpu(boxes_a, boxes_b)
+    t = timeit(lambda: iou3d_nms_cpu.boxes_iou_bev_cpu(boxes_a, boxes_b), args.repeat)
+    n = args.num_check
+    iou_diff = np.abs(iou[:n, :n] - reference_iou_bev(boxes_a[:n], boxes_b[:n])).max()
+    print('boxes_iou_bev_cpu numba: %.4f s, max abs diff to the reference %.2e' % (t, iou_diff))
+    assert iou_diff < IOU_TOLERANCE
+    if iou3d_nms_cuda is not None:
+        def compiled_iou():
+            ans_iou = torch.zeros((boxes_a.shape[0], boxes_b.shape[0]))
+            iou3d_nms_cuda.boxes_iou_bev_cpu(torch.from_numpy(boxes_a), torch.from_numpy(boxes_b), ans_iou)
+            return ans_iou.numpy()
+        compiled_diff = np.abs(compiled_iou() - iou).max()
+        print('boxes_iou_bev_cpu compiled: %.4f s, max abs diff %.2e' % (
+            timeit(compiled_iou, args.repeat), compiled_diff))
+        assert compiled_diff < 1e-5
+
+    # nms
+    order = np.argsort(-scores, kind='stable')
+    for rotated, name in [(True, 'nms_gpu'), (False, 'nms_normal_gpu')]:
+        keep = order[iou3d_nms_cpu.nms_cpu(boxes_a[order], args.nms_thresh, rotated=rotated)]
+        t = timeit(lambda: iou3d_nms_cpu.nms_cpu(boxes_a[order], args.nms_thresh, rotated=rotated), args.repeat)
+        # the reference on the n best boxes, whose suppression does not depend on the boxes after them
+        sorted_boxes = boxes_a[order[:n]]
+        reference_iou = reference_iou_bev(sorted_boxes, sorted_boxes) if rotated else \
+            reference_iou_normal(sorted_boxes, sorted_boxes)
+        same_keep = np.array_equal(
+            iou3d_nms_cpu.nms_cpu(sorted_boxes, args.nms_thresh, rotated=rotated),
+            reference_nms(reference_iou, args.nms_thresh)
+        )
+        print('%s numba: %.4f s, %d kept, same keep as the reference %s' % (name, t, keep.shape[0], same_keep))
+        assert same_keep
+        if iou3d_nms_cuda is not None and has_cuda_device:
+            nms_func = getattr(iou3d_nms_utils, name)
+            compiled_keep, _ = nms_func(torch.from_numpy(boxes_a).cuda(), torch.from_numpy(scores).cuda(), args.nms_thresh)
+            same_keep = np.array_equal(np.sort(compiled_keep.cpu().numpy()), np.sort(keep))
+            print('%s compiled: same keep %s' % (name, same_keep))
+            assert same_keep
+
+    # points_in_boxes_cpu, only the points within POINT_TOLERANCE of a face may disagree
+    point_indices = roiaware_pool3d_cpu.points_in_boxes_cpu(points, gt_boxes)
+    t = timeit(lambda: roiaware_pool3d_cpu.points_in_boxes_cpu(points, gt_boxes), args.repeat)
+    inside = reference_points_in_boxes(points, gt_boxes, tolerance=-POINT_TOLERANCE)
+    on_faces = reference_points_in_boxes(points, gt_boxes, tolerance=POINT_TOLERANCE) & ~inside
+    mismatches = ((point_indices > 0) != inside) & ~on_faces
+    print('points_in_boxes_cpu numba: %.4f s, mismatches to the reference %d (%d points on the faces)' % (
+        t, mismatches.sum(), on_faces.sum()))
+    assert mismatches.sum() == 0
+    if roiaware_pool3d_cuda is not None:
+        def compiled_points_in_boxes():
+            ans = torch.zeros((gt_boxes.shape[0], points.shape[0]), dtype=torch.int)
+            roiaware_pool3d_cuda.points_in_boxes_cpu(torch.from_numpy(gt_boxes), torch.from_numpy(points), ans)
+            return ans.numpy()
+        mismatches = (compiled_points_in_boxes() != point_indices) & ~on_faces
+        print('points_in_boxes_cpu compiled: %.4f s, mismatches %d' % (
+            timeit(compiled_points_in_boxes, args.repeat), mismatches.sum()))
+        assert mismatches.sum() == 0
+
+    # points_in_boxes_idx_cpu, the first box containing each point
+    box_idxs_of_pts = roiaware_pool3d_cpu.points_in_boxes_idx_cpu(points, gt_boxes)
+    t = timeit(lambda: roiaware_pool3d_cpu.points_in_boxes_idx_cpu(points, gt_boxes), args.repeat)
+    first_box = np.where(point_indices.any(axis=0), point_indices.argmax(axis=0), -1)
+    mismatches = (box_idxs_of_pts != first_box).sum()
+    print('points_in_boxes_idx_cpu numba: %.4f s, mismatches to points_in_boxes_cpu %d' % (t, mismatches))
+    assert mismatches == 0
+
+if __name__ == '__main__':
+    main()
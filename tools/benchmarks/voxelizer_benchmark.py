@@ -0,0 +1,66 @@
+"""
+Parity and speed of the numba VoxelGeneratorCPU against the spconv CPU voxel generator
+(VoxelGeneratorWrapper). Without spconv only the numba timings are reported.
+
+Usage: python voxelizer_benchmark.py [--num_points 150000] [--voxel_size 0.1 0.1 0.15]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from pcdet.datasets.processor.data_processor import VoxelGeneratorWrapper
+from pcdet.datasets.processor.voxel_generator_cpu import VoxelGeneratorCPU
+
+
+def timeit(func, repeat):
+    func()  # compile / warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def parse_config():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--num_points', type=int, default=150000, help='number of points')
+    parser.add_argument('--voxel_size', type=float, nargs=3, default=[0.1, 0.1, 0.15], help='voxel size')
+    parser.add_argument('--point_cloud_range', type=float, nargs=6, default=[-75.2, -75.2, -2, 75.2, 75.2, 4])
+    parser.add_argument('--max_points_per_voxel', type=int, default=5, help='max points per voxel')
+    parser.add_argument('--max_num_voxels', type=int, default=150000, help='max number of voxels')
+    parser.add_argument('--repeat', type=int, default=10, help='number of timed runs')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_config()
+    rng = np.random.RandomState(0)
+    pc_range = np.array(args.point_cloud_range, dtype=np.float32)
+    points = np.concatenate([
+        rng.uniform(pc_range[0:3], pc_range[3:6], (args.num_points, 3)), rng.rand(args.num_points, 1)
+    ], axis=1).astype(np.float32)
+    kwargs = dict(
+        vsize_xyz=args.voxel_size, coors_range_xyz=pc_range, num_point_features=4,
+        max_num_points_per_voxel=args.max_points_per_voxel, max_num_voxels=args.max_num_voxels
+    )
+
+    numba_generator = VoxelGeneratorCPU(**kwargs)
+    voxels, coordinates, num_points = numba_generator.generate(points)
+    print('numba: %.2f ms, %d voxels' % (timeit(lambda: numba_generator.generate(points), args.repeat) * 1000,
+                                         voxels.shape[0]))
+
+    try:
+        spconv_generator = VoxelGeneratorWrapper(**kwargs)
+    except ImportError:
+        return
+    spconv_voxels, spconv_coordinates, spconv_num_points = spconv_generator.generate(points)
+    same = np.array_equal(voxels, spconv_voxels) and np.array_equal(coordinates, spconv_coordinates) and \
+        np.array_equal(num_points, spconv_num_points)
+    print('spconv: %.2f ms, %d voxels, same outputs %s' % (
+        timeit(lambda: spconv_generator.generate(points), args.repeat) * 1000, spconv_voxels.shape[0], same))
+
+
+if __name__ == '__main__':
+    main()
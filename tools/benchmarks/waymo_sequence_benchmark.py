@@ -0,0 +1,53 @@
+"""
+Time of WaymoDataset.get_sequence_data over consecutive samples of the sequences (the order of the samples
+in a batch of the test dataloader), with the frame cache of the dataset and without it (FRAME_CACHE_SIZE 0).
+
+Usage: python waymo_sequence_benchmark.py --cfg_file cfgs/waymo_models/mppnet_4frames.yaml [--num_samples 50]
+"""
+import argparse
+import time
+
+from pcdet.config import cfg, cfg_from_yaml_file
+from pcdet.datasets.waymo.waymo_dataset import WaymoDataset
+from pcdet.utils import common_utils
+
+
+def parse_config():
+    parser = argparse.ArgumentParser(description='arg parser')
+    parser.add_argument('--cfg_file', type=str, required=True, help='config with DATA_CONFIG.SEQUENCE_CONFIG')
+    parser.add_argument('--num_samples', type=int, default=50, help='number of consecutive samples')
+    parser.add_argument('--training', action='store_true', default=False, help='use the training split')
+    return parser.parse_args()
+
+
+def run(dataset, num_samples):
+    sequence_cfg = dataset.dataset_cfg.SEQUENCE_CONFIG
+    dataset.frame_cache.clear()
+    start = time.perf_counter()
+    for index in range(num_samples):
+        info = dataset.infos[index]
+        sequence_name, sample_idx = info['point_cloud']['lidar_sequence'], info['point_cloud']['sample_idx']
+        points = dataset.get_cached_lidar(sequence_name, sample_idx)
+        dataset.get_sequence_data(info, points, sequence_name, sample_idx, sequence_cfg)
+    return (time.perf_counter() - start) / num_samples
+
+
+def main():
+    args = parse_config()
+    cfg_from_yaml_file(args.cfg_file, cfg)
+    assert cfg.DATA_CONFIG.get('SEQUENCE_CONFIG', None) is not None and cfg.DATA_CONFIG.SEQUENCE_CONFIG.ENABLED
+    dataset = WaymoDataset(
+        dataset_cfg=cfg.DATA_CONFIG, class_names=cfg.CLASS_NAMES, training=args.training,
+        logger=common_utils.create_logger()
+    )
+    num_samples = min(args.num_samples, len(dataset.infos))
+
+    frame_cache_size = dataset.frame_cache_size
+    print('SAMPLE_OFFSET %s, %d samples' % (cfg.DATA_CONFIG.SEQUENCE_CONFIG.SAMPLE_OFFSET, num_samples))
+    print('frame cache of %d frames: %.1f ms/sample' % (frame_cache_size, run(dataset, num_samples) * 1000))
+    dataset.frame_cache_size = 0
+    print('without frame cache: %.1f ms/sample' % (run(dataset, num_samples) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -37,6 +37,14 @@ def eval_one_epoch(cfg, args, model, dataloader, epoch_id, logger, dist_test=Fal
     class_names = dataset.class_names
     det_annos = []
 
+    # Predictions are evaluated batch by batch instead of being kept for dataset.evaluation
+    stream_evaluator = None
+    if getattr(args, 'stream_eval', False) and hasattr(dataset, 'create_streaming_evaluator'):
+        stream_evaluator = dataset.create_streaming_evaluator(
+            class_names, eval_metric=cfg.MODEL.POST_PROCESSING.EVAL_METRIC
+        )
+    num_pred_frames = total_pred_objects = 0
+
     if getattr(args, 'infer_time', False):
         start_iter = int(len(dataloader) * 0.1)
         infer_time_meter = common_utils.AverageMeter()
@@ -77,7 +85,17 @@ def eval_one_epoch(cfg, args, model, dataloader, epoch_id, logger, dist_test=Fal
             batch_dict, pred_dicts, class_names,
             output_path=final_output_dir if args.save_to_file else None
         )
-        det_annos += annos
+        num_pred_frames += len(annos)
+        total_pred_objects += sum([len(anno['name']) for anno in annos])
+        if stream_evaluator is not None:
+            stream_evaluator.update(annos)
+            if cfg.LOCAL_RANK == 0 and (i + 1) % getattr(args, 'stream_eval_interval', 50) == 0:
+                _, partial_dict = stream_evaluator.get_result()
+                disp_dict['mAP_3d'] = '%.2f' % np.mean(
+                    [val for key, val in partial_dict.items() if key.endswith('_3d/moderate_R40')]
+                )
+        else:
+            det_annos += annos
         if cfg.LOCAL_RANK == 0:
             progress_bar.set_postfix(disp_dict)
             progress_bar.update()
@@ -85,9 +103,14 @@ def eval_one_epoch(cfg, args, model, dataloader, epoch_id, logger, dist_test=Fal
     if cfg.LOCAL_RANK == 0:
         progress_bar.close()
 
+    metric['num_pred_frames'] = num_pred_frames
+    metric['total_pred_objects'] = total_pred_objects
     if dist_test:
         rank, world_size = common_utils.get_dist_info()
-        det_annos = common_utils.merge_results_dist(det_annos, len(dataset), tmpdir=result_dir / 'tmpdir')
+        if stream_evaluator is not None:
+            stream_evaluator = common_utils.merge_results_dist([stream_evaluator], world_size, tmpdir=result_dir / 'tmpdir')
+        else:
+            det_annos = common_utils.merge_results_dist(det_annos, len(dataset), tmpdir=result_dir / 'tmpdir')
         metric = common_utils.merge_results_dist([metric], world_size, tmpdir=result_dir / 'tmpdir')
 
     logger.info('*************** Performance of EPOCH %s *****************' % epoch_id)
@@ -103,6 +126,10 @@ def eval_one_epoch(cfg, args, model, dataloader, epoch_id, logger, dist_test=Fal
             for k in range(1, world_size):
                 metric[0][key] += metric[k][key]
         metric = metric[0]
+        if stream_evaluator is not None:
+            for k in range(1, world_size):
+                stream_evaluator[0].merge(stream_evaluator[k])
+            stream_evaluator = stream_evaluator[0]
 
     gt_num_cnt = metric['gt_num']
     for cur_thresh in cfg.MODEL.POST_PROCESSING.RECALL_THRESH_LIST:
@@ -113,20 +140,21 @@ def eval_one_epoch(cfg, args, model, dataloader, epoch_id, logger, dist_test=Fal
         ret_dict['recall/roi_%s' % str(cur_thresh)] = cur_roi_recall
         ret_dict['recall/rcnn_%s' % str(cur_thresh)] = cur_rcnn_recall
 
-    total_pred_objects = 0
-    for anno in det_annos:
-        total_pred_objects += anno['name'].__len__()
+    num_pred_frames = metric['num_pred_frames']
     logger.info('Average predicted number of objects(%d samples): %.3f'
-                % (len(det_annos), total_pred_objects / max(1, len(det_annos))))
-
-    with open(result_dir / 'result.pkl', 'wb') as f:
-        pickle.dump(det_annos, f)
-
-    result_str, result_dict = dataset.evaluation(
-        det_annos, class_names,
-        eval_metric=cfg.MODEL.POST_PROCESSING.EVAL_METRIC,
-        output_path=final_output_dir
-    )
+                % (num_pred_frames, metric['total_pred_objects'] / max(1, num_pred_frames)))
+
+    if stream_evaluator is not None:
+        result_str, result_dict = stream_evaluator.get_result()
+    else:
+        with open(result_dir / 'result.pkl', 'wb') as f:
+            pickle.dump(det_annos, f)
+
+        result_str, result_dict = dataset.evaluation(
+            det_annos, class_names,
+            eval_metric=cfg.MODEL.POST_PROCESSING.EVAL_METRIC,
+            output_path=final_output_dir
+        )
 
     logger.info(result_str)
     ret_dict.update(result_dict)
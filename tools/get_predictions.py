@@ -4,10 +4,14 @@
 # Purpose: This is a modification of demo.py file with updates to save the bounding box predictions 
 #          for each scene along with its labels to a .csv file
 #
-# Usage: python get_predictions.py --cfg_file <path_to_model_cfg_file> --ckpt <path_to_model_ckpt_file> --data_path <path_to_input_file/directory> --output <output_file_name> --ext .npy
+# Usage: python get_predictions.py --cfg_file <path_to_model_cfg_file> --ckpt <path_to_model_ckpt_file> --data_path <path_to_input_file/directory> --output <output_file_name> --ext .npy [--batch_size <frames_per_forward>] [--workers <num_workers>] [--resume]
 
 # Update tracker:
 # 7/18/24: Melanie Gomez: Updated the script to include prediction scores in the csv file.
+# Frames are now loaded and voxelized by DataLoader workers (--workers) and run through the model --batch_size at a time.
+# Without a CUDA device the model runs on the CPU.
+# Predictions are written through pred_utils.PredictionWriter every --flush_rows rows (an --output ending in .parquet writes
+# a Parquet dataset) and --resume skips the frames a previous run already saved.
 
 import argparse
 import glob
@@ -23,13 +27,14 @@ except:
     OPEN3D_FLAG = False
 
 import numpy as np
-import pandas as pd
 import torch
+from torch.utils.data import DataLoader
 
 from pcdet.config import cfg, cfg_from_yaml_file
 from pcdet.datasets import DatasetTemplate
-from pcdet.models import build_network, load_data_to_gpu
+from pcdet.models import build_network, load_data_to_device
 from pcdet.utils import common_utils
+from pred_utils.prediction_writer import PredictionWriter
 
 
 class DemoDataset(DatasetTemplate):
@@ -82,6 +87,10 @@ def parse_config():
                         help='specify the output file name')
     parser.add_argument('--ckpt', type=str, default=None, help='specify the pretrained model')
     parser.add_argument('--ext', type=str, default='.bin', help='specify the extension of your point cloud data file')
+    parser.add_argument('--batch_size', type=int, default=1, help='number of frames per model forward')
+    parser.add_argument('--workers', type=int, default=4, help='number of workers for loading and voxelizing frames')
+    parser.add_argument('--flush_rows', type=int, default=100000, help='number of predictions buffered before each write')
+    parser.add_argument('--resume', action='store_true', default=False, help='skip the frames already saved in the output')
 
     args = parser.parse_args()
 
@@ -98,38 +107,42 @@ def main():
         dataset_cfg=cfg.DATA_CONFIG, class_names=cfg.CLASS_NAMES, training=False,
         root_path=Path(args.data_path), ext=args.ext, logger=logger
     )
+    writer = PredictionWriter(args.output, flush_rows=args.flush_rows, resume=args.resume)
+    if len(writer.completed) > 0:
+        demo_dataset.sample_file_list = [f for f in demo_dataset.sample_file_list if str(f) not in writer.completed]
+        logger.info(f'Resuming, frames already saved: \t{len(writer.completed)}')
     logger.info(f'Total number of samples: \t{len(demo_dataset)}')
 
     model = build_network(model_cfg=cfg.MODEL, num_class=len(cfg.CLASS_NAMES), dataset=demo_dataset)
     model.load_params_from_file(filename=args.ckpt, logger=logger, to_cpu=True)
-    model.cuda()
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    logger.info(f'Running inference on: \t{device}')
+    model.to(device)
     model.eval()
+
+    # frames are read, augmented and voxelized in the worker processes while the model runs
+    dataloader = DataLoader(
+        demo_dataset, batch_size=args.batch_size, num_workers=args.workers, shuffle=False,
+        collate_fn=demo_dataset.collate_batch, pin_memory=device.type == 'cuda', drop_last=False
+    )
     
-    #create a dataframe to include results
-    results = pd.DataFrame()
-    
-    with torch.no_grad():
-        for idx, data_dict in enumerate(demo_dataset):
-            logger.info(f'Visualized sample index: \t{idx + 1}')
-            data_dict = demo_dataset.collate_batch([data_dict])
-            load_data_to_gpu(data_dict)
+    with torch.no_grad(), writer:
+        for data_dict in dataloader:
+            logger.info(f'Visualized sample index: \t{data_dict["frame_id"][-1] + 1}')
+            load_data_to_device(data_dict, device)
             pred_dicts, _ = model.forward(data_dict)
-            
-            #create dataframe of with columns for name of file, bounding box details and labels
-            df_boxes = pd.DataFrame(pred_dicts[0]['pred_boxes'].cpu().numpy(), columns = ['x', 'y', 'z', 'l', 'w', 'h', 'r'])
-            df_labels = pd.DataFrame(pred_dicts[0]['pred_labels'].cpu().numpy(), columns = ['label'])
-            df_scores = pd.DataFrame(pred_dicts[0]['pred_scores'].cpu().numpy(), columns = ['scores'])
-            df_file = pd.DataFrame({'filename':[demo_dataset.sample_file_list[idx]]*len(pred_dicts[0]['pred_labels'])})
-            df_pred = pd.concat([df_file, df_labels, df_scores, df_boxes], axis=1)
-            
-            #append dataframe to results
-            results = pd.concat([results, df_pred], ignore_index=True)
+
+            for frame_id, pred_dict in zip(data_dict['frame_id'], pred_dicts):
+                #save the name of file, bounding box details, scores and labels
+                writer.append(
+                    demo_dataset.sample_file_list[frame_id], pred_dict['pred_labels'].cpu().numpy(),
+                    pred_dict['pred_scores'].cpu().numpy(), pred_dict['pred_boxes'][:, :7].cpu().numpy()
+                )
 
             if not OPEN3D_FLAG:
                 mlab.show(stop=True)
 
-    logger.info('Demo done.')
-    results.to_csv(args.output, index=False)
+    logger.info(f'Demo done, predictions saved: \t{writer.num_written}')
 
 
 if __name__ == '__main__':
@@ -25,8 +25,16 @@
 #             Also added optional flags to set the IoU and skip box values.
 #
 #
+#    Each input file is now grouped by filename once instead of being filtered for every scene, scenes can be fused
+#    in a process pool (--workers) and the fused rows are appended to the output file every --chunk_size rows
+#    instead of being accumulated in one data frame.
 #
-# Usage: python lidar_model_fusion.py --input_files <input_file_1> <input_file_2> ... --output_file <output_file_name> [--iou_thr <iou_threshold>] [--skip_box_thr <skip_box_threshold>]
+#    The output is written through pred_utils.PredictionWriter: an output name ending in .parquet produces a Parquet
+#    dataset instead of a .csv file, and --resume continues a run that died without redoing the scenes already written.
+#    Input files can be .csv files or Parquet datasets written by get_predictions.py.
+#
+#
+# Usage: python lidar_model_fusion.py --input_files <input_file_1> <input_file_2> ... --output_file <output_file_name> [--iou_thr <iou_threshold>] [--skip_box_thr <skip_box_threshold>] [--workers <num_workers>] [--chunk_size <rows_per_write>] [--resume]
 
 
 import pandas as pd
@@ -34,71 +42,98 @@ import numpy as np
 from ensemble_boxes import *
 import argparse
 import math
+import multiprocessing
+from pathlib import Path
+
+from pred_utils.prediction_writer import BOX_COLUMNS, PredictionWriter
 
 # coding: utf-8
 
-def fuse_models(input_files, output, iou_thr=0.55, skip_box_thr=.75):
+
+def group_by_filename(input_file):
+    """
+    NOTES: Reads one csv file of predictions and groups it by filename in a single hashed pass. Returns a
+    dictionary mapping each filename to its (boxes, scores, labels) arrays so that looking up a scene no
+    longer scans the whole data frame.
+    """
+
+    columns = ['filename', 'label', 'scores'] + BOX_COLUMNS
+    if Path(input_file).suffix == '.parquet':
+        model = pd.read_parquet(input_file, columns=columns)
+        model['filename'] = model['filename'].astype(str)
+    else:
+        model = pd.read_csv(input_file, usecols=columns)
+    groups = dict()
+    for filename, rows in model.groupby('filename', sort=False):
+        groups[filename] = (rows[BOX_COLUMNS].to_numpy(), rows['scores'].to_numpy(), rows['label'].to_numpy())
+    return groups
+
+
+def fuse_scene(task):
+    """
+    NOTES: Fuses the predictions of every model for one scene. 'task' is a tuple of
+    (filename, boxes_list, scores_list, labels_list, iou_thr, skip_box_thr) so that it can be sent to a
+    process pool as is. Returns the filename with the fused boxes, scores and labels.
+    """
+
+    filename, boxes_list, scores_list, labels_list, iou_thr, skip_box_thr = task
+
+    # Call to the modified WBF function that will handle the merging operations
+    boxes, scores, labels = weighted_boxes_fusion_3d(boxes_list, scores_list, labels_list, weights=None, iou_thr=iou_thr, skip_box_thr=skip_box_thr, conf_type='max')
+    return filename, boxes, scores, labels
+
+
+def fuse_models(input_files, output, iou_thr=0.55, skip_box_thr=.75, workers=1, chunk_size=10000, resume=False):
     """
     NOTES: This function takes in multiple csv files as input, a name for an output file, the IoU threshold
     to determine if two 3D labels are representing the same object, and a threshold for box
-    skipping that sets a minimum confidence score for the label to be included. It will print
-    the final list of labels in the terminal and save the results to a .csv file.
+    skipping that sets a minimum confidence score for the label to be included. Scenes are fused in
+    'workers' processes and the results are written to the output file in chunks of at least
+    'chunk_size' rows, in sorted filename order. Scenes with no fused box keep a row holding only
+    the filename. With 'resume', scenes already present in the output file are not fused again.
     """
-    
-    # Read all input CSV files
-    models = [pd.read_csv(file) for file in input_files]
-    
-    filename_ext = []
-    boxes_ext = []
-    scores_ext = []
-    labels_ext = []
-    result_df = pd.DataFrame()
-    
+
+    writer = PredictionWriter(output, flush_rows=chunk_size, resume=resume, keep_empty=True, float_dtype=np.float64)
+
+    # Read and index all input CSV files
+    models = [group_by_filename(file) for file in input_files]
+
     # Get unique filenames from all input files
     unique_values = set()
     for model in models:
-        unique_values.update(model['filename'].unique())
-    unique_values = sorted(unique_values)
-    
-    # For each file (scene) in the set of LiDAR scenes, the best predictions are combined and saved
-    for value in unique_values:
-        boxes_list = []
-        scores_list = []
-        labels_list = []
-        
-        for model in models:
-            matching_rows = model[model['filename'] == value]
-            
-            cords = matching_rows[['x', 'y', 'z', 'l', 'w', 'h', 'r']].values.tolist()
-            scores = matching_rows['scores'].values.tolist()
-            labels = matching_rows['label'].values.tolist()
-            
-            if cords:  # Only add non-empty lists
-                boxes_list.append(cords)
-                scores_list.append(scores)
-                labels_list.append(labels)
-        
-        if not boxes_list:  # Skip if no boxes for this filename
-            continue
-        
-        # Call to the modified WBF function that will handle the merging operations
-        boxes, scores, labels = weighted_boxes_fusion_3d(boxes_list, scores_list, labels_list, weights=None, iou_thr=iou_thr, skip_box_thr=skip_box_thr, conf_type='max')
-        
-        # Combines and concatenates data into one cohesive data frame
-        df_boxes = pd.DataFrame(np.asarray(boxes), columns=['x', 'y', 'z', 'l', 'w', 'h', 'r'])
-        df_labels = pd.DataFrame(np.asarray(labels), columns=['label'])
-        df_scores = pd.DataFrame(np.asarray(scores), columns=['scores'])
-        if len(boxes) == 0:
-            df_file = pd.DataFrame(np.asarray([value] * 1), columns=['filename'])
-        else:
-            df_file = pd.DataFrame(np.asarray([value] * len(boxes)), columns=['filename'])
-        combined_df = pd.concat([df_file, df_labels, df_scores, df_boxes], axis=1)
-        result_df = pd.concat([result_df, combined_df], axis=0)
-    
-    print(result_df)
-    
-    # Stores the data frame to a .csv file
-    result_df.to_csv(output, index=False)
+        unique_values.update(model.keys())
+    unique_values = sorted(unique_values - writer.completed)
+
+    def scene_tasks():
+        # For each file (scene) in the set of LiDAR scenes, the predictions of every model are collected
+        for value in unique_values:
+            boxes_list = []
+            scores_list = []
+            labels_list = []
+
+            for model in models:
+                if value in model:  # Only add non-empty lists
+                    cords, scores, labels = model[value]
+                    boxes_list.append(cords)
+                    scores_list.append(scores)
+                    labels_list.append(labels)
+
+            yield value, boxes_list, scores_list, labels_list, iou_thr, skip_box_thr
+
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    fused_scenes = pool.imap(fuse_scene, scene_tasks(), chunksize=16) if pool is not None else map(fuse_scene, scene_tasks())
+
+    # The best predictions of each scene are buffered by the writer and saved one chunk at a time
+    try:
+        with writer:
+            for filename, boxes, scores, labels in fused_scenes:
+                writer.append(filename, labels, scores, boxes)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    print('Fused {} scenes into {} rows, saved to {}'.format(len(unique_values), writer.num_written, output))
 
 if __name__ == '__main__':
     # Initialize the argument parser
@@ -107,8 +142,12 @@ if __name__ == '__main__':
     parser.add_argument('--output_file', type=str, required=True, help='Specify the output file name')
     parser.add_argument('--iou_thr', type=float, default=0.7, help='IoU threshold (default: 0.7)')
     parser.add_argument('--skip_box_thr', type=float, default=0.85, help='Skip box threshold (default: 0.85)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes used to fuse scenes (default: 1)')
+    parser.add_argument('--chunk_size', type=int, default=10000, help='Number of rows buffered before each write to the output file (default: 10000)')
+    parser.add_argument('--resume', action='store_true', default=False, help='Continue a partially written output file')
     args = parser.parse_args()
     
     # Call to the fuse_models function
-    fuse_models(args.input_files, args.output_file, iou_thr=args.iou_thr, skip_box_thr=args.skip_box_thr)
+    fuse_models(args.input_files, args.output_file, iou_thr=args.iou_thr, skip_box_thr=args.skip_box_thr,
+                workers=args.workers, chunk_size=args.chunk_size, resume=args.resume)
 
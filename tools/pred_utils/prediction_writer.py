@@ -0,0 +1,192 @@
+# Title: Prediction Writer
+# Purpose: Shared sink for the per-frame box predictions written by get_predictions.py and lidar_model_fusion.py.
+#          Rows are appended into preallocated NumPy column buffers and flushed every `flush_rows` rows, either
+#          as row groups of a Parquet dataset (one part file per flush, filename stored as a dictionary column)
+#          or as chunks appended to a .csv file. A run that dies can be resumed: frames already on disk are
+#          reported in `completed` and are skipped by the callers.
+#
+# Output columns: filename, label, scores, x, y, z, l, w, h, r
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+BOX_COLUMNS = ['x', 'y', 'z', 'l', 'w', 'h', 'r']
+OUTPUT_COLUMNS = ['filename', 'label', 'scores'] + BOX_COLUMNS
+
+
+class PredictionWriter(object):
+    def __init__(self, output, file_format=None, flush_rows=100000, resume=False, keep_empty=False,
+                 float_dtype=np.float32):
+        """
+        Args:
+            output: .csv file, or directory of part files for the 'parquet' format
+            file_format: 'csv' or 'parquet', inferred from the extension of `output` when None
+            flush_rows: number of buffered rows that triggers a write
+            resume: keep what a previous run already wrote to `output` and report those frames in `completed`
+            keep_empty: write a row holding only the filename for frames without any box
+            float_dtype: dtype of the scores and box columns
+        """
+        self.output = Path(output)
+        if file_format is None:
+            file_format = 'parquet' if self.output.suffix == '.parquet' else 'csv'
+        assert file_format in ['csv', 'parquet'], file_format
+        if file_format == 'parquet' and pa is None:
+            raise ImportError('pyarrow is required to write predictions in the parquet format')
+
+        self.file_format = file_format
+        self.flush_rows = flush_rows
+        self.keep_empty = keep_empty
+        self.float_dtype = float_dtype
+
+        self.filename_to_code = {}
+        self.filenames = []
+        self._allocate(flush_rows)
+        self.num_rows = 0
+        self.num_written = 0
+        self.num_parts = 0
+
+        self.completed = self._open(resume)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.codes = np.zeros(capacity, dtype=np.int32)
+        self.labels = np.zeros(capacity, dtype=np.int64)
+        self.scores = np.zeros(capacity, dtype=self.float_dtype)
+        self.boxes = np.zeros((capacity, len(BOX_COLUMNS)), dtype=self.float_dtype)
+        self.valid = np.zeros(capacity, dtype=bool)
+
+    @property
+    def progress_file(self):
+        return self.output.with_name(self.output.name + '.progress')
+
+    def _open(self, resume):
+        if self.file_format == 'parquet':
+            if self.output.exists() and not resume:
+                for part in self.output.glob('part-*.parquet'):
+                    part.unlink()
+            self.output.mkdir(parents=True, exist_ok=True)
+            parts = sorted(self.output.glob('part-*.parquet'))
+            self.num_parts = len(parts)
+            completed = set()
+            for part in parts:
+                completed.update(pq.read_table(part, columns=['filename']).column('filename').to_pylist())
+            return completed
+
+        if resume and self.output.exists():
+            # Everything after the last recorded flush may be a partially written chunk
+            if self.progress_file.exists():
+                with open(self.progress_file, 'r') as f:
+                    size = json.load(f)['bytes']
+                with open(self.output, 'r+b') as f:
+                    f.truncate(size)
+            existing = pd.read_csv(self.output, usecols=['filename'])
+            return set(existing['filename'].astype(str))
+
+        pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(self.output, index=False)
+        self._save_progress()
+        return set()
+
+    def _save_progress(self):
+        tmp_file = self.progress_file.with_name(self.progress_file.name + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump({'bytes': os.path.getsize(self.output)}, f)
+        os.replace(tmp_file, self.progress_file)
+
+    def append(self, filename, labels, scores, boxes):
+        """
+        Buffers the predictions of one frame. Frames are never split across two flushes.
+
+        Args:
+            filename: name of the frame the boxes belong to
+            labels: (N,) class labels
+            scores: (N,) confidence scores
+            boxes: (N, 7) [x, y, z, l, w, h, r]
+        """
+        filename = str(filename)
+        num_boxes = len(labels)
+        num_new = max(num_boxes, 1) if self.keep_empty else num_boxes
+        if num_new == 0:
+            return
+
+        if self.num_rows + num_new > self.capacity:
+            self.flush()
+            if num_new > self.capacity:
+                self._allocate(num_new)
+
+        code = self.filename_to_code.get(filename)
+        if code is None:
+            code = self.filename_to_code[filename] = len(self.filenames)
+            self.filenames.append(filename)
+
+        sl = slice(self.num_rows, self.num_rows + num_new)
+        self.codes[sl] = code
+        self.valid[sl] = num_boxes > 0
+        if num_boxes > 0:
+            self.labels[sl] = labels
+            self.scores[sl] = scores
+            self.boxes[sl] = np.asarray(boxes).reshape(num_boxes, len(BOX_COLUMNS))
+        self.num_rows += num_new
+
+        if self.num_rows >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if self.num_rows == 0:
+            return
+
+        n = self.num_rows
+        valid = self.valid[:n]
+        used_codes, local_codes = np.unique(self.codes[:n], return_inverse=True)
+        local_names = [self.filenames[code] for code in used_codes]
+
+        if self.file_format == 'parquet':
+            arrays = [
+                pa.DictionaryArray.from_arrays(pa.array(local_codes.astype(np.int32)), pa.array(local_names)),
+                pa.array(self.labels[:n], mask=~valid),
+                pa.array(self.scores[:n], mask=~valid),
+            ] + [pa.array(self.boxes[:n, k], mask=~valid) for k in range(len(BOX_COLUMNS))]
+            table = pa.Table.from_arrays(arrays, names=OUTPUT_COLUMNS)
+            part_file = self.output / ('part-%05d.parquet' % self.num_parts)
+            tmp_file = part_file.with_name(part_file.name + '.tmp')
+            pq.write_table(table, tmp_file)
+            os.replace(tmp_file, part_file)
+            self.num_parts += 1
+        else:
+            chunk = pd.DataFrame({
+                'filename': np.asarray(local_names, dtype=object)[local_codes],
+                'label': pd.arrays.IntegerArray(self.labels[:n].copy(), ~valid),
+                'scores': np.where(valid, self.scores[:n], np.nan).astype(self.float_dtype),
+            })
+            for k, name in enumerate(BOX_COLUMNS):
+                chunk[name] = np.where(valid, self.boxes[:n, k], np.nan).astype(self.float_dtype)
+            chunk.to_csv(self.output, mode='a', header=False, index=False)
+            self._save_progress()
+
+        self.num_written += n
+        self.num_rows = 0
+        # Names of frames that have been written are no longer needed in the buffer dictionary
+        self.filename_to_code = {}
+        self.filenames = []
+
+    def close(self):
+        self.flush()
+        if self.file_format == 'csv' and self.progress_file.exists():
+            self.progress_file.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # On failure the buffered rows are dropped so that a resumed run redoes those frames
+        if exc_type is None:
+            self.close()
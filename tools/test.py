@@ -40,6 +40,9 @@ def parse_config():
     parser.add_argument('--ckpt_dir', type=str, default=None, help='specify a ckpt directory to be evaluated if needed')
     parser.add_argument('--save_to_file', action='store_true', default=False, help='')
     parser.add_argument('--infer_time', action='store_true', default=False, help='calculate inference latency')
+    parser.add_argument('--stream_eval', action='store_true', default=False,
+                        help='evaluate the predictions batch by batch instead of keeping them in result.pkl')
+    parser.add_argument('--stream_eval_interval', type=int, default=50, help='iterations between partial mAP updates')
 
     args = parser.parse_args()
 
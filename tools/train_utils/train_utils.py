@@ -193,6 +193,8 @@ def train_model(model, optimizer, train_loader, model_func, lr_scheduler, optim_
                 show_gpu_stat=show_gpu_stat,
                 use_amp=use_amp
             )
+            if rank == 0 and tb_log is not None and hasattr(train_loader.dataset, 'num_resampled_frames'):
+                tb_log.add_scalar('meta_data/num_resampled_frames', train_loader.dataset.num_resampled_frames, accumulated_iter)
 
             # save trained model
             trained_epoch = cur_epoch + 1